@@ -9,6 +9,7 @@ from geopy.geocoders import get_geocoder_for_service
 from geopy.extra.rate_limiter import RateLimiter
 import logging
 from oikoumene.gazetteer import Gazetteer
+from oikoumene.minhash import MinHashLSH, shingles
 from oikoumene.normalization import norm
 from slugify import slugify
 from time import sleep
@@ -27,8 +28,14 @@ class BaseAligner:
     def align_object(self, obj):
         return None
 
-    def _get_unique_strings(self, obj):
+    def _get_unique_strings(self, obj, field: str=None):
         unique_strings = set()
+        if field is not None:
+            # only the strings that the gazetteer indexes under this field
+            for fieldname, value in self.gaz._indexable_strings(obj):
+                if fieldname == field:
+                    unique_strings.add(norm(value))
+            return list(unique_strings)
         for fieldname, values in self.gaz._get_indexable_fields(obj).items():
             if isinstance(values, str):
                 unique_strings.add(norm(values))
@@ -40,6 +47,35 @@ class SelfAligner(BaseAligner):
 
     def __init__(self, **kwargs):
         BaseAligner.__init__(self, **kwargs)
+        self._text_matches = {}
+        self._lsh = None
+
+    def align_objects(self, objs: list):
+        """Align each of several objects, looking up all their strings in one batch."""
+        try:
+            options = self.criteria['text']
+        except KeyError:
+            pass
+        else:
+            try:
+                field = options['field']
+            except KeyError:
+                field = None
+            strings = set()
+            for obj in objs:
+                strings.update(self._get_unique_strings(obj, field))
+            strings = list(strings)
+            try:
+                fuzzy = options['fuzzy']
+            except KeyError:
+                fuzzy = False
+            index = self._get_index(field)
+            matches = index.get_batch(strings, indexes=self._get_text_indexes(index, **options), fuzzy=fuzzy)
+            self._text_matches = dict(zip(strings, matches))
+        try:
+            return [self.align_object(obj) for obj in objs]
+        finally:
+            self._text_matches = {}
 
     def align_object(self, obj):
         matches = {}
@@ -60,15 +96,61 @@ class SelfAligner(BaseAligner):
                 raise NotImplementedError(f'Unsupported operator "{self.operator}" for {type(self).__name__}')
         return list(results)
 
+    def _align_minhash(self, obj, **options):
+        lsh = self._get_lsh(**options)
+        return lsh.query(obj.id)
+
+    def _get_lsh(self, threshold: float=0.5, num_perm: int=64, bands: int=None, shingle_size: int=3):
+        if self._lsh is None:
+            self._lsh = MinHashLSH(threshold=threshold, num_perm=num_perm, bands=bands)
+            for id, obj in self.gaz.contents.items():
+                self._lsh.add(id, shingles(self._get_unique_strings(obj), shingle_size))
+        return self._lsh
+
+    def candidate_pairs(self):
+        """List pairs of ids whose estimated similarity meets the "minhash" criterion threshold."""
+        try:
+            options = self.criteria['minhash']
+        except KeyError:
+            raise ValueError(f'{type(self).__name__} has no "minhash" criterion')
+        return list(self._get_lsh(**options).candidate_pairs())
+
     def _align_text(self, obj, **options):
-        unique_strings = self._get_unique_strings(obj)
+        try:
+            field = options['field']
+        except KeyError:
+            field = None
+        unique_strings = self._get_unique_strings(obj, field)
         try:
             fuzzy = options['fuzzy']
         except KeyError:
             fuzzy = False
-        results = self.gaz._indexes['_all_text'].get(unique_strings, indexes=['value'], operator='or', fuzzy=fuzzy)
+        if self._text_matches:
+            results = set()
+            for us in unique_strings:
+                results.update(self._text_matches[us])
+        else:
+            index = self._get_index(field)
+            results = index.get(unique_strings, indexes=self._get_text_indexes(index, **options), operator='or', fuzzy=fuzzy)
         return [r for r in results if r != obj.id]
 
+    def _get_text_indexes(self, index, phonetic: bool=False, **options):
+        # whole values, or the sound-alike codes of their words (fuzzy then checks edit distance)
+        if not phonetic:
+            return ['value']
+        if 'phonetic' not in index.indexes:
+            raise ValueError('Gazetteer index has no phonetic codes (index option "phonetic")')
+        return ['phonetic']
+
+    def _get_index(self, field: str=None):
+        # the whole-text index, or the gazetteer's index of one field
+        if field is None:
+            return self.gaz._indexes['_all_text']
+        try:
+            return self.gaz._indexes[field]
+        except KeyError:
+            raise ValueError(f'Gazetteer has no index for field "{field}"')
+
 class ExternalAligner(BaseAligner):
 
     def __init__(self, geocoder='Nominatim', **kwargs):
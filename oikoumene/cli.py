@@ -18,6 +18,7 @@ class CLI:
 
     def __init__(self):
         self.manager = Manager()
+        self._completions = []
 
     def interact(self):
         while True:
@@ -30,6 +31,20 @@ class CLI:
             else:
                 print(result)
 
+    def complete(self, text: str, state: int, line: str=''):
+        """Complete verbs, and the arguments of "find" from the gazetteer index (readline completer)."""
+        if state == 0:
+            parts = line.split()
+            if parts and parts[0].lower() == 'find' and (len(parts) > 1 or line.endswith(' ')):
+                self._completions = self.manager.complete(text)
+            else:
+                verbs = [k[3:] for k in dir(self) if k.startswith('_v_')]
+                self._completions = sorted([v for v in verbs if v.startswith(text.lower())])
+        try:
+            return self._completions[state]
+        except IndexError:
+            return None
+
     def _parse(self, parts: list=[], verb: str='', object: str='', options: list=[]):
         if verb and not object and len(parts) == 0:
             try:
@@ -80,12 +95,22 @@ class CLI:
         msg = f'{v}: {doc}' + usage
         return msg.strip()
 
+    def _usage_align(self):
+        return [
+            'align self',
+            'align self fuzzy',
+            'align self phonetic fuzzy?',
+            'align self minhash {similarity threshold}?',
+            'align {geocoder name} {postfix}*'
+        ]
+
     def _usage_examine(self):
         return ['examine {context number}']
 
     def _usage_find(self):
         return [
-            'find {search string}+'
+            'find {search string}+',
+            'find top:{number of results} {search string}+'
         ]
 
     def _usage_load(self):
@@ -244,6 +269,10 @@ class CLI:
             format = object.split('.')[-1]
         return self.manager.save(object, format)
 
+    def _v_stats(self):
+        """Report index sizes: keys, postings, largest posting lists and approximate bytes."""
+        return self.manager.stats()
+
     def _v_q(self):
         """See "quit"."""
         self._v_quit()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fuzzy matching engines
+"""
+
+from collections import Counter
+import logging
+from math import log, sqrt
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def levenshtein(a: str, b: str):
+    """Count the insertions, deletions and substitutions needed to turn a into b."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """
+    Find keys within a maximum edit distance of a query using a Burkhard-Keller tree.
+
+    Each node keeps its children by their edit distance from it, so the triangle
+    inequality lets a search skip every subtree whose distance band cannot hold a match.
+    Discarded keys stay in the tree but are no longer reported; the tree is rebuilt once
+    they outnumber the live keys.
+    """
+
+    def __init__(self, keys=()):
+        self._root = None
+        self._live = set()
+        self._dead = set()
+        for key in keys:
+            self.add(key)
+
+    def add(self, key: str):
+        if key in self._live:
+            return
+        self._live.add(key)
+        if key in self._dead:
+            self._dead.discard(key)
+            return
+        if self._root is None:
+            self._root = (key, {})
+            return
+        node = self._root
+        while True:
+            d = levenshtein(key, node[0])
+            try:
+                node = node[1][d]
+            except KeyError:
+                node[1][d] = (key, {})
+                return
+
+    def discard(self, key: str):
+        if key not in self._live:
+            return
+        self._live.discard(key)
+        self._dead.add(key)
+        if len(self._dead) > len(self._live):
+            keys = list(self._live)
+            self.__init__(keys)
+
+    def search(self, query: str, max_distance: int=2):
+        matches = []
+        if self._root is None:
+            return matches
+        stack = [self._root]
+        while stack:
+            key, children = stack.pop()
+            d = levenshtein(query, key)
+            if d <= max_distance and key in self._live:
+                matches.append((key, d))
+            for distance, child in children.items():
+                if d - max_distance <= distance <= d + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda m: (m[1], m[0]))
+        return [m[0] for m in matches]
+
+    def __contains__(self, key: str):
+        return key in self._live
+
+    def __len__(self):
+        return len(self._live)
+
+
+class DeletionIndex:
+    """
+    Find keys within a maximum edit distance of a query in the manner of SymSpell.
+
+    Every key is filed under each string obtainable by deleting up to max_distance
+    characters from its first prefix_length characters. A query generates its own
+    deletions the same way, and the keys filed under any of them are verified with
+    levenshtein(). Lookup cost no longer depends on the number of keys. A shorter
+    prefix_length or max_distance makes the index smaller, at the price of missing
+    keys whose differences from the query fall near the end of a long prefix.
+    """
+
+    def __init__(self, keys=(), max_distance: int=2, prefix_length: int=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.deletes = {}
+        self._keys = set()
+        for key in keys:
+            self.add(key)
+
+    def _variants(self, key: str, max_distance: int):
+        variants = {key[:self.prefix_length]}
+        edge = set(variants)
+        for i in range(max_distance):
+            following = set()
+            for v in edge:
+                for j in range(len(v)):
+                    following.add(v[:j] + v[j+1:])
+            following.difference_update(variants)
+            variants.update(following)
+            edge = following
+        return variants
+
+    def add(self, key: str):
+        if key in self._keys:
+            return
+        self._keys.add(key)
+        for v in self._variants(key, self.max_distance):
+            try:
+                self.deletes[v].add(key)
+            except KeyError:
+                self.deletes[v] = {key}
+
+    def discard(self, key: str):
+        if key not in self._keys:
+            return
+        self._keys.discard(key)
+        for v in self._variants(key, self.max_distance):
+            self.deletes[v].discard(key)
+            if len(self.deletes[v]) == 0:
+                self.deletes.pop(v)
+
+    def search(self, query: str, max_distance: int=2):
+        max_distance = min(max_distance, self.max_distance)
+        candidates = set()
+        for v in self._variants(query, max_distance):
+            try:
+                candidates.update(self.deletes[v])
+            except KeyError:
+                continue
+        matches = []
+        for key in candidates:
+            if abs(len(key) - len(query)) > max_distance:
+                continue
+            d = levenshtein(query, key)
+            if d <= max_distance:
+                matches.append((key, d))
+        matches.sort(key=lambda m: (m[1], m[0]))
+        return [m[0] for m in matches]
+
+    def __contains__(self, key: str):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class NgramVectors:
+    """
+    Rank keys by the cosine similarity of their character n-gram TF-IDF vectors.
+
+    Keys are held as a sparse TF-IDF matrix, stored by column (n-gram) in NumPy arrays.
+    A batch of queries is scored in one pass. Each query's n-gram columns are gathered,
+    all products are summed with a single np.bincount into a (queries x keys) score
+    array, and each row's top k is taken with np.argpartition. Requires NumPy. Added and
+    discarded keys make the matrix stale; it is recompiled on the next search.
+    """
+
+    def __init__(self, keys=(), n: int=3):
+        if np is None:
+            raise ImportError(f'{type(self).__name__} requires numpy')
+        self.n = n
+        self._keys = []
+        self._rows = {}
+        self._vocabulary = {}
+        self._compiled = False
+        for key in keys:
+            self.add(key)
+
+    def _grams(self, key: str):
+        padded = f' {key} '
+        return Counter(padded[i:i+self.n] for i in range(max(len(padded) - self.n + 1, 1)))
+
+    def add(self, key: str):
+        if key in self._rows:
+            return
+        self._rows[key] = len(self._keys)
+        self._keys.append(key)
+        self._compiled = False
+
+    def discard(self, key: str):
+        try:
+            row = self._rows.pop(key)
+        except KeyError:
+            return
+        self._keys[row] = None
+        if len(self._keys) > 2 * len(self._rows):
+            self._keys = [k for k in self._keys if k is not None]
+            self._rows = {k: row for row, k in enumerate(self._keys)}
+        self._compiled = False
+
+    def _compile(self):
+        rows, cols, counts = [], [], []
+        self._vocabulary = {}
+        for row, key in enumerate(self._keys):
+            if key is None:
+                continue
+            for gram, count in self._grams(key).items():
+                try:
+                    col = self._vocabulary[gram]
+                except KeyError:
+                    col = len(self._vocabulary)
+                    self._vocabulary[gram] = col
+                rows.append(row)
+                cols.append(col)
+                counts.append(count)
+        rows = np.array(rows, dtype=np.int64)
+        cols = np.array(cols, dtype=np.int64)
+        weights = np.array(counts, dtype=np.float64)
+        document_count = len(self._rows)
+        df = np.bincount(cols, minlength=len(self._vocabulary))
+        self._idf = np.log((1 + document_count) / (1 + df)) + 1
+        self._unseen_idf = log(1 + document_count) + 1
+        weights *= self._idf[cols]
+        norms = np.sqrt(np.bincount(rows, weights ** 2, minlength=len(self._keys)))
+        weights /= norms[rows]
+        order = np.argsort(cols, kind='stable')
+        self._col_rows = rows[order]
+        self._col_weights = weights[order]
+        self._col_ptr = np.concatenate(([0], np.cumsum(df)))
+        self._compiled = True
+
+    def _query(self, query: str):
+        cols, weights = [], []
+        norm = 0.0
+        for gram, count in self._grams(query).items():
+            try:
+                col = self._vocabulary[gram]
+            except KeyError:
+                norm += (count * self._unseen_idf) ** 2
+                continue
+            w = count * self._idf[col]
+            norm += w ** 2
+            cols.append(col)
+            weights.append(w)
+        if norm == 0:
+            return cols, weights
+        norm = sqrt(norm)
+        return cols, [w / norm for w in weights]
+
+    def search(self, query: str, k: int=5, min_similarity: float=0.5):
+        return self.search_many([query], k, min_similarity)[0]
+
+    def search_many(self, queries: list, k: int=5, min_similarity: float=0.5, chunk_cells: int=4000000):
+        if not self._compiled:
+            self._compile()
+        width = len(self._keys)
+        if width == 0:
+            return [[] for q in queries]
+        results = []
+        chunk = max(1, chunk_cells // width)
+        for start in range(0, len(queries), chunk):
+            batch = queries[start:start+chunk]
+            cells, products = [], []
+            for i, query in enumerate(batch):
+                for col, w in zip(*self._query(query)):
+                    lo, hi = self._col_ptr[col], self._col_ptr[col + 1]
+                    cells.append(self._col_rows[lo:hi] + i * width)
+                    products.append(self._col_weights[lo:hi] * w)
+            if cells:
+                scores = np.bincount(
+                    np.concatenate(cells), np.concatenate(products), minlength=len(batch) * width)
+            else:
+                scores = np.zeros(len(batch) * width)
+            scores = scores.reshape(len(batch), width)
+            if width > k:
+                top = np.argpartition(-scores, k, axis=1)[:, :k]
+            else:
+                top = np.tile(np.arange(width), (len(batch), 1))
+            for i in range(len(batch)):
+                ranked = sorted(top[i], key=lambda row: (-scores[i, row], self._keys[row] or ''))
+                results.append([
+                    self._keys[row] for row in ranked if scores[i, row] >= min_similarity and self._keys[row] is not None])
+        return results
+
+    def __contains__(self, key: str):
+        return key in self._rows
+
+    def __len__(self):
+        return len(self._rows)
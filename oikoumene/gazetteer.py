@@ -4,65 +4,200 @@
 Gazetteer
 """
 
+from collections import Counter
+from contextlib import contextmanager
 from copy import deepcopy
+from hashlib import sha1
 from inspect import getmembers
 import logging
 from oikoumene.indexing import StringIndex
 from oikoumene.parsing import *
 from oikoumene.place import Dict2PlaceParser, Place
 from oikoumene.serialization import Serializeable
+from oikoumene.sharding import ShardedStringIndex
+from oikoumene.snapshot import load_snapshot, save_snapshot
 from oikoumene.stringlike import Dict2StringlikeParser, GeographicName, GeographicString
 from typing import Union, Sequence
 from types import FunctionType, MethodType
 
 logger = logging.getLogger(__name__)
 
+
+def _id_prefixes(id: str):
+    # "a", "a.b" and "a.b.c" for "a.b.c"
+    parts = id.split('.')
+    return ['.'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+# indexable class attributes and excluded names, by class (see Gazetteer._get_indexable_fields)
+_field_schemas = {}
+
+# the classes of objects that json() writes with their ids, by object_type
+_restorable = {'Place': Place, 'GeographicName': GeographicName, 'GeographicString': GeographicString}
+
+
+def _is_saved(data: dict):
+    # whether a dict is an object as json() wrote it (a Place keeps its names and strings by id)
+    if data.get('object_type') not in _restorable or 'id' not in data:
+        return False
+    return all([isinstance(data.get(k, {}), dict) for k in ['names', 'strings']])
+
 class Gazetteer(Serializeable):
     """A collection of Place, GeographicName, and GeographicString objects"""
 
-    def __init__(self, objs: Union[Sequence[Union[dict, Place, GeographicName, GeographicString]], dict, Place, GeographicName, GeographicString]=None):
+    def __init__(
+        self,
+        objs: Union[Sequence[Union[dict, Place, GeographicName, GeographicString]], dict, Place, GeographicName, GeographicString]=None,
+        index_options: dict=None,
+        index_path=None,
+        fields: list=None
+    ):
         self._supported = (dict, Place, GeographicName, GeographicString)
         self.contents = {}
+        if index_options is None:
+            self._index_options = {}
+        else:
+            self._index_options = index_options
         self._indexes = {
-            '_all_text': StringIndex()
+            '_all_text': self._make_index()
         }
+        # optional per-field indexes, each holding only the strings found under that attribute name
+        if fields is None:
+            self._fields = []
+        else:
+            self._fields = list(fields)
+        for field in self._fields:
+            if field.startswith('_') or field in ['id', 'text']:
+                raise ValueError(field)
+            self._indexes[field] = self._make_index()
         self._dict_parser = Dict2StringlikeParser()
         self._place_parser = Dict2PlaceParser()
+        # ids of objects added inside bulk(), indexed when the block ends
+        self._deferred = None
         if objs is None:
             return
-        fail = tuple()
-        if isinstance(objs, (list, tuple)):
-            for o in objs:
-                if not isinstance(o, self._supported):
-                    fail = o
-                    break
-                elif isinstance(o, dict):
-                    try:
-                        parsed = self._dict_parser.parse_dict(o)
-                    except ValueError:
-                        parsed = self._place_parser.parse_dict(o)
-                    self.add(parsed)
-                else:
-                    self.add(o)
-        elif isinstance(objs, dict):
-            for id, o in objs.items():
-                if isinstance(o, self._supported):
-                    self.add(o)
-                else:
-                    fail = o
-                    break
+        if isinstance(objs, (list, tuple, dict)):
+            items = objs
         elif isinstance(objs, (Place, GeographicName, GeographicString)):
-            self.add(objs)
+            items = [objs,]
         else:
             raise TypeError(
                 f'Unexpected type ({type(objs)}) passed to Gazetteer initialization. '
                 f'Expected one or more of {Place}, {GeographicName}, {GeographicString}.')
-        if fail:
-            raise TypeError(
-                f'Unexpected type ({type(fail)}) in {type(objs)} passed to Gazetteer initialization. '
-                f'Expected one of ({self._supported}).')
+        self.add_many(items, index_path=index_path)
+
+    def _make_index(self):
+        # index options naming a number of shards select a sharded index
+        if 'shards' in self._index_options:
+            return ShardedStringIndex(**self._index_options)
+        return StringIndex(**self._index_options)
 
     def add(self, obj: Union[Place, GeographicName, GeographicString]):
+        self._insert(obj)
+        if self._deferred is None:
+            self.reindex(obj.id)
+        else:
+            self._deferred.append(obj.id)
+
+    def add_many(self, objs: Sequence[Union[dict, Place, GeographicName, GeographicString]], index_path=None):
+        """
+        Add several objects (dicts are parsed into objects first), then index them together.
+
+        objs may also be a dict of objects by id, or a whole gazetteer as json() writes it;
+        objects written by json() keep their ids. Nothing is added unless every item can be.
+        Ids that are already taken are made unique as make_unique_id() would, in one pass over
+        the existing ids. With
+        index_path, a snapshot written by save_index() answers text queries instead of a
+        new index, provided it was saved from the same objects and text. Inside bulk(),
+        indexing waits for the end of the block and index_path is ignored.
+        """
+        if isinstance(objs, dict) and objs.get('object_type') == 'Gazetteer':
+            objs = objs['contents'].values()
+        elif isinstance(objs, dict):
+            objs = objs.values()
+        parsed = []
+        for o in objs:
+            if isinstance(o, dict) and _is_saved(o):
+                parsed.append(self._restore(o))
+            elif isinstance(o, dict):
+                try:
+                    parsed.append(self._dict_parser.parse_dict(o))
+                except ValueError:
+                    parsed.append(self._place_parser.parse_dict(o))
+            elif isinstance(o, (Place, GeographicName, GeographicString)):
+                parsed.append(o)
+            else:
+                raise TypeError(
+                    f'Unexpected type ({type(o)}) passed to gazetteer "add_many" method. '
+                    f'Expected one of ({self._supported}).')
+        # the number of ids equal to or starting with "{id}." for each dotted prefix of the ids
+        similar = Counter()
+        for id in self.contents.keys():
+            similar.update(_id_prefixes(id))
+        ids = []
+        for obj in parsed:
+            if obj.id in self.contents:
+                obj.id = f'{obj.id}.{similar[obj.id]}'
+            self.contents[obj.id] = obj
+            similar.update(_id_prefixes(obj.id))
+            ids.append(obj.id)
+        if self._deferred is not None:
+            self._deferred.extend(ids)
+            return
+        # with a usable snapshot, objects are only stored and the snapshot answers queries
+        if index_path is not None and 'shards' in self._index_options:
+            logger.warning(f'Ignoring index snapshot {index_path}: sharded indexes are not snapshotted')
+        elif index_path is not None:
+            try:
+                snapshot = load_snapshot(index_path, **self._index_options)
+            except (OSError, ValueError) as err:
+                logger.warning(f'Ignoring index snapshot {index_path}: {err}')
+            else:
+                if snapshot.fingerprint == self._fingerprint():
+                    self._indexes['_all_text'] = snapshot
+                    self._index(ids, self._fields)
+                    return
+                logger.warning(f'Index snapshot {index_path} does not match the gazetteer; reindexing.')
+                snapshot.close()
+        # everything is indexed in one bulk pass
+        self.reindex(ids)
+
+    @contextmanager
+    def bulk(self):
+        """
+        Defer indexing of the objects added inside the block (by add, add_many or the
+        new_* methods) and index them together when it ends. Until then, get, search
+        and complete do not find them.
+        """
+        if self._deferred is not None:
+            # already inside a bulk block, which does the indexing
+            yield self
+            return
+        self._deferred = []
+        try:
+            yield self
+        finally:
+            ids = [id for id in dict.fromkeys(self._deferred) if id in self.contents]
+            self._deferred = None
+            self.reindex(ids)
+
+    def _restore(self, data: dict):
+        # rebuild an object from the dict its json() wrote, keeping the ids
+        object_type = data['object_type']
+        if object_type == 'Place':
+            obj = Place()
+            for k in ['names', 'strings']:
+                for v in data.get(k, {}).values():
+                    obj.add(self._restore(v))
+        else:
+            obj = _restorable[object_type](**{
+                k: v for k, v in data.items() if k not in ['object_type', 'id', 'label', 'prior_ids']})
+        # the id was valid when it was written, and is not a change of id
+        obj._id = data['id']
+        if 'prior_ids' in data:
+            obj.prior_ids = set(data['prior_ids'])
+        return obj
+
+    def _insert(self, obj):
         if not isinstance(obj, (Place, GeographicName, GeographicString)):
             raise TypeError(
                 f'Invalid type ({type(obj)}) passed to gazetteer "add" method. '
@@ -74,12 +209,18 @@ class Gazetteer(Serializeable):
         else:
             obj.make_unique_id(list(self.contents.keys()))
             self.contents[obj.id] = obj
-        self.reindex(obj.id)
 
     def get(self, criteria: dict=[], operator: str='and'):
+        """
+        Find objects by id, by text in any field ("text") or by text in one of the fields
+        given at initialization. Criteria are combined with operator ("and" or "or").
+        """
         results = dict()
         for k, v in criteria.items():
-            results[k] = getattr(self, f'_get_{k}')(v)
+            if k in self._fields:
+                results[k] = self._get_field(k, v)
+            else:
+                results[k] = getattr(self, f'_get_{k}')(v)
         if len(results) < len(criteria) and operator ==  'and':
             return {}
         ids = None
@@ -87,22 +228,59 @@ class Gazetteer(Serializeable):
             if ids is None:
                 ids = set(v)
             elif operator == 'and':
-                ids.intersection(v)
+                ids = ids.intersection(v)
             elif operator == 'or':
-                ids.union(v)
+                ids = ids.union(v)
             else:
                 raise NotImplementedError(operator)
         entries = dict()
+        if ids is None:
+            return entries
         for id in ids:
             entries[id] = self.contents[id]
         return entries
 
+    def search(self, query: str, k: int=10):
+        """Return the k objects that best match query, best first (see StringIndex.search)."""
+        entries = dict()
+        for id, score in self._indexes['_all_text'].search(query, k):
+            entries[id] = self.contents[id]
+        return entries
+
+    def complete(self, prefix: str, k: int=10):
+        """List up to k indexed words starting with prefix, most frequent first."""
+        return self._indexes['_all_text'].complete(prefix, k, indexes=['word'])
+
+    def stats(self):
+        """Report the number of objects and the statistics of each index."""
+        return {
+            'objects': len(self.contents),
+            'indexes': {name: idx.stats() for name, idx in self._indexes.items()}}
+
+    def save_index(self, path):
+        """Write a snapshot of the text index that a later Gazetteer can map with index_path."""
+        if isinstance(self._indexes['_all_text'], ShardedStringIndex):
+            raise NotImplementedError('snapshot of a sharded index')
+        save_snapshot(self._indexes['_all_text'], path, fingerprint=self._fingerprint())
+
+    def _fingerprint(self):
+        # digest of the ids and indexable strings of the contents, whatever their order
+        digest = sha1()
+        for id in sorted(self.contents.keys()):
+            strings = sorted([s for field, s in self._indexable_strings(self.contents[id])])
+            digest.update('\0'.join([id] + strings).encode('utf-8'))
+            digest.update(b'\1')
+        return digest.hexdigest()
+
     def _get_id(self, ids):
         return [id for id in ids if id in self.contents.keys()]
 
     def _get_text(self, values):
         return self._indexes['_all_text'].get(values, operator='or')
 
+    def _get_field(self, field, values):
+        return self._indexes[field].get(values, operator='or')
+
     def make_place(self, ids: list):
         if isinstance(ids, list):
             real_ids = ids
@@ -229,37 +407,61 @@ class Gazetteer(Serializeable):
             real_ids = [ids,]
         else:
             raise TypeError(type(ids))
-        for id in real_ids:
+        self._index(real_ids, list(self._indexes.keys()))
+
+    def _index(self, ids: list, names: list):
+        items = {name: [] for name in names}
+        for id in ids:
             try:
                 obj = self.contents[id]
             except KeyError:
                 raise ValueError(id)
-            self._reindex_this(obj, id)
+            for field, s in self._indexable_strings(obj):
+                try:
+                    items[field].append((s, id))
+                except KeyError:
+                    pass
+                try:
+                    items['_all_text'].append((s, id))
+                except KeyError:
+                    pass
+        for name, name_items in items.items():
+            self._indexes[name].add_many(name_items)
 
-    def _reindex_this(self, obj, id):
+    def _indexable_strings(self, obj, field: str=None):
+        # pairs of (nearest enclosing attribute name, string)
         if isinstance(obj, str):
-            self._indexes['_all_text'].add(obj, id)
+            yield (field, obj)
         elif isinstance(obj, list):
             for o in obj:
-                self._reindex_this(o, id)
+                yield from self._indexable_strings(o, field)
         elif isinstance(obj, dict):
             for k, v in obj.items():
-                self._reindex_this(v, id)
+                yield from self._indexable_strings(v, field)
         elif isinstance(obj, (GeographicName, GeographicString, Place)):
             for k, v in self._get_indexable_fields(obj).items():
-                self._reindex_this(v, id)
+                yield from self._indexable_strings(v, k)
         else:
             raise TypeError(type(obj))
 
     def _get_indexable_fields(self, obj):
-        disallowed = {
-            name for name, value in getmembers(type(obj)) 
-                if isinstance(value, FunctionType)}
-        disallowed.update(['id', 'prior_ids'])
-        fields = [
-            name for name in dir(obj) 
-                if name[0] != '_' and name not in disallowed and hasattr(obj, name)]
-        fields = {name: getattr(obj, name) for name in fields if getattr(obj, name)}
+        # public attributes of the class (computed once per class) and of the instance
+        # (such as keyword arguments given at initialization), other than functions and ids
+        try:
+            class_fields, disallowed = _field_schemas[type(obj)]
+        except KeyError:
+            members = getmembers(type(obj))
+            disallowed = {name for name, value in members if isinstance(value, FunctionType)}
+            disallowed.update(['id', 'prior_ids'])
+            class_fields = {name for name, value in members if name[0] != '_' and name not in disallowed}
+            _field_schemas[type(obj)] = (class_fields, disallowed)
+        names = class_fields.union([
+            name for name in vars(obj) if name[0] != '_' and name not in disallowed])
+        fields = {}
+        for name in sorted(names):
+            value = getattr(obj, name, None)
+            if value:
+                fields[name] = value
         return fields
 
     def remove(self, id:str):
@@ -272,7 +474,9 @@ class Gazetteer(Serializeable):
             self._unindex(id)
 
     def _unindex(self, id):
-        self._indexes['_all_text'].drop(id)
+        for idx in self._indexes.values():
+            if id in idx:
+                idx.drop(id)
 
     def __str__(self):
         msg = []
@@ -4,22 +4,219 @@
 Indexing
 """
 
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from fuzzywuzzy import process
-from itertools import combinations
+import gc
+from heapq import nlargest, nsmallest
+from itertools import combinations, repeat
 import logging
-from oikoumene.normalization import norm
+from math import log
+from oikoumene.fuzzy import BKTree, DeletionIndex, levenshtein, NgramVectors
+from oikoumene.normalization import fold, is_latin, norm, transliterate
+from oikoumene.phonetic import phonetic_codes
+from oikoumene.phrases import PositionalIndex
+from oikoumene.postings import ArrayPostings, BitmapPostings
+from oikoumene.prefixes import PrefixIndex
+from oikoumene.substrings import SuffixAutomaton, TrigramIndex
 from pprint import pprint
+import sys
 
 logger = logging.getLogger(__name__)
 
+# smallest add_many batch whose keys are collected in a process pool when workers > 1;
+# smaller batches would spend more on starting the pool than they save
+PARALLEL_BATCH = 5000
+
+
+def _sizeof(obj, seen: set=None):
+    """Approximate the bytes held by obj and the objects it contains, counting each once."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum([_sizeof(k, seen) + _sizeof(v, seen) for k, v in obj.items()])
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum([_sizeof(v, seen) for v in obj])
+    elif not isinstance(obj, type) and hasattr(obj, '__dict__'):
+        size += _sizeof(vars(obj), seen)
+    return size
+
+
+def _derive(idx_name: str, value: str):
+    """List the keys a normalized value contributes to a dictionary sub-index."""
+    if idx_name == 'values':
+        return [value]
+    if idx_name == 'words':
+        return value.split()
+    if idx_name == 'folded_values':
+        return [fold(value)]
+    if idx_name == 'folded_words':
+        return fold(value).split()
+    if idx_name == 'transliterations':
+        if is_latin(value):
+            return []
+        key = transliterate(value)
+        if key:
+            return [key]
+        return []
+    if idx_name == 'phonetics':
+        codes = []
+        for word in value.split():
+            codes.extend([code for code in phonetic_codes(word) if code not in codes])
+        return codes
+    if idx_name == 'phrases':
+        words = value.split()
+        return [
+            ' '.join(words[start:end+1])
+            for start, end in combinations(range(len(words)), 2)]
+    chars = list(value)
+    return [
+        ''.join(chars[start:end+1])
+        for start, end in combinations(range(len(chars)), 2)]
+
+
+def _collect(batch: list, idx_names: list, derived: list):
+    """Collect a key -> documents table per sub-index, and each document's keys, for a batch."""
+    tables = {idx_name: defaultdict(set) for idx_name in idx_names}
+    rev = defaultdict(dict)
+    for value, docs in batch:
+        for idx_name in idx_names:
+            if idx_name in derived:
+                keys = _derive(idx_name, value)
+            else:
+                keys = [value]
+            if len(keys) == 0:
+                continue
+            table = tables[idx_name]
+            if len(docs) == 1:
+                doc = docs[0]
+                for key in keys:
+                    table[key].add(doc)
+            else:
+                for key in keys:
+                    table[key].update(docs)
+            for doc in docs:
+                try:
+                    rev[doc][idx_name].update(keys)
+                except KeyError:
+                    rev[doc][idx_name] = set(keys)
+    return (tables, rev)
+
+
+def _collect_chunk(batch: list, idx_names: list, derived: list):
+    # _collect() in a pool process, which only lives for one batch: its many small sets hold
+    # no reference cycles, so garbage collection would only slow it down
+    gc.disable()
+    return _collect(batch, idx_names, derived)
+
+
 class StringIndex:
 
-    def __init__(self):
+    def __init__(
+        self,
+        substring_mode: str='exhaustive',
+        postings: str='set',
+        phrase_mode: str='exhaustive',
+        fuzzy_mode: str='scan',
+        max_distance: int=2,
+        prefix_length: int=7,
+        top_k: int=5,
+        min_similarity: float=0.5,
+        cache_size: int=256,
+        eager: list=None,
+        folding: bool=False,
+        phonetic: bool=False,
+        transliteration: bool=False,
+        workers: int=1
+    ):
+        # ids are interned to dense document numbers; postings hold document numbers
+        if postings == 'set':
+            self._postings = set
+        elif postings == 'array':
+            self._postings = ArrayPostings
+        elif postings == 'bitmap':
+            self._postings = BitmapPostings
+        else:
+            raise ValueError(postings)
+        self.postings = postings
+        self._ids = []
+        self._doc_numbers = {}
+        # document numbers of dropped ids, to be given to new ids
+        self._free = []
         self.values = {}
-        self.phrases = {}
+        if phrase_mode == 'exhaustive':
+            self.phrases = {}
+        elif phrase_mode == 'positional':
+            self.phrases = PositionalIndex(postings=self._postings)
+        else:
+            raise ValueError(phrase_mode)
+        self.phrase_mode = phrase_mode
         self.words = {}
-        self.substrings = {}
+        # sorted keys of values and words, for prefix search and completion
+        self.prefixes = PrefixIndex()
+        if substring_mode == 'exhaustive':
+            self.substrings = {}
+        elif substring_mode == 'automaton':
+            self.substrings = SuffixAutomaton(postings=self._postings)
+        elif substring_mode == 'trigram':
+            self.substrings = TrigramIndex(postings=self._postings)
+        else:
+            raise ValueError(substring_mode)
+        self.substring_mode = substring_mode
+        if fuzzy_mode not in ['scan', 'bktree', 'symspell', 'tfidf']:
+            raise ValueError(fuzzy_mode)
+        self.fuzzy_mode = fuzzy_mode
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        # fuzzy engines by sub-index name, built on first fuzzy query
+        self._fuzzy = {}
+        # results of get(), valid while no add or drop has bumped the generation
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.generation = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
         self.reverse = {}
+        # number of words in the values of each document, for ranking
+        self._lengths = {}
+        self._total_length = 0
+        # accent- and case-folded values and words, looked up with folded queries
+        self.folding = folding
+        self.folded_values = {}
+        self.folded_words = {}
+        # Soundex and Metaphone codes of the words of values, matched word by word
+        self.phonetic = phonetic
+        self.phonetics = {}
+        # romanizations of values written in other scripts, looked up with romanized queries
+        self.transliteration = transliteration
+        self.transliterations = {}
+        self.indexes = ['value', 'word', 'phrase', 'substring']
+        if folding:
+            self.indexes.extend(['folded_value', 'folded_word'])
+        if phonetic:
+            self.indexes.append('phonetic')
+        if transliteration:
+            self.indexes.append('transliteration')
+        # sub-indexes get() searches when none are named; phonetic codes are only searched on request
+        self.default_indexes = [name for name in self.indexes if name != 'phonetic']
+        # sub-indexes not kept eagerly are built from the values index when first queried
+        if eager is None:
+            eager = list(self.indexes)
+        for name in eager:
+            if name not in self.indexes:
+                raise ValueError(name)
+        self.eager = list(eager)
+        self._built = {'values'}.union([f'{name}s' for name in eager])
+        # processes that derive keys in add_many
+        if workers < 1:
+            raise ValueError(workers)
+        self.workers = workers
 
     def add(self, value: str, ids: list):
         if not isinstance(value, str):
@@ -32,61 +229,249 @@ class StringIndex:
         else:
             raise TypeError(type(ids))
         self._add_value(real_value, real_ids)
-        self._add_phrases(real_value, real_ids)
-        self._add_words(real_value, real_ids)
-        self._add_substrings(real_value, real_ids)
+        for idx_name in [f'{name}s' for name in self.indexes if name != 'value']:
+            if idx_name in self._built:
+                getattr(self, f'_add_{idx_name}')(real_value, real_ids)
 
-    def _add_rev(self, ids, idx, value):
-        for id in ids:
-            try:
-                self.reverse[id]
-            except KeyError:
-                self.reverse[id] = {}
+    def add_many(self, items):
+        """Add an iterable of (value, ids) pairs, merging their keys into each sub-index at once."""
+        idx_names = [f'{name}s' for name in self.indexes if f'{name}s' in self._built]
+        derived = [idx_name for idx_name in idx_names if isinstance(getattr(self, idx_name), dict)]
+        batch = []
+        for value, ids in items:
+            if not isinstance(value, str):
+                raise TypeError(type(value))
+            real_value = norm(value).lower()
+            if isinstance(ids, str):
+                real_ids = [ids,]
+            elif isinstance(ids, list):
+                real_ids = ids
+            else:
+                raise TypeError(type(ids))
+            docs = self._intern(real_ids)
+            batch.append((real_value, docs))
+        if self.workers > 1 and len(batch) >= max(PARALLEL_BATCH, 2):
+            pending, rev = self._collect_parallel(batch, idx_names, derived)
+        else:
+            pending, rev = _collect(batch, idx_names, derived)
+        self.generation += 1
+        for idx_name, table in pending.items():
+            idx = getattr(self, idx_name)
+            if not isinstance(idx, dict):
+                for value, docs in table.items():
+                    idx.add(value, docs)
+                self._fuzzy.pop(idx_name, None)
+                continue
+            new = []
+            for key, docs in table.items():
+                postings = idx.get(key)
+                if postings is None:
+                    # the local set is adopted as is when postings are plain sets
+                    if self._postings is not set:
+                        docs = self._postings(docs)
+                    idx[key] = docs
+                    new.append(key)
+                else:
+                    postings.update(docs)
             try:
-                self.reverse[id][idx]
+                engine = self._fuzzy[idx_name]
             except KeyError:
-                self.reverse[id][idx] = set()
-            self.reverse[id][idx].add(value)
+                pass
+            else:
+                for key in new:
+                    engine.add(key)
+            if idx_name in ['values', 'words']:
+                self.prefixes.update(new)
+        for doc, keys in rev.items():
+            mine = self.reverse.get(doc)
+            if mine is None:
+                self.reverse[doc] = dict(keys)
+                continue
+            for idx_name, idx_keys in keys.items():
+                try:
+                    mine[idx_name].update(idx_keys)
+                except KeyError:
+                    mine[idx_name] = idx_keys
+        self._add_length(rev)
 
-    def _add_value(self, value, ids):
+    def _collect_parallel(self, batch: list, idx_names: list, derived: list):
+        # the tables of later chunks add their new keys at the end with one dict.update()
+        # and only join the postings of keys seen before, so most keys are merged in C
+        size = -(-len(batch) // (self.workers * 4))
+        chunks = [batch[start:start+size] for start in range(0, len(batch), size)]
+        # unpickling the answers creates millions of sets, each of which would count
+        # towards a collection that finds nothing to free
+        collecting = gc.isenabled()
+        gc.disable()
         try:
-            self.values[value]
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                parts = executor.map(_collect_chunk, chunks, repeat(idx_names), repeat(derived))
+                tables, rev = next(parts)
+                for part_tables, part_rev in parts:
+                    for idx_name, part_table in part_tables.items():
+                        table = tables[idx_name]
+                        for key in table.keys() & part_table.keys():
+                            table[key].update(part_table.pop(key))
+                        table.update(part_table)
+                    for doc in rev.keys() & part_rev.keys():
+                        mine = rev[doc]
+                        for idx_name, idx_keys in part_rev.pop(doc).items():
+                            try:
+                                mine[idx_name].update(idx_keys)
+                            except KeyError:
+                                mine[idx_name] = idx_keys
+                    rev.update(part_rev)
+        finally:
+            if collecting:
+                gc.enable()
+        return (tables, rev)
+
+    def options(self):
+        """Return the keyword arguments that would construct an index configured like this one."""
+        return {
+            'substring_mode': self.substring_mode,
+            'postings': self.postings,
+            'phrase_mode': self.phrase_mode,
+            'fuzzy_mode': self.fuzzy_mode,
+            'max_distance': self.max_distance,
+            'prefix_length': self.prefix_length,
+            'top_k': self.top_k,
+            'min_similarity': self.min_similarity,
+            'cache_size': self.cache_size,
+            'eager': self.eager,
+            'folding': self.folding,
+            'phonetic': self.phonetic,
+            'transliteration': self.transliteration,
+            'workers': self.workers}
+
+    def _build(self, idx_name):
+        if idx_name in self._built:
+            return
+        self._built.add(idx_name)
+        logger.debug(f'building {idx_name} index from {len(self.values)} values')
+        add = getattr(self, f'_add_{idx_name}')
+        for value, docs in list(self.values.items()):
+            add(value, self._extern(docs))
+
+    def __contains__(self, id: str):
+        """Tell whether any text is indexed for id."""
+        try:
+            doc = self._doc_numbers[id]
         except KeyError:
-            self.values[value] = set()
-        self.values[value].update(ids)
-        self._add_rev(ids, 'values', value)
+            return False
+        return doc in self.reverse
 
-    def _add_words(self, value, ids):   
-        words = value.split()
-        for word in words:
+    def _keys(self, idx_name):
+        self._build(idx_name)
+        return getattr(self, idx_name).keys()
+
+    def _intern(self, ids: list):
+        docs = []
+        for id in ids:
             try:
-                self.words[word]
+                doc = self._doc_numbers[id]
             except KeyError:
-                self.words[word] = set()
-            self.words[word].update(ids)
-            self._add_rev(ids, 'words', word)
+                if self._free:
+                    doc = self._free.pop()
+                    self._ids[doc] = id
+                else:
+                    doc = len(self._ids)
+                    self._ids.append(id)
+                self._doc_numbers[id] = doc
+            docs.append(doc)
+        return docs
 
-    def _add_phrases(self, value, ids):
-        words = value.split()
-        for start, end in combinations(range(len(words)), 2):
-            phrase = ' '.join(words[start:end+1])
+    def _extern(self, docs):
+        return [self._ids[doc] for doc in docs]
+
+    def _add_rev(self, docs, idx, value):
+        for doc in docs:
             try:
-                self.phrases[phrase]
+                self.reverse[doc]
             except KeyError:
-                self.phrases[phrase] = set()
-            self.phrases[phrase].update(ids)
-            self._add_rev(ids, 'phrases', phrase)
+                self.reverse[doc] = {}
+            try:
+                self.reverse[doc][idx]
+            except KeyError:
+                self.reverse[doc][idx] = set()
+            self.reverse[doc][idx].add(value)
 
-    def _add_substrings(self, value, ids):
-        chars = list(value)
-        for start, end in combinations(range(len(chars)), 2):
-            substring = ''.join(chars[start:end+1])
+    def _add_posting(self, idx_name, key, docs):
+        self.generation += 1
+        idx = getattr(self, idx_name)
+        try:
+            idx[key]
+        except KeyError:
+            idx[key] = self._postings()
             try:
-                self.substrings[substring]
+                self._fuzzy[idx_name].add(key)
             except KeyError:
-                self.substrings[substring] = set()
-            self.substrings[substring].update(ids)
-            self._add_rev(ids, 'substrings', substring)
+                pass
+            if idx_name in ['values', 'words']:
+                self.prefixes.add(key)
+        idx[key].update(docs)
+
+    def _add_text(self, idx_name, value, docs):
+        # sub-indexes that derive their keys from whole values
+        self.generation += 1
+        getattr(self, idx_name).add(value, docs)
+        self._add_rev(docs, idx_name, value)
+        self._fuzzy.pop(idx_name, None)
+
+    def _add_value(self, value, ids):
+        docs = self._intern(ids)
+        self._add_posting('values', value, docs)
+        self._add_rev(docs, 'values', value)
+        self._add_length(docs)
+
+    def _add_length(self, docs):
+        # a document's length is the number of words in its distinct values, however often added
+        for doc in docs:
+            n = sum([len(value.split()) for value in self.reverse[doc]['values']])
+            self._total_length += n - self._lengths.get(doc, 0)
+            self._lengths[doc] = n
+
+    def _add_words(self, value, ids):
+        docs = self._intern(ids)
+        for word in _derive('words', value):
+            self._add_posting('words', word, docs)
+            self._add_rev(docs, 'words', word)
+
+    def _add_phrases(self, value, ids):
+        docs = self._intern(ids)
+        if self.phrase_mode != 'exhaustive':
+            self._add_text('phrases', value, docs)
+            return
+        for phrase in _derive('phrases', value):
+            self._add_posting('phrases', phrase, docs)
+            self._add_rev(docs, 'phrases', phrase)
+
+    def _add_folded_values(self, value, ids):
+        self._add_keys('folded_values', value, ids)
+
+    def _add_folded_words(self, value, ids):
+        self._add_keys('folded_words', value, ids)
+
+    def _add_phonetics(self, value, ids):
+        self._add_keys('phonetics', value, ids)
+
+    def _add_transliterations(self, value, ids):
+        self._add_keys('transliterations', value, ids)
+
+    def _add_keys(self, idx_name, value, ids):
+        docs = self._intern(ids)
+        for key in _derive(idx_name, value):
+            self._add_posting(idx_name, key, docs)
+            self._add_rev(docs, idx_name, key)
+
+    def _add_substrings(self, value, ids):
+        docs = self._intern(ids)
+        if self.substring_mode != 'exhaustive':
+            self._add_text('substrings', value, docs)
+            return
+        for substring in _derive('substrings', value):
+            self._add_posting('substrings', substring, docs)
+            self._add_rev(docs, 'substrings', substring)
 
     def drop(self, ids: list):
         if isinstance(ids, list):
@@ -95,138 +480,503 @@ class StringIndex:
             real_ids = [ids,]
         else:
             raise TypeError(type(ids))
+        self.generation += 1
         for id in real_ids:
-            for idx_name, values in self.reverse[id].items():
+            doc = self._doc_numbers[id]
+            rev = self.reverse.pop(doc)
+            self._total_length -= self._lengths.pop(doc, 0)
+            for idx_name, values in rev.items():
                 idx = getattr(self, idx_name)
                 for value in values:
-                    idx[value].remove(id)
+                    idx[value].remove(doc)
                     if len(idx[value]) == 0:
                         idx.pop(value)
+                        self._drop_fuzzy(idx_name, value)
+                        if idx_name in ['values', 'words']:
+                            self.prefixes.discard(value)
+            self._release(id, doc)
+
+    def _release(self, id, doc):
+        # the document of a dropped id holds no keys any more, so its number can be reused
+        del self._doc_numbers[id]
+        self._ids[doc] = None
+        self._free.append(doc)
 
-    def get(self, values: list, indexes: list=['value', 'word', 'phrase', 'substring'], operator: str='and', fuzzy=False):
+    def _drop_fuzzy(self, idx_name, key):
+        try:
+            engine = self._fuzzy[idx_name]
+        except KeyError:
+            return
+        if isinstance(getattr(self, idx_name), dict):
+            engine.discard(key)
+        else:
+            self._fuzzy.pop(idx_name)
+
+    def get(self, values: list, indexes: list=None, operator: str='and', fuzzy=False):
+        if indexes is None:
+            indexes = self.default_indexes
         if isinstance(values, str):
             real_values = [values,]
         elif isinstance(values, list):
             real_values = values
         else:
             raise TypeError(type(values))
+        if 'prefix' in indexes and (('prefix' in fuzzy) if isinstance(fuzzy, list) else fuzzy):
+            # a prefix already stands for every key it begins
+            raise ValueError('fuzzy prefix search')
         real_values = [v.lower() for v in real_values]
+        if self.cache_size <= 0:
+            return self._extern(self._find_indexes(real_values, indexes, operator, fuzzy))
+        if isinstance(fuzzy, list):
+            fuzzy_key = tuple(fuzzy)
+        else:
+            fuzzy_key = fuzzy
+        key = (tuple(real_values), tuple(indexes), operator, fuzzy_key)
+        try:
+            generation, result = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            if generation == self.generation:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return list(result)
+        self.cache_misses += 1
+        result = self._extern(self._find_indexes(real_values, indexes, operator, fuzzy))
+        self._cache[key] = (self.generation, result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return list(result)
+
+    def cache_info(self):
+        """Report result cache hits, misses and size."""
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'size': len(self._cache),
+            'maxsize': self.cache_size,
+            'generation': self.generation}
+
+    def stats(self, largest: int=5):
+        """Report the keys, postings, largest posting lists and approximate bytes of each sub-index."""
+        indexes = {}
+        for idx_name in [f'{name}s' for name in self.indexes]:
+            idx = getattr(self, idx_name)
+            if isinstance(idx, dict):
+                items = idx.items()
+            else:
+                items = idx.texts.items()
+            lengths = [(len(docs), key) for key, docs in items]
+            indexes[idx_name] = {
+                'built': idx_name in self._built,
+                'keys': len(lengths),
+                'postings': sum([n for n, key in lengths]),
+                'largest': [(key, n) for n, key in nlargest(largest, lengths)],
+                'bytes': _sizeof(idx)}
+        return {
+            'ids': len(self.reverse),
+            'indexes': indexes,
+            'reverse': {
+                'documents': len(self.reverse),
+                'keys': sum([len(keys) for rev in self.reverse.values() for keys in rev.values()]),
+                'bytes': _sizeof(self.reverse)},
+            'prefixes': {'keys': len(self.prefixes), 'bytes': _sizeof(self.prefixes)},
+            'fuzzy': {idx_name: _sizeof(engine) for idx_name, engine in self._fuzzy.items()},
+            'cache': self.cache_info()}
+
+    def search(self, query: str, k: int=10, value_boost: float=2.0, k1: float=1.2, b: float=0.75):
+        """Rank ids against query with BM25 and return the best k as (id, score) pairs."""
+        weighted = []
+        for index, term, weight in self._search_terms(query, value_boost):
+            docs = self._find(index, term)
+            if len(docs) > 0:
+                weighted.append((index, term, weight, docs))
+        count, total = self._corpus_lengths()
+        if len(weighted) == 0 or count == 0:
+            return []
+        weighted = [
+            (weight * log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5)), docs)
+            for index, term, weight, docs in weighted]
+        return self._rank(weighted, total / count, k, k1, b)
+
+    def _search_terms(self, query: str, value_boost: float):
+        # (index, term, weight) for each term of a query
+        if not isinstance(query, str):
+            raise TypeError(type(query))
+        real_query = norm(query).lower()
+        words = real_query.split()
+        terms = [('word', word, 1.0) for word in dict.fromkeys(words)]
+        if len(words) > 1:
+            terms.append(('phrase', real_query, 1.0))
+        terms.append(('value', real_query, value_boost))
+        return terms
+
+    def _rank(self, weighted: list, average: float, k: int, k1: float, b: float):
+        # the best k (id, score) pairs, given (term weight, documents) pairs
+        weighted = sorted(weighted, key=lambda t: t[0], reverse=True)
+        # the most a term can add, reached by an id of the shortest possible length
+        bound = (k1 + 1) / (1 + k1 * (1 - b))
+        remaining = sum([w for w, docs in weighted]) * bound
+        scores = {}
+        for w, docs in weighted:
+            admit = len(scores) < k or nlargest(k, scores.values())[-1] <= remaining
+            remaining -= w * bound
+            for doc in docs:
+                try:
+                    score = scores[doc]
+                except KeyError:
+                    if not admit:
+                        continue
+                    score = 0.0
+                length = self._document_length(doc) / average
+                scores[doc] = score + w * (k1 + 1) / (1 + k1 * (1 - b + b * length))
+        ranked = nsmallest(k, [(-score, self._ids[doc]) for doc, score in scores.items()])
+        return [(id, -score) for score, id in ranked]
+
+    def _corpus_lengths(self):
+        return (len(self._lengths), self._total_length)
+
+    def _document_length(self, doc: int):
+        return self._lengths.get(doc, 0)
+
+    def _document_values(self, doc: int):
+        return self.reverse.get(doc, {}).get('values', ())
+
+    def get_batch(self, values: list, indexes: list=['value'], fuzzy=False):
+        """Look up each of several values on its own; return one list of ids per value."""
+        real_values = [v.lower() for v in values]
+        results = [self._postings() for v in real_values]
+        for idx in indexes:
+            if fuzzy:
+                found = self._find_fuzzy_many(idx, real_values)
+            else:
+                found = [self._find(idx, v) for v in real_values]
+            results = [r | f for r, f in zip(results, found)]
+        return [self._extern(r) for r in results]
+
+    def _find_indexes(self, values: list, indexes: list, operator: str, fuzzy):
+        # fuzzy is a bool for all indexes, or a list of the indexes to match fuzzily
+        if operator == 'and':
+            return self._plan(values, indexes, fuzzy)
         results = {}
         for idx in indexes:
-            r = getattr(self, f'_get_{idx}s')(real_values, operator, fuzzy)
+            if isinstance(fuzzy, list):
+                r = self._find_multiples(idx, values, operator, idx in fuzzy)
+            else:
+                r = self._find_multiples(idx, values, operator, fuzzy)
             if r:
                 results[idx] = r
         if len(results) != len(indexes) and operator == 'and':
-            return []
+            return self._postings()
         matches = None
-        for idx, ids in results.items():
+        for idx, docs in results.items():
             if matches is None:
-                matches = set(ids)
+                matches = docs
             elif operator == 'and':
-                matches = matches.intersection(ids)
+                matches = matches & docs
             elif operator == 'or':
-                matches.update(ids)
+                matches = matches | docs
             else:
                 raise ValueError(operator)
         if matches is None:
-            return []
-        return list(matches)
+            return self._postings()
+        return matches
 
-    def _get_phrase(self, phrase):
+    def _plan(self, values: list, indexes: list, fuzzy):
+        """Answer an "and" query term by term, cheapest first."""
+        if isinstance(fuzzy, list):
+            fuzzy_indexes = [idx for idx in indexes if idx in fuzzy]
+        elif fuzzy:
+            fuzzy_indexes = list(indexes)
+        else:
+            fuzzy_indexes = []
+        terms = [
+            (self._estimate(idx, value), i, idx, value)
+            for i, (idx, value) in enumerate(
+                [(idx, value) for idx in indexes if idx not in fuzzy_indexes for value in values])]
+        terms.sort()
+        matches = None
+        for estimate, i, idx, value in terms:
+            if estimate == 0:
+                return self._postings()
+            docs = self._find(idx, value)
+            if matches is None:
+                matches = docs
+            else:
+                matches = matches & docs
+            if not matches:
+                return self._postings()
+        for idx in fuzzy_indexes:
+            found = None
+            for value in values:
+                if matches is None:
+                    docs = self._find_fuzzy(idx, value)
+                else:
+                    docs = self._find_fuzzy_within(idx, value, matches)
+                    # a value matching none of the candidates only ends the query if it
+                    # matches nothing at all, as it would when evaluated in full
+                    if not docs and self._find_fuzzy(idx, value):
+                        continue
+                if not docs:
+                    return self._postings()
+                if found is None:
+                    found = docs
+                else:
+                    found = found | docs
+            if found is None:
+                continue
+            if matches is None:
+                matches = found
+            else:
+                matches = matches & found
+            if not matches:
+                return self._postings()
+        if matches is None:
+            return self._postings()
+        return matches
+
+    def _estimate(self, index: str, value: str):
+        # a bound on the posting size of an exact term, from posting lengths alone; sub-indexes
+        # that are not dictionaries only know theirs once searched, so they are estimated to
+        # match everything and run last
+        if index == 'phonetic':
+            self._build('phonetics')
+            sizes = [
+                sum([self._key_size('phonetics', code) for code in phonetic_codes(word)])
+                for word in value.split()]
+            return min(sizes, default=0)
+        if index != 'prefix':
+            self._build(f'{index}s')
+            if isinstance(getattr(self, f'{index}s'), dict):
+                return self._key_size(f'{index}s', self._prepare(index, value))
+        return len(self._ids) + 1
+
+    def _key_size(self, idx_name: str, key: str):
+        # the number of documents under a key of a built dictionary sub-index
         try:
-            result = self.phrases[phrase]
+            return len(getattr(self, idx_name)[key])
         except KeyError:
-            return []
+            return 0
+
+    def _find_fuzzy_within(self, index: str, value: str, docs):
+        """Match value fuzzily, knowing that only documents in docs can survive the query."""
+        idx_name = f'{index}s'
+        if self.fuzzy_mode not in ['bktree', 'symspell'] or index in ['prefix', 'phonetic']:
+            return self._find_fuzzy(index, value)
+        idx = getattr(self, idx_name)
+        if not isinstance(idx, dict) or len(docs) * 10 >= len(idx):
+            return self._find_fuzzy(index, value)
+        keys = set()
+        for doc in docs:
+            try:
+                keys.update(self.reverse[doc].get(idx_name, ()))
+            except KeyError:
+                # indexed elsewhere (e.g. in a snapshot), so its keys are not known here
+                return self._find_fuzzy(index, value)
+        if len(keys) * 10 >= len(idx):
+            return self._find_fuzzy(index, value)
+        value = self._prepare(index, value)
+        matches = [key for key in keys if levenshtein(value, key) <= self.max_distance]
+        return self._find_indexes(matches, [index], 'or', False)
+
+    def complete(self, prefix: str, k: int=10, indexes: list=['value', 'word']):
+        """List up to k value and/or word keys starting with prefix, most frequent first."""
+        ranked = [(-frequency, key) for key, frequency in self._completions(prefix, indexes).items()]
+        return [key for frequency, key in nsmallest(k, ranked)]
+
+    def _completions(self, prefix: str, indexes: list):
+        # the number of ids under each value and/or word key starting with prefix
+        for idx in indexes:
+            self._build(f'{idx}s')
+        idxs = [getattr(self, f'{idx}s') for idx in indexes]
+        frequencies = {}
+        for key in self.prefixes.match(prefix.lower()):
+            frequency = 0
+            found = False
+            for idx in idxs:
+                try:
+                    frequency += len(idx[key])
+                except KeyError:
+                    continue
+                found = True
+            if found:
+                frequencies[key] = frequency
+        return frequencies
+
+    def _find(self, index: str, value: str):
+        if index == 'prefix':
+            return self._find_prefix(value)
+        if index == 'phonetic':
+            return self._find_phonetic(value)
+        return self._find_key(f'{index}s', self._prepare(index, value))
+
+    def _find_key(self, idx_name: str, key: str):
+        self._build(idx_name)
+        idx = getattr(self, idx_name)
+        if not isinstance(idx, dict):
+            return idx.find(key)
+        try:
+            return idx[key]
+        except KeyError:
+            return self._postings()
+
+    def _find_phonetic(self, value: str):
+        # every word of value must share a code with some word of the document
+        matches = None
+        for word in value.split():
+            docs = self._postings()
+            for code in phonetic_codes(word):
+                docs = docs | self._find_key('phonetics', code)
+            if matches is None:
+                matches = docs
+            else:
+                matches = matches & docs
+            if not matches:
+                return self._postings()
+        if matches is None:
+            return self._postings()
+        return matches
+
+    def _find_phonetic_fuzzy(self, value: str):
+        # sound-alike candidates whose words are also within max_distance of each query word
+        words = fold(value).split()
+        matches = []
+        for doc in self._find_phonetic(value):
+            doc_words = set()
+            for doc_value in self._document_values(doc):
+                doc_words.update(fold(doc_value).split())
+            if all([
+                    any([levenshtein(word, doc_word) <= self.max_distance for doc_word in doc_words])
+                    for word in words]):
+                matches.append(doc)
+        return self._postings(matches)
+
+    def _find_prefix(self, prefix: str):
+        self._build('words')
+        result = self._postings()
+        for key in self.prefixes.match(prefix):
+            for idx in [self.values, self.words]:
+                try:
+                    result.update(idx[key])
+                except KeyError:
+                    continue
+        return result
+
+    def _find_fuzzy(self, index: str, value: str, min_ratio: int=70):
+        if not isinstance(value, str):
+            raise TypeError(type(value))
+        if index == 'prefix':
+            raise ValueError('fuzzy prefix search')
+        if index == 'phonetic':
+            return self._find_phonetic_fuzzy(value)
+        value = self._prepare(index, value)
+        if self.fuzzy_mode == 'scan':
+            choices = list(self._keys(f'{index}s'))
+            matches = process.extract(value, choices)
+            matches = [m[0] for m in matches if m[1] >= min_ratio]
+        elif self.fuzzy_mode == 'tfidf':
+            matches = self._fuzzy_engine(f'{index}s').search(value, self.top_k, self.min_similarity)
         else:
-            return list(result)
+            matches = self._fuzzy_engine(f'{index}s').search(value, self.max_distance)
+        return self._find_indexes(matches, [index], 'or', False)
+
+    def _find_fuzzy_many(self, index: str, values: list):
+        if self.fuzzy_mode != 'tfidf' or index == 'phonetic':
+            return [self._find_fuzzy(index, value) for value in values]
+        engine = self._fuzzy_engine(f'{index}s')
+        values = [self._prepare(index, value) for value in values]
+        return [
+            self._find_indexes(matches, [index], 'or', False)
+            for matches in engine.search_many(values, self.top_k, self.min_similarity)]
+
+    def _prepare(self, index: str, value: str):
+        # queries of the folded and transliterated sub-indexes are treated like their keys
+        if index in ['folded_value', 'folded_word']:
+            return fold(value)
+        if index == 'transliteration':
+            return transliterate(value)
+        return value
+
+    def _fuzzy_engine(self, idx_name):
+        try:
+            return self._fuzzy[idx_name]
+        except KeyError:
+            pass
+        keys = self._keys(idx_name)
+        if self.fuzzy_mode == 'symspell':
+            engine = DeletionIndex(keys, self.max_distance, self.prefix_length)
+        elif self.fuzzy_mode == 'tfidf':
+            engine = NgramVectors(keys)
+        else:
+            engine = BKTree(keys)
+        self._fuzzy[idx_name] = engine
+        return engine
+
+    def _get_phrase(self, phrase):
+        return self._extern(self._find('phrase', phrase))
 
     def _get_phrase_fuzzy(self, phrase: str, min_ratio: int=70):
-        if not isinstance(phrase, str):
-            raise TypeError(type(phrase))
-        choices = list(self.phrases.keys())
-        matches = process.extract(phrase, choices)
-        matches = [m[0] for m in matches if m[1] >= min_ratio]
-        return self.get(matches, indexes=['phrase'], operator='or')
+        return self._extern(self._find_fuzzy('phrase', phrase, min_ratio))
 
     def _get_phrases(self, phrases: list, operator: str='and', fuzzy: bool=False):
         return self._get_multiples('phrase', phrases, operator, fuzzy)
 
+    def _get_prefix(self, prefix):
+        return self._extern(self._find('prefix', prefix))
+
+    def _get_prefixes(self, prefixes: list, operator: str='and', fuzzy: bool=False):
+        return self._get_multiples('prefix', prefixes, operator, fuzzy)
+
     def _get_substring(self, substring):
-        try:
-            result = self.substrings[substring]
-        except KeyError:
-            return []
-        else:
-            return list(result)
+        return self._extern(self._find('substring', substring))
 
     def _get_substring_fuzzy(self, substring, min_ratio: int=70):
-        if not isinstance(substring, str):
-            raise TypeError(type(substring))
-        choices = list(self.substrings.keys())
-        matches = process.extract(substring, choices)
-        matches = [m[0] for m in matches if m[1] >= min_ratio]
-        return self.get(matches, indexes=['substring'], operator='or')
+        return self._extern(self._find_fuzzy('substring', substring, min_ratio))
 
     def _get_substrings(self, substrings: list, operator: str='and', fuzzy: bool=False):
         return self._get_multiples('substring', substrings, operator, fuzzy)
 
     def _get_value(self, value: str):
-        try:
-            result = self.values[value]
-        except KeyError:
-            return []
-        else:
-            return list(result)
+        return self._extern(self._find('value', value))
 
     def _get_value_fuzzy(self, value: str, min_ratio: int=70):
-        if not isinstance(value, str):
-            raise TypeError(type(value))
-        choices = list(self.values.keys())
-        matches = process.extract(value, choices)
-        matches = [m[0] for m in matches if m[1] >= min_ratio]
-        return self.get(matches, indexes=['value'], operator='or')
+        return self._extern(self._find_fuzzy('value', value, min_ratio))
 
     def _get_values(self, values: list, operator: str='and', fuzzy: bool=False):
         return self._get_multiples('value', values, operator, fuzzy)
 
     def _get_word(self, word):
-        try:
-            result = self.words[word]
-        except KeyError:
-            return []
-        else:
-            return list(result)
+        return self._extern(self._find('word', word))
 
     def _get_word_fuzzy(self, word: str, min_ratio: int=70):
-        if not isinstance(word, str):
-            raise TypeError(type(word))
-        choices = list(self.words.keys())
-        matches = process.extract(word, choices)
-        matches = [m[0] for m in matches if m[1] >= min_ratio]
-        return self.get(matches, indexes=['word'], operator='or')
+        return self._extern(self._find_fuzzy('word', word, min_ratio))
 
     def _get_words(self, words: list, operator: str='and', fuzzy: bool=False):
         return self._get_multiples('word', words, operator, fuzzy)
 
     def _get_multiples(self, index: str, values: list, operator: str='and', fuzzy: bool=False):
+        return self._extern(self._find_multiples(index, values, operator, fuzzy))
+
+    def _find_multiples(self, index: str, values: list, operator: str='and', fuzzy: bool=False):
         results = {}
         for value in values:
             if fuzzy:
-                r = getattr(self, f'_get_{index}_fuzzy')(value)
+                r = self._find_fuzzy(index, value)
             else:
-                r = getattr(self, f'_get_{index}')(value)
+                r = self._find(index, value)
             if r:
                 results[value] = r
         if len(values) != len(results) and operator == 'and':
-            return []
+            return self._postings()
         matches = None
-        for value, ids in results.items():
+        for value, docs in results.items():
             if matches is None:
-                matches = set(ids)
+                matches = docs
             elif not fuzzy and operator == 'and':
-                matches = matches.intersection(ids)
+                matches = matches & docs
             elif fuzzy or operator == 'or':
-                matches.update(ids)
+                matches = matches | docs
         if matches is None:
-            return []
-        return list(matches)
\ No newline at end of file
+            return self._postings()
+        return matches
@@ -15,22 +15,26 @@ from pathlib import Path
 import re
 
 logger = logging.getLogger(__name__)
+rx_top = re.compile(r'^top:(?P<k>\d+)$')
 
 class Manager:
 
-    def __init__(self):
+    def __init__(self, index_options: dict=None, fields: list=None):
         self.gaz = None
+        self.index_options = index_options
+        self.fields = fields
         self._context = None
         self._alignments = None
         self._reviewed = []
 
-    def _ordered_list(self, objs: dict, include_id=False, prefix=''):
+    def _ordered_list(self, objs: dict, include_id=False, prefix='', ranked=False):
         try:
             entries = [(id, obj.label, type(obj).__name__) for id, obj in objs.items()]
         except AttributeError:
             entries = [(id, str(obj), type(obj).__name__) for id, obj in objs.items()]
-        rx = re.compile(r'[,\(\)\s]+')
-        entries.sort(key=lambda x: rx.sub('', x[1]).lower())
+        if not ranked:
+            rx = re.compile(r'[,\(\)\s]+')
+            entries.sort(key=lambda x: rx.sub('', x[1]).lower())
         self._context = OrderedDict()
         for i, entry in enumerate(entries):
             self._context[str(i+1)] = entry
@@ -82,13 +86,22 @@ class Manager:
         fuzzy = False
         if 'fuzzy' in options:
             fuzzy = True
-        sa = SelfAligner(gaz=self.gaz, text={'fuzzy': fuzzy})
+        if 'minhash' in options:
+            minhash = {}
+            for option in options:
+                try:
+                    minhash['threshold'] = float(option)
+                except ValueError:
+                    continue
+            sa = SelfAligner(gaz=self.gaz, minhash=minhash)
+        else:
+            sa = SelfAligner(gaz=self.gaz, text={'fuzzy': fuzzy, 'phonetic': 'phonetic' in options})
+        alignments = sa.align_objects(list(self.gaz.contents.values()))
         results = {}
         candidates = []
         prior_match_batches = set()
-        for id, obj in self.gaz.contents.items():
+        for (id, obj), matches in zip(self.gaz.contents.items(), alignments):
             candidate = (id, obj.label, type(obj).__name__)
-            matches = sa.align_object(obj)
             if matches:
                 match_batch = [*matches, id]
                 match_batch.sort()
@@ -113,6 +126,12 @@ class Manager:
             msg += ' Use "review self matches" to merge matches selectively.'
         return msg
 
+    def complete(self, prefix: str, k: int=10):
+        """List up to k indexed words starting with prefix, for completing "find" arguments."""
+        if self.gaz is None:
+            return []
+        return self.gaz.complete(prefix, k)
+
     def contents(self):
         if self.gaz is None:
             return 'No gazetteer is loaded.'
@@ -143,9 +162,23 @@ class Manager:
         return f'{label}\n{obj.json()}'
 
     def find(self, targets):
+        """Find objects matching any of targets; a "top:N" target lists the N best matches, best first."""
         if self.gaz is None:
             return 'No gazetteer is loaded.'
-        entries = self.gaz.get({'text': targets}, operator='or')
+        if isinstance(targets, str):
+            targets = [targets,]
+        k = None
+        terms = []
+        for target in targets:
+            m = rx_top.match(target)
+            if m:
+                k = int(m.group('k'))
+            else:
+                terms.append(target)
+        if k is not None:
+            entries = self.gaz.search(' '.join(terms), k)
+            return self._ordered_list(entries, ranked=True)
+        entries = self.gaz.get({'text': terms}, operator='or')
         return self._ordered_list(entries)
 
     def json(self):
@@ -177,7 +210,13 @@ class Manager:
             else:
                 raise NotImplementedError(input_format)
         del f
-        self.gaz = Gazetteer(data)
+        # a snapshot saved alongside the file is used unless the file has changed since
+        index_path = path.with_name(path.name + '.idx')
+        if input_format != 'json' or not index_path.exists() or index_path.stat().st_mtime < path.stat().st_mtime:
+            index_path = None
+        # objects are all stored before anything is indexed
+        self.gaz = Gazetteer(index_options=self.index_options, fields=self.fields)
+        self.gaz.add_many(data, index_path=index_path)
         return f'Read {len(self.gaz.contents)} objects from {path}.'
 
     def merge(self, context_numbers: list):
@@ -289,8 +328,51 @@ class Manager:
         with open(path, 'w', encoding='utf-8') as f:
             f.write(result)
         del f
+        if output_format == 'json':
+            try:
+                self.gaz.save_index(path.with_name(path.name + '.idx'))
+            except NotImplementedError as err:
+                logger.warning(f'No index snapshot saved: {err}')
         return f'Saved {len(self.gaz.contents)} objects to {path}.'
 
+    def stats(self):
+        """Summarize the size and cost of the gazetteer's indexes."""
+        if self.gaz is None:
+            return 'No gazetteer is loaded.'
+        stats = self.gaz.stats()
+        msg = [f'There are {stats["objects"]} objects in the gazetteer.']
+        for name, s in stats['indexes'].items():
+            msg.append(f'Index "{name}" ({s["ids"]} ids):')
+            for idx_name, i in s['indexes'].items():
+                if not i['built']:
+                    msg.append(f'\t{idx_name}: not built')
+                    continue
+                largest = ', '.join([f'{key} ({n})' for key, n in i['largest']])
+                msg.append(
+                    f'\t{idx_name}: {i["keys"]} keys, {i["postings"]} postings, '
+                    f'~{i["bytes"]} bytes; largest: {largest}')
+            msg.append(
+                f'\treverse: {s["reverse"]["documents"]} documents, {s["reverse"]["keys"]} keys, '
+                f'~{s["reverse"]["bytes"]} bytes')
+            try:
+                snapshot = s['snapshot']
+            except KeyError:
+                pass
+            else:
+                msg.append(
+                    f'\tsnapshot: {snapshot["documents"]} documents ({snapshot["dropped"]} dropped), '
+                    f'{snapshot["bytes"]} bytes mapped')
+            try:
+                shards = s['shards']
+            except KeyError:
+                pass
+            else:
+                msg.append(f'\tshards: {len(shards)}, holding ' + ', '.join([f'{shard["ids"]}' for shard in shards]) + ' ids')
+            c = s['cache']
+            msg.append(
+                f'\tcache: {c["hits"]} hits, {c["misses"]} misses, {c["size"]} of {c["maxsize"]} entries')
+        return '\n'.join(msg)
+
     def str(self):
         """Get string representation of gazetteer."""
         if self.gaz is None:
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MinHash signatures and locality-sensitive hashing
+"""
+
+import logging
+from random import Random
+from zlib import crc32
+
+logger = logging.getLogger(__name__)
+
+_PRIME = (1 << 61) - 1
+
+
+def shingles(strings: list, n: int=3):
+    """Collect the padded, lowercased character n-grams of one or more strings."""
+    result = set()
+    for s in strings:
+        padded = f' {s.lower()} '
+        result.update(padded[i:i+n] for i in range(max(len(padded) - n + 1, 1)))
+    return result
+
+
+def choose_bands(num_perm: int, threshold: float):
+    """Pick the band count whose LSH similarity threshold, (1/b)^(1/r), lies nearest threshold."""
+    best = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands)
+    return best[1]
+
+
+class MinHashLSH:
+    """
+    Find near-duplicate keys by banded locality-sensitive hashing of MinHash signatures.
+
+    Each key is described by a set of shingles. Its signature keeps, for each of
+    num_perm random hash functions, the minimum hash over the shingles. The fraction
+    of equal signature positions estimates the Jaccard similarity of two shingle sets.
+    Signatures are cut into bands, and keys sharing any band fall in the same bucket.
+    Only keys that share a bucket are compared, so pairs are found in roughly linear
+    time. Candidates below threshold (by estimated similarity) are discarded.
+    """
+
+    def __init__(self, threshold: float=0.5, num_perm: int=64, bands: int=None, seed: int=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        if bands is None:
+            bands = choose_bands(num_perm, threshold)
+        if num_perm % bands:
+            raise ValueError(f'num_perm ({num_perm}) must be a multiple of bands ({bands})')
+        self.bands = bands
+        self.rows = num_perm // bands
+        rand = Random(seed)
+        self._permutations = [
+            (rand.randrange(1, _PRIME), rand.randrange(0, _PRIME)) for i in range(num_perm)]
+        self.signatures = {}
+        self.buckets = [{} for i in range(bands)]
+
+    def signature(self, features: set):
+        hashes = [crc32(f.encode('utf-8')) for f in features]
+        if not hashes:
+            return tuple([_PRIME] * self.num_perm)
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self._permutations)
+
+    def _band_keys(self, signature: tuple):
+        return [signature[i * self.rows:(i + 1) * self.rows] for i in range(self.bands)]
+
+    def add(self, key: str, features: set):
+        if key in self.signatures:
+            self.discard(key)
+        signature = self.signature(features)
+        self.signatures[key] = signature
+        for bucket, band in zip(self.buckets, self._band_keys(signature)):
+            try:
+                bucket[band].add(key)
+            except KeyError:
+                bucket[band] = {key}
+
+    def discard(self, key: str):
+        try:
+            signature = self.signatures.pop(key)
+        except KeyError:
+            return
+        for bucket, band in zip(self.buckets, self._band_keys(signature)):
+            bucket[band].discard(key)
+            if len(bucket[band]) == 0:
+                bucket.pop(band)
+
+    def similarity(self, key1: str, key2: str):
+        s1 = self.signatures[key1]
+        s2 = self.signatures[key2]
+        return sum(1 for a, b in zip(s1, s2) if a == b) / self.num_perm
+
+    def query(self, key: str):
+        signature = self.signatures[key]
+        candidates = set()
+        for bucket, band in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket[band])
+        candidates.discard(key)
+        return [c for c in candidates if self.similarity(key, c) >= self.threshold]
+
+    def candidate_pairs(self):
+        seen = set()
+        for bucket in self.buckets:
+            for keys in bucket.values():
+                if len(keys) < 2:
+                    continue
+                keys = sorted(keys)
+                for i, key1 in enumerate(keys):
+                    for key2 in keys[i+1:]:
+                        if (key1, key2) in seen:
+                            continue
+                        seen.add((key1, key2))
+                        if self.similarity(key1, key2) >= self.threshold:
+                            yield (key1, key2)
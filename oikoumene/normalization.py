@@ -4,10 +4,52 @@
 Normalization
 """
 
+from functools import lru_cache
 import logging
+from slugify import slugify
 from textnorm import normalize_space, normalize_unicode
+import unicodedata
 
 logger = logging.getLogger(__name__)
 
 def norm(v):
     return normalize_unicode(normalize_space(v), 'NFC')
+
+def fold(v):
+    """
+    Fold a string for accent- and case-insensitive matching.
+
+    Casefolds, decomposes (NFKD) and drops combining marks, drops punctuation and the
+    spacing modifier letters used for ʿayn and hamza, then normalizes space, so that
+    "Ṭūr ʿAbdīn" and "Tur Abdin" both fold to "tur abdin".
+    """
+    decomposed = unicodedata.normalize('NFKD', v.casefold())
+    kept = []
+    for c in decomposed:
+        if unicodedata.combining(c):
+            continue
+        category = unicodedata.category(c)
+        if category[0] == 'P':
+            continue
+        if category == 'Lm' and 'ʰ' <= c <= '˿':
+            continue
+        kept.append(c)
+    return normalize_space(''.join(kept))
+
+def is_latin(v):
+    """Tell whether every letter of a string (other than modifier letters) is in the Latin script."""
+    for c in v:
+        if not c.isalpha() or unicodedata.category(c) == 'Lm':
+            continue
+        if not unicodedata.name(c, '').startswith('LATIN'):
+            return False
+    return True
+
+@lru_cache(maxsize=65536)
+def transliterate(v):
+    """
+    Romanize a string the way _CitedString derives a missing romanized form (slugify), in
+    lower case with words separated by single spaces. Results are cached, since the same
+    names recur across objects and queries.
+    """
+    return slugify(v, separator=' ')
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phonetic codes
+"""
+
+import logging
+from oikoumene.normalization import fold
+
+logger = logging.getLogger(__name__)
+
+VOWELS = 'aeiou'
+SOUNDEX_DIGITS = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6'}
+
+
+def _letters(word: str):
+    return ''.join([c for c in fold(word) if 'a' <= c <= 'z'])
+
+
+def soundex(word: str):
+    """
+    Code word with American Soundex: its first letter and up to three consonant digits.
+
+    Letters are folded to ASCII first, so "Ṭūr" and "Tur" share a code. A word with no
+    Latin letters has no code and yields the empty string.
+    """
+    letters = _letters(word)
+    if not letters:
+        return ''
+    code = [letters[0].upper()]
+    last = SOUNDEX_DIGITS.get(letters[0], '')
+    for c in letters[1:]:
+        digit = SOUNDEX_DIGITS.get(c, '')
+        if digit and digit != last:
+            code.append(digit)
+            if len(code) == 4:
+                break
+        if c not in 'hw':
+            # a vowel separates two consonants with the same digit; h and w do not
+            last = digit
+    return ''.join(code).ljust(4, '0')
+
+
+def metaphone(word: str):
+    """
+    Code word with a reduced Metaphone: consonant sounds, and a leading vowel.
+
+    The common English rules are kept (silent initial letters, soft c and g, ph, sh, th
+    and the like), which is enough to bring together the ad hoc romanizations of one
+    name ("Moontown", "muntaun", "mwntwn"). A word with no Latin letters yields the
+    empty string.
+    """
+    letters = _letters(word)
+    if not letters:
+        return ''
+    for start in ['kn', 'gn', 'pn', 'ae', 'wr']:
+        if letters.startswith(start):
+            letters = letters[1:]
+            break
+    if letters[0] == 'x':
+        letters = 's' + letters[1:]
+    elif letters.startswith('wh'):
+        letters = 'w' + letters[2:]
+    code = []
+    n = len(letters)
+    for i, c in enumerate(letters):
+        before = letters[i-1] if i > 0 else ''
+        after = letters[i+1] if i + 1 < n else ''
+        after2 = letters[i+2] if i + 2 < n else ''
+        if c == before and c != 'c':
+            continue
+        if c in VOWELS:
+            if i == 0:
+                code.append(c.upper())
+        elif c == 'b':
+            if not (before == 'm' and after == ''):
+                code.append('B')
+        elif c == 'c':
+            if after == 'h' or (after == 'i' and after2 == 'a'):
+                code.append('X')
+            elif after in 'iey' and after:
+                if before != 's':
+                    code.append('S')
+            else:
+                code.append('K')
+        elif c == 'd':
+            if after == 'g' and after2 in 'iey' and after2:
+                code.append('J')
+            else:
+                code.append('T')
+        elif c == 'g':
+            if after == 'h' and after2 not in VOWELS:
+                continue
+            if after == 'n' and after2 == '':
+                continue
+            if after in 'iey' and after and before != 'g':
+                code.append('J')
+            else:
+                code.append('K')
+        elif c == 'h':
+            if after in VOWELS and after and before not in 'cgpst':
+                code.append('H')
+        elif c == 'k':
+            if before != 'c':
+                code.append('K')
+        elif c == 'p':
+            code.append('F' if after == 'h' else 'P')
+        elif c == 'q':
+            code.append('K')
+        elif c == 's':
+            if after == 'h' or (after == 'i' and after2 in 'oa' and after2):
+                code.append('X')
+            else:
+                code.append('S')
+        elif c == 't':
+            if after == 'i' and after2 in 'oa' and after2:
+                code.append('X')
+            elif after == 'h':
+                code.append('0')
+            elif not (after == 'c' and after2 == 'h'):
+                code.append('T')
+        elif c == 'v':
+            code.append('F')
+        elif c in 'wy':
+            if after in VOWELS and after:
+                code.append(c.upper())
+        elif c == 'x':
+            code.append('KS')
+        elif c == 'z':
+            code.append('S')
+        else:
+            code.append(c.upper())
+    return ''.join(code)
+
+
+def phonetic_codes(word: str):
+    """List the distinct non-empty Soundex and Metaphone codes of word."""
+    codes = []
+    for code in [soundex(word), metaphone(word)]:
+        if code and code not in codes:
+            codes.append(code)
+    return codes
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phrase indexes
+"""
+
+import logging
+from oikoumene.substrings import _TextTable
+
+logger = logging.getLogger(__name__)
+
+
+class PositionalIndex(_TextTable):
+    """
+    Answer phrase queries from word positions instead of materialized phrases.
+
+    Each word maps to the texts that contain it and the word offsets at which it occurs
+    there, so the index grows linearly with the number of words. A phrase of two or more
+    words matches a text when its words occur there at consecutive offsets.
+    """
+
+    def __init__(self, postings=set):
+        _TextTable.__init__(self, postings)
+        self.positions = {}
+
+    def keys(self):
+        # generated on demand for fuzzy matching; nothing is stored
+        seen = set()
+        for text in self.texts.keys():
+            words = text.split()
+            for start in range(len(words)):
+                for end in range(start + 2, len(words) + 1):
+                    phrase = ' '.join(words[start:end])
+                    if phrase not in seen:
+                        seen.add(phrase)
+                        yield phrase
+
+    def _learn(self, text: str):
+        for position, word in enumerate(text.split()):
+            try:
+                self.positions[word]
+            except KeyError:
+                self.positions[word] = {}
+            try:
+                self.positions[word][text].append(position)
+            except KeyError:
+                self.positions[word][text] = [position]
+
+    def _forget(self, text: str):
+        for word in set(text.split()):
+            self.positions[word].pop(text)
+            if len(self.positions[word]) == 0:
+                self.positions.pop(word)
+
+    def _match(self, query: str):
+        words = query.split()
+        if len(words) < 2 or ' '.join(words) != query:
+            return []
+        try:
+            postings = [self.positions[word] for word in words]
+        except KeyError:
+            return []
+        rarest = min(postings, key=len)
+        matches = []
+        for text in rarest.keys():
+            starts = None
+            for offset, word_positions in enumerate(postings):
+                try:
+                    positions = word_positions[text]
+                except KeyError:
+                    starts = None
+                    break
+                candidates = {p - offset for p in positions}
+                if starts is None:
+                    starts = candidates
+                else:
+                    starts.intersection_update(candidates)
+                if not starts:
+                    break
+            if starts:
+                matches.append(text)
+        return matches
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Postings
+"""
+
+from array import array
+from bisect import bisect_left
+import logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def _view(docs: array):
+    # the contents of an array('I') as a NumPy array, without copying
+    return np.frombuffer(docs, dtype=np.uintc, count=len(docs))
+
+
+class ArrayPostings:
+    """
+    Hold a sorted, duplicate-free list of document numbers in a compact unsigned int array.
+
+    Supports the subset of the set interface StringIndex relies on: add, update, remove,
+    discard, membership, iteration, len, "&" and "|". With NumPy, "&" and "|" and large
+    updates run as vectorized merges; updates of up to INSERT documents are inserted in
+    place.
+    """
+
+    __slots__ = ('docs',)
+    INSERT = 32
+
+    def __init__(self, docs=()):
+        if isinstance(docs, ArrayPostings):
+            self.docs = array('I', docs.docs)
+        else:
+            self.docs = array('I', sorted(set(docs)))
+
+    @classmethod
+    def _wrap(cls, docs: array):
+        p = cls.__new__(cls)
+        p.docs = docs
+        return p
+
+    def add(self, doc: int):
+        i = bisect_left(self.docs, doc)
+        if i == len(self.docs) or self.docs[i] != doc:
+            self.docs.insert(i, doc)
+
+    def update(self, docs):
+        if isinstance(docs, ArrayPostings):
+            other = docs.docs
+        else:
+            other = array('I', sorted(set(docs)))
+        if len(other) == 0:
+            return
+        if len(self.docs) == 0 or self.docs[-1] < other[0]:
+            self.docs.extend(other)
+        elif len(other) <= self.INSERT:
+            for doc in other:
+                self.add(doc)
+        else:
+            self.docs = self._union(self.docs, other)
+
+    @staticmethod
+    def _union(a: array, b: array):
+        if np is not None:
+            mine, other = _view(a), _view(b)
+            positions = np.searchsorted(mine, other)
+            new = positions == len(mine)
+            new[~new] = mine[positions[~new]] != other[~new]
+            return array('I', np.insert(mine, positions[new], other[new]).tobytes())
+        return array('I', sorted(set(a).union(b)))
+
+    def remove(self, doc: int):
+        i = bisect_left(self.docs, doc)
+        if i == len(self.docs) or self.docs[i] != doc:
+            raise KeyError(doc)
+        del self.docs[i]
+
+    def discard(self, doc: int):
+        try:
+            self.remove(doc)
+        except KeyError:
+            pass
+
+    def copy(self):
+        return ArrayPostings(self)
+
+    def __and__(self, other):
+        if not isinstance(other, ArrayPostings):
+            other = ArrayPostings(other)
+        if len(self.docs) <= len(other.docs):
+            small, large = self.docs, other.docs
+        else:
+            small, large = other.docs, self.docs
+        if len(small) == 0:
+            return ArrayPostings()
+        if np is not None:
+            docs = _view(small)
+            positions = np.searchsorted(_view(large), docs)
+            found = positions < len(large)
+            found[found] = _view(large)[positions[found]] == docs[found]
+            return ArrayPostings._wrap(array('I', docs[found].tobytes()))
+        result = array('I')
+        lo = 0
+        hi = len(large)
+        for doc in small:
+            lo = bisect_left(large, doc, lo, hi)
+            if lo == hi:
+                break
+            if large[lo] == doc:
+                result.append(doc)
+        return ArrayPostings._wrap(result)
+
+    def __or__(self, other):
+        if not isinstance(other, ArrayPostings):
+            other = ArrayPostings(other)
+        result = ArrayPostings(self)
+        result.update(other)
+        return result
+
+    def __contains__(self, doc: int):
+        i = bisect_left(self.docs, doc)
+        return i != len(self.docs) and self.docs[i] == doc
+
+    def __eq__(self, other):
+        if isinstance(other, ArrayPostings):
+            return self.docs == other.docs
+        return NotImplemented
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self.docs.__sizeof__()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({list(self.docs)})'
+
+
+def _popcount(bits: int):
+    try:
+        return bits.bit_count()
+    except AttributeError:
+        return bin(bits).count('1')
+
+
+class BitmapPostings:
+    """
+    Hold document numbers in a compressed bitmap in the style of Roaring.
+
+    Document numbers are split on their high 16 bits into containers. A sparse container
+    is a sorted array('H') of the low 16 bits; once it holds more than DENSE entries it
+    becomes a 65536-bit Python int, so "&" and "|" between dense containers are
+    word-parallel integer operations. Updates of up to INSERT documents are added one by
+    one. Supports the same interface as ArrayPostings.
+    """
+
+    __slots__ = ('containers',)
+    DENSE = 4096
+    INSERT = 32
+
+    def __init__(self, docs=()):
+        self.containers = {}
+        if isinstance(docs, BitmapPostings):
+            for high, c in docs.containers.items():
+                if isinstance(c, int):
+                    self.containers[high] = c
+                else:
+                    self.containers[high] = array('H', c)
+        else:
+            self.update(docs)
+
+    @classmethod
+    def _wrap(cls, containers: dict):
+        p = cls.__new__(cls)
+        p.containers = containers
+        return p
+
+    @staticmethod
+    def _card(c):
+        if isinstance(c, int):
+            return _popcount(c)
+        return len(c)
+
+    @staticmethod
+    def _to_bits(c):
+        if isinstance(c, int):
+            return c
+        buffer = bytearray(8192)
+        for low in c:
+            buffer[low >> 3] |= 1 << (low & 7)
+        return int.from_bytes(buffer, 'little')
+
+    @staticmethod
+    def _to_array(bits: int):
+        result = array('H')
+        for i, byte in enumerate(bits.to_bytes(8192, 'little')):
+            if byte:
+                for b in range(8):
+                    if byte >> b & 1:
+                        result.append(i * 8 + b)
+        return result
+
+    @classmethod
+    def _shrink(cls, c):
+        card = cls._card(c)
+        if card == 0:
+            return None
+        if isinstance(c, int):
+            if card <= cls.DENSE:
+                return cls._to_array(c)
+        elif card > cls.DENSE:
+            return cls._to_bits(c)
+        return c
+
+    @classmethod
+    def _and(cls, a, b):
+        if isinstance(a, int) and isinstance(b, int):
+            return cls._shrink(a & b)
+        if isinstance(a, int):
+            a, b = b, a
+        if isinstance(b, int):
+            return cls._shrink(array('H', [low for low in a if b >> low & 1]))
+        return cls._shrink(array('H', sorted(set(a).intersection(b))))
+
+    @classmethod
+    def _or(cls, a, b):
+        if isinstance(a, int) or isinstance(b, int):
+            return cls._to_bits(a) | cls._to_bits(b)
+        return cls._shrink(array('H', sorted(set(a).union(b))))
+
+    def add(self, doc: int):
+        high, low = doc >> 16, doc & 0xFFFF
+        try:
+            c = self.containers[high]
+        except KeyError:
+            self.containers[high] = array('H', [low])
+            return
+        if isinstance(c, int):
+            self.containers[high] = c | (1 << low)
+            return
+        i = bisect_left(c, low)
+        if i == len(c) or c[i] != low:
+            c.insert(i, low)
+            if len(c) > self.DENSE:
+                self.containers[high] = self._to_bits(c)
+
+    def update(self, docs):
+        if not isinstance(docs, (BitmapPostings, list, tuple, set, frozenset)):
+            docs = list(docs)
+        if len(docs) <= self.INSERT:
+            # a few documents are set in their containers directly
+            for doc in docs:
+                self.add(doc)
+            return
+        if isinstance(docs, BitmapPostings):
+            other = docs
+        else:
+            grouped = {}
+            for doc in docs:
+                try:
+                    grouped[doc >> 16].add(doc & 0xFFFF)
+                except KeyError:
+                    grouped[doc >> 16] = {doc & 0xFFFF}
+            other = BitmapPostings._wrap({
+                high: self._shrink(array('H', sorted(lows))) for high, lows in grouped.items()})
+        for high, c in other.containers.items():
+            try:
+                mine = self.containers[high]
+            except KeyError:
+                if isinstance(c, int):
+                    self.containers[high] = c
+                else:
+                    self.containers[high] = array('H', c)
+            else:
+                self.containers[high] = self._or(mine, c)
+
+    def remove(self, doc: int):
+        high, low = doc >> 16, doc & 0xFFFF
+        if doc not in self:
+            raise KeyError(doc)
+        c = self.containers[high]
+        if isinstance(c, int):
+            c = self._shrink(c & ~(1 << low))
+        else:
+            del c[bisect_left(c, low)]
+            c = self._shrink(c)
+        if c is None:
+            self.containers.pop(high)
+        else:
+            self.containers[high] = c
+
+    def discard(self, doc: int):
+        try:
+            self.remove(doc)
+        except KeyError:
+            pass
+
+    def copy(self):
+        return BitmapPostings(self)
+
+    def __and__(self, other):
+        if not isinstance(other, BitmapPostings):
+            other = BitmapPostings(other)
+        if len(self.containers) <= len(other.containers):
+            small, large = self.containers, other.containers
+        else:
+            small, large = other.containers, self.containers
+        result = {}
+        for high, c in small.items():
+            try:
+                r = self._and(c, large[high])
+            except KeyError:
+                continue
+            if r is not None:
+                result[high] = r
+        return BitmapPostings._wrap(result)
+
+    def __or__(self, other):
+        if not isinstance(other, BitmapPostings):
+            other = BitmapPostings(other)
+        result = BitmapPostings(self)
+        result.update(other)
+        return result
+
+    def __bool__(self):
+        return len(self.containers) > 0
+
+    def __contains__(self, doc: int):
+        try:
+            c = self.containers[doc >> 16]
+        except KeyError:
+            return False
+        low = doc & 0xFFFF
+        if isinstance(c, int):
+            return bool(c >> low & 1)
+        i = bisect_left(c, low)
+        return i != len(c) and c[i] == low
+
+    def __eq__(self, other):
+        if isinstance(other, BitmapPostings):
+            return self.containers == other.containers
+        return NotImplemented
+
+    def __iter__(self):
+        for high in sorted(self.containers):
+            c = self.containers[high]
+            if isinstance(c, int):
+                c = self._to_array(c)
+            base = high << 16
+            for low in c:
+                yield base | low
+
+    def __len__(self):
+        return sum(self._card(c) for c in self.containers.values())
+
+    def __sizeof__(self):
+        return (
+            object.__sizeof__(self) + self.containers.__sizeof__()
+            + sum(c.__sizeof__() for c in self.containers.values()))
+
+    def __repr__(self):
+        return f'{type(self).__name__}({list(self)})'
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prefix indexes
+"""
+
+from bisect import bisect_left, insort
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PrefixIndex:
+    """
+    Keep index keys in a sorted list so that the keys sharing a prefix can be found by bisection.
+
+    A key may be registered more than once (for example, a one-word value is both a value
+    and a word); it stays in the list until every registration has been discarded.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self._counts = {}
+
+    def add(self, key: str):
+        try:
+            self._counts[key] += 1
+        except KeyError:
+            self._counts[key] = 1
+            insort(self.keys, key)
+
+    def update(self, keys):
+        """Register many keys, re-sorting once rather than inserting each in place."""
+        new = []
+        for key in keys:
+            try:
+                self._counts[key] += 1
+            except KeyError:
+                self._counts[key] = 1
+                new.append(key)
+        if len(new) > 0:
+            self.keys.extend(new)
+            self.keys.sort()
+
+    def discard(self, key: str):
+        try:
+            self._counts[key] -= 1
+        except KeyError:
+            return
+        if self._counts[key] == 0:
+            self._counts.pop(key)
+            del self.keys[bisect_left(self.keys, key)]
+
+    def match(self, prefix: str):
+        start = bisect_left(self.keys, prefix)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(prefix):
+            end += 1
+        return self.keys[start:end]
+
+    def __contains__(self, key: str):
+        return key in self._counts
+
+    def __len__(self):
+        return len(self.keys)
@@ -56,7 +56,11 @@ class Serializeable(SerializeJSON):
         for n in field_names:
             v = getattr(self, n)
             if isinstance(v, set):
-                v = list(v)
+                # sorted, so that equal objects serialize alike
+                try:
+                    v = sorted(v)
+                except TypeError:
+                    v = list(v)
             d[n] = v
         return d
 
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sharded indexes
+"""
+
+from collections import Counter, defaultdict
+from copy import copy
+from fuzzywuzzy import process
+from heapq import nlargest, nsmallest
+import logging
+from math import log
+from multiprocessing import Pipe, Process
+from oikoumene.fuzzy import NgramVectors
+from oikoumene.indexing import StringIndex, _derive
+from oikoumene.normalization import norm
+import weakref
+from zlib import crc32
+
+logger = logging.getLogger(__name__)
+
+# keys kept by a fuzzy scan, best first (as fuzzywuzzy's process.extract keeps by default)
+SCAN_LIMIT = 5
+
+
+def _serve(conn, options: dict):
+    """Answer (method name, arguments) requests with the methods of one shard until told to stop."""
+    index = _ShardIndex(**options)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        name, args = request
+        try:
+            conn.send((True, getattr(index, name)(*args)))
+        except Exception as err:
+            conn.send((False, err))
+    conn.close()
+
+
+def _stop(conns: list, processes: list):
+    # ask each shard process to finish, then wait for it
+    for conn in conns:
+        try:
+            conn.send(None)
+        except (OSError, ValueError):
+            pass
+        conn.close()
+    for process in processes:
+        process.join(5)
+        if process.is_alive():
+            process.terminate()
+
+
+class _ShardIndex(StringIndex):
+    """
+    A StringIndex with the parts of queries that a ShardedStringIndex hands its shards.
+
+    A fuzzy scan breaks score ties by the order in which keys were first added, so with
+    the scan fuzzy mode each key keeps a stamp of its first addition to the whole index:
+    (request, position of the value in its batch, position of the key in the value).
+    """
+
+    def __init__(self, **options):
+        self._stamps = defaultdict(dict)
+        StringIndex.__init__(self, **options)
+        self._stamped = self.fuzzy_mode == 'scan'
+
+    def _add_stamped(self, request: int, items: list):
+        # add_many() with (value, ids, position) items, stamping the keys they add
+        self.add_many([(value, ids) for value, ids, position in items])
+        if not self._stamped:
+            return
+        for idx_name in self._built:
+            stamps = self._stamps[idx_name]
+            derived = isinstance(getattr(self, idx_name), dict)
+            for value, ids, position in items:
+                value = norm(value).lower()
+                for i, key in enumerate(_derive(idx_name, value) if derived else [value]):
+                    if key not in stamps:
+                        stamps[key] = (request, position, i)
+
+    def _build(self, idx_name):
+        # a sub-index built late takes its keys in the order of the values they come from
+        if idx_name in self._built:
+            return
+        StringIndex._build(self, idx_name)
+        if not self._stamped:
+            return
+        stamps = self._stamps[idx_name]
+        derived = isinstance(getattr(self, idx_name), dict)
+        for value, value_stamp in self._stamps['values'].items():
+            for i, key in enumerate(_derive(idx_name, value) if derived else [value]):
+                stamp = value_stamp[:2] + (i,)
+                if key not in stamps or stamp < stamps[key]:
+                    stamps[key] = stamp
+
+    def _drop_stamped(self, ids: list):
+        # drop() returning the stamps of the keys no document here holds any more, by sub-index
+        if not self._stamped or not isinstance(ids, list):
+            self.drop(ids)
+            return {}
+        held = defaultdict(set)
+        for id in ids:
+            for idx_name, keys in self.reverse.get(self._doc_numbers.get(id), {}).items():
+                held[idx_name].update(keys)
+        self.drop(ids)
+        removed = {}
+        for idx_name, keys in held.items():
+            idx = getattr(self, idx_name)
+            stamps = self._stamps[idx_name]
+            gone = {key: stamps.pop(key) for key in keys if key not in idx}
+            if gone:
+                removed[idx_name] = gone
+        return removed
+
+    def _restamp(self, removed: dict):
+        # keys that other shards no longer hold date from when they were first added anywhere
+        for idx_name, gone in removed.items():
+            stamps = self._stamps[idx_name]
+            for key, stamp in gone.items():
+                if key in stamps and stamp < stamps[key]:
+                    stamps[key] = stamp
+
+    def _key_stamps(self, idx_name: str):
+        # the stamp of every key of a sub-index; tables of whole texts make their keys from
+        # each text in turn
+        self._build(idx_name)
+        idx = getattr(self, idx_name)
+        stamps = self._stamps[idx_name]
+        if isinstance(idx, dict):
+            return stamps
+        keys = {}
+        table = copy(idx)
+        for text in idx.texts.keys():
+            table.texts = {text: None}
+            for i, key in enumerate(table.keys()):
+                stamp = stamps[text][:2] + (i,)
+                if key not in keys or stamp < keys[key]:
+                    keys[key] = stamp
+        return keys
+
+    def _scan(self, index: str, value: str):
+        # the best (negated score, stamp, key) triples here, ranked as process.extract ranks
+        # the keys of one index holding every id
+        stamps = self._key_stamps(f'{index}s')
+        scored = process.extractWithoutOrder(value, list(stamps.keys()))
+        return nsmallest(SCAN_LIMIT, [(-score, stamps[key], key) for key, score in scored])
+
+    def _key_list(self, idx_name: str):
+        return list(self._keys(idx_name))
+
+    def _fuzzy_candidates(self, pairs: list):
+        # for each (index, value): scored scan keys, keys within max_distance, or for the
+        # phonetic index the value itself if it matches here
+        candidates = []
+        for index, value in pairs:
+            if index == 'phonetic':
+                candidates.append([value] if self._find_phonetic_fuzzy(value) else [])
+            elif self.fuzzy_mode == 'scan':
+                candidates.append(self._scan(index, self._prepare(index, value)))
+            else:
+                candidates.append(self._fuzzy_engine(f'{index}s').search(self._prepare(index, value), self.max_distance))
+        return candidates
+
+    def _find_matched(self, index: str, keys: list):
+        if index == 'phonetic':
+            found = self._postings()
+            for value in keys:
+                found = found | self._find_phonetic_fuzzy(value)
+            return found
+        return self._find_indexes(keys, [index], 'or', False)
+
+    def _get_matched(self, values: list, indexes: list, operator: str, matched: dict):
+        # get() with the keys of the fuzzy indexes already matched, as {index: keys}
+        exact = [idx for idx in indexes if idx not in matched]
+        if not exact:
+            matches = None
+        elif operator == 'and':
+            matches = self._plan(values, exact, False)
+        else:
+            matches = self._find_indexes(values, exact, 'or', False)
+        for idx, keys in matched.items():
+            found = self._find_matched(idx, keys)
+            if matches is None:
+                matches = found
+            elif operator == 'and':
+                matches = matches & found
+            else:
+                matches = matches | found
+        if matches is None:
+            return []
+        return self._extern(matches)
+
+    def _get_batch_matched(self, values: list, indexes: list, matched: list):
+        # get_batch() with the fuzzy keys of each value already matched, as {index: keys}
+        results = []
+        for value, value_matched in zip(values, matched):
+            docs = self._postings()
+            for idx in indexes:
+                try:
+                    docs = docs | self._find_matched(idx, value_matched[idx])
+                except KeyError:
+                    docs = docs | self._find(idx, value)
+            results.append(self._extern(docs))
+        return results
+
+    def _search_frequencies(self, terms: list):
+        # the document frequency of each search term and the corpus lengths, keeping the
+        # documents for _search_rank()
+        self._search_found = [self._find(index, term) for index, term, weight in terms]
+        return ([len(docs) for docs in self._search_found], self._corpus_lengths())
+
+    def _search_rank(self, weights: list, average: float, k: int, k1: float, b: float):
+        weighted = [(w, docs) for w, docs in zip(weights, self._search_found) if len(docs) > 0]
+        self._search_found = None
+        if not weighted:
+            return []
+        return self._rank(weighted, average, k, k1, b)
+
+
+class ShardedStringIndex:
+    """
+    Spread the ids of a StringIndex over several shards, each a StringIndex kept by its own
+    process.
+
+    Each id belongs to the shard picked by the CRC-32 of its UTF-8 bytes, so the same id
+    always lands in the same shard, in every process and run. All the keys of an id are
+    kept by its shard, so a query is sent to every shard at once and their answers are
+    joined. Fuzzy keys are chosen among the candidates of all shards, and ranked search
+    and completion combine the statistics of all shards, so that every query gives what
+    one StringIndex holding every id would give.
+
+    Other keyword arguments configure each shard as they would a StringIndex. close()
+    stops the shard processes, as does discarding the index.
+    """
+
+    def __init__(self, shards: int=4, **options):
+        if shards < 1:
+            raise ValueError(shards)
+        # an empty index configured like the shards checks the options and prepares queries
+        self._template = StringIndex(**options)
+        self.indexes = self._template.indexes
+        self.default_indexes = self._template.default_indexes
+        self.shards = shards
+        self.generation = 0
+        # tfidf engines over the keys of all shards, by sub-index name, with their generation
+        self._fuzzy = {}
+        self._conns = []
+        processes = []
+        for i in range(shards):
+            conn, child = Pipe()
+            process = Process(target=_serve, args=(child, options))
+            process.start()
+            child.close()
+            self._conns.append(conn)
+            processes.append(process)
+        self._stop = weakref.finalize(self, _stop, self._conns, processes)
+
+    def close(self):
+        """Stop the shard processes."""
+        self._stop()
+
+    def _call(self, calls: dict):
+        # send each shard its (method name, arguments) before reading any answer
+        for i, call in calls.items():
+            self._conns[i].send(call)
+        answers = {}
+        error = None
+        for i in calls.keys():
+            ok, answer = self._conns[i].recv()
+            if ok:
+                answers[i] = answer
+            elif error is None:
+                error = answer
+        if error is not None:
+            raise error
+        return answers
+
+    def _call_all(self, name: str, *args):
+        answers = self._call({i: (name, args) for i in range(self.shards)})
+        return [answers[i] for i in range(self.shards)]
+
+    def _shard(self, id: str):
+        return crc32(id.encode('utf-8')) % self.shards
+
+    def _split(self, ids: list):
+        # ids grouped by their shard, in order of first appearance
+        if isinstance(ids, str):
+            real_ids = [ids,]
+        elif isinstance(ids, list):
+            real_ids = ids
+        else:
+            raise TypeError(type(ids))
+        groups = {}
+        for id in real_ids:
+            groups.setdefault(self._shard(id), []).append(id)
+        return groups
+
+    def add(self, value: str, ids: list):
+        if not isinstance(value, str):
+            raise TypeError(type(value))
+        self.generation += 1
+        self._call({
+            i: ('_add_stamped', (self.generation, [(value, shard_ids, 0)]))
+            for i, shard_ids in self._split(ids).items()})
+
+    def add_many(self, items):
+        """Add an iterable of (value, ids) pairs, handing each shard its part in one batch."""
+        batches = {}
+        for position, (value, ids) in enumerate(items):
+            if not isinstance(value, str):
+                raise TypeError(type(value))
+            for i, shard_ids in self._split(ids).items():
+                batches.setdefault(i, []).append((value, shard_ids, position))
+        self.generation += 1
+        self._call({i: ('_add_stamped', (self.generation, batch)) for i, batch in batches.items()})
+
+    def drop(self, ids: list):
+        self.generation += 1
+        answers = self._call({i: ('_drop_stamped', (shard_ids,)) for i, shard_ids in self._split(ids).items()})
+        # a key a shard no longer holds may still be held by another, since its first addition
+        removed = {}
+        for answer in answers.values():
+            for idx_name, gone in answer.items():
+                merged = removed.setdefault(idx_name, {})
+                for key, stamp in gone.items():
+                    if key not in merged or stamp < merged[key]:
+                        merged[key] = stamp
+        if removed:
+            self._call_all('_restamp', removed)
+
+    def get(self, values: list, indexes: list=None, operator: str='and', fuzzy=False):
+        if indexes is None:
+            indexes = self.default_indexes
+        if isinstance(values, str):
+            real_values = [values,]
+        elif isinstance(values, list):
+            real_values = values
+        else:
+            raise TypeError(type(values))
+        if operator not in ['and', 'or']:
+            raise ValueError(operator)
+        real_values = [v.lower() for v in real_values]
+        if isinstance(fuzzy, list):
+            fuzzy_indexes = [idx for idx in indexes if idx in fuzzy]
+        elif fuzzy:
+            fuzzy_indexes = list(indexes)
+        else:
+            fuzzy_indexes = []
+        if fuzzy_indexes:
+            matched = self._match([(idx, value) for idx in fuzzy_indexes for value in real_values])
+            # as in StringIndex, each value must match something in each fuzzy index
+            if operator == 'and' and not all(matched.values()):
+                return []
+            keys = {
+                idx: list(dict.fromkeys([key for value in real_values for key in matched[(idx, value)]]))
+                for idx in fuzzy_indexes}
+            answers = self._call_all('_get_matched', real_values, indexes, operator, keys)
+        else:
+            answers = self._call_all('get', real_values, indexes, operator, False)
+        return [id for answer in answers for id in answer]
+
+    def get_batch(self, values: list, indexes: list=['value'], fuzzy=False):
+        """Look up each of several values on its own; return one list of ids per value."""
+        real_values = [v.lower() for v in values]
+        if fuzzy:
+            matched = self._match([(idx, value) for value in real_values for idx in indexes])
+            keys = [{idx: matched[(idx, value)] for idx in indexes} for value in real_values]
+            answers = self._call_all('_get_batch_matched', real_values, indexes, keys)
+        else:
+            answers = self._call_all('get_batch', real_values, indexes, False)
+        results = [[] for v in values]
+        for answer in answers:
+            for result, found in zip(results, answer):
+                result.extend(found)
+        return results
+
+    def _match(self, pairs: list, min_ratio: int=70):
+        # the keys each fuzzy (index, value) pair matches among the keys of all shards
+        for index, value in pairs:
+            if index == 'prefix':
+                raise ValueError('fuzzy prefix search')
+        mode = self._template.fuzzy_mode
+        asked = [(index, value) for index, value in pairs if index == 'phonetic' or mode != 'tfidf']
+        matched = {}
+        if asked:
+            answers = self._call_all('_fuzzy_candidates', asked)
+            for pair, candidates in zip(asked, zip(*answers)):
+                if pair[0] != 'phonetic' and mode == 'scan':
+                    # the best of each shard include the best of all, each with its earliest stamp
+                    best = {}
+                    for shard_candidates in candidates:
+                        for score, stamp, key in shard_candidates:
+                            if key not in best or (score, stamp) < best[key]:
+                                best[key] = (score, stamp)
+                    ranked = nsmallest(SCAN_LIMIT, [(score, stamp, key) for key, (score, stamp) in best.items()])
+                    matched[pair] = [key for score, stamp, key in ranked if -score >= min_ratio]
+                else:
+                    matched[pair] = list(dict.fromkeys([c for shard_candidates in candidates for c in shard_candidates]))
+        for index, value in pairs:
+            if (index, value) not in matched:
+                engine = self._fuzzy_engine(f'{index}s')
+                matched[(index, value)] = engine.search(
+                    self._template._prepare(index, value), self._template.top_k, self._template.min_similarity)
+        return matched
+
+    def _fuzzy_engine(self, idx_name: str):
+        # tfidf weights depend on every key, so the engine is built here from the keys of all shards
+        try:
+            generation, engine = self._fuzzy[idx_name]
+        except KeyError:
+            pass
+        else:
+            if generation == self.generation:
+                return engine
+        keys = dict.fromkeys([key for keys in self._call_all('_key_list', idx_name) for key in keys])
+        engine = NgramVectors(keys)
+        self._fuzzy[idx_name] = (self.generation, engine)
+        return engine
+
+    def search(self, query: str, k: int=10, value_boost: float=2.0, k1: float=1.2, b: float=0.75):
+        """Rank ids against query with BM25 over all shards (see StringIndex.search)."""
+        terms = self._template._search_terms(query, value_boost)
+        answers = self._call_all('_search_frequencies', terms)
+        count = sum([shard_count for frequencies, (shard_count, shard_total) in answers])
+        total = sum([shard_total for frequencies, (shard_count, shard_total) in answers])
+        if count == 0:
+            return []
+        # term weights come from the document frequencies of the whole index
+        weights = []
+        for i, (index, term, weight) in enumerate(terms):
+            frequency = sum([frequencies[i] for frequencies, lengths in answers])
+            weights.append(weight * log(1 + (count - frequency + 0.5) / (frequency + 0.5)))
+        ranked = [
+            (-score, id)
+            for answer in self._call_all('_search_rank', weights, total / count, k, k1, b)
+            for id, score in answer]
+        return [(id, -score) for score, id in nsmallest(k, ranked)]
+
+    def complete(self, prefix: str, k: int=10, indexes: list=['value', 'word']):
+        """List up to k value and/or word keys starting with prefix, most frequent first."""
+        frequencies = Counter()
+        for answer in self._call_all('_completions', prefix, indexes):
+            frequencies.update(answer)
+        ranked = [(-frequency, key) for key, frequency in frequencies.items()]
+        return [key for frequency, key in nsmallest(k, ranked)]
+
+    def options(self):
+        """Return the keyword arguments that would construct an index configured like this one."""
+        return {**self._template.options(), 'shards': self.shards}
+
+    def cache_info(self):
+        """Report result cache hits, misses and size, summed over the shards."""
+        infos = self._call_all('cache_info')
+        return {
+            name: sum([info[name] for info in infos])
+            for name in ['hits', 'misses', 'size', 'maxsize', 'generation']}
+
+    def stats(self, largest: int=5):
+        """
+        Report the sizes StringIndex.stats() reports, summed over the shards, and the
+        statistics of each shard. A key held by several shards is counted in each, and
+        the largest posting lists are found among those each shard reports.
+        """
+        shard_stats = self._call_all('stats', largest)
+        indexes = {}
+        for idx_name in shard_stats[0]['indexes'].keys():
+            parts = [s['indexes'][idx_name] for s in shard_stats]
+            lists = Counter()
+            for part in parts:
+                lists.update(dict(part['largest']))
+            indexes[idx_name] = {
+                'built': all([part['built'] for part in parts]),
+                'keys': sum([part['keys'] for part in parts]),
+                'postings': sum([part['postings'] for part in parts]),
+                'largest': [(key, n) for n, key in nlargest(largest, [(n, key) for key, n in lists.items()])],
+                'bytes': sum([part['bytes'] for part in parts])}
+        fuzzy = Counter()
+        for s in shard_stats:
+            fuzzy.update(s['fuzzy'])
+        return {
+            'ids': sum([s['ids'] for s in shard_stats]),
+            'indexes': indexes,
+            'reverse': {
+                name: sum([s['reverse'][name] for s in shard_stats])
+                for name in ['documents', 'keys', 'bytes']},
+            'prefixes': {
+                name: sum([s['prefixes'][name] for s in shard_stats])
+                for name in ['keys', 'bytes']},
+            'fuzzy': dict(fuzzy),
+            'cache': self.cache_info(),
+            'shards': shard_stats}
+
+    def __contains__(self, id: str):
+        i = self._shard(id)
+        return self._call({i: ('__contains__', (id,))})[i]
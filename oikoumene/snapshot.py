@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk StringIndex snapshots
+"""
+
+from array import array
+import json
+import logging
+import mmap
+import os
+from oikoumene.indexing import _derive, StringIndex
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'OIKIDX01'
+
+
+def _pad(n: int):
+    return (8 - n % 8) % 8
+
+
+def save_snapshot(index: StringIndex, path, fingerprint: str=None):
+    """
+    Write the value, word, phrase and substring keys of index (and its folded keys, when
+    it folds) to a binary snapshot file.
+
+    The file holds a short JSON header followed by 8-byte aligned sections: for each
+    sub-index a block of UTF-8 keys sorted bytewise, an offset table into that block and
+    a parallel offset table into a block of sorted document numbers. Ids are stored once
+    and the values of each document are kept so the document can be re-indexed in memory
+    after loading. Integers are written in native byte order, so a snapshot is only
+    portable between machines of the same architecture.
+
+    fingerprint, if given, is kept in the header (see MappedStringIndex.fingerprint) so
+    that a reader can tell whether the snapshot still matches its source. The file is
+    written beside path and then renamed over it, so an index mapped from the previous
+    snapshot keeps working.
+    """
+    for attr in ['substring_mode', 'phrase_mode']:
+        if getattr(index, attr) != 'exhaustive':
+            raise NotImplementedError(f'snapshot of {attr}={getattr(index, attr)}')
+    idx_names = [f'{name}s' for name in index.indexes]
+    items = {}
+    live = set()
+    for idx_name in idx_names:
+        if idx_name in index._built:
+            table = {key: index._find_key(idx_name, key) for key in index._keys(idx_name)}
+        else:
+            table = _derived(index, idx_name)
+        found = []
+        for key, docs in table.items():
+            if docs:
+                found.append((key.encode('utf-8'), key, sorted(docs)))
+                live.update(docs)
+        found.sort()
+        items[idx_name] = found
+    docs = sorted(live)
+    renumber = {doc: i for i, doc in enumerate(docs)}
+    sections = []
+    ids = [index._ids[doc].encode('utf-8') for doc in docs]
+    sections.append(('id_offsets', _offsets(ids)))
+    sections.append(('ids', b''.join(ids)))
+    doc_values = [[] for doc in docs]
+    for idx_name in idx_names:
+        keys = [k for k, key, d in items[idx_name]]
+        postings = [array('I', [renumber[doc] for doc in d]) for k, key, d in items[idx_name]]
+        sections.append((f'{idx_name}_key_offsets', _offsets(keys)))
+        sections.append((f'{idx_name}_keys', b''.join(keys)))
+        sections.append((f'{idx_name}_posting_offsets', _offsets(postings)))
+        sections.append((f'{idx_name}_postings', b''.join(p.tobytes() for p in postings)))
+        if idx_name == 'values':
+            for i, p in enumerate(postings):
+                for doc in p:
+                    doc_values[doc].append(i)
+    sections.append(('doc_value_offsets', _offsets(doc_values)))
+    sections.append(('doc_values', b''.join(array('I', v).tobytes() for v in doc_values)))
+    header = {
+        'options': index.options(),
+        'docs': len(docs),
+        'counts': {idx_name: len(items[idx_name]) for idx_name in idx_names},
+        'fingerprint': fingerprint,
+        'sections': {}}
+    offset = 0
+    for name, data in sections:
+        header['sections'][name] = [offset, len(data)]
+        offset += len(data) + _pad(len(data))
+    raw_header = json.dumps(header).encode('utf-8')
+    path = Path(path)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(array('Q', [len(raw_header)]).tobytes())
+        f.write(raw_header)
+        f.write(b'\0' * _pad(len(raw_header)))
+        for name, data in sections:
+            f.write(data)
+            f.write(b'\0' * _pad(len(data)))
+    os.replace(tmp, path)
+    logger.debug(f'wrote index snapshot of {len(docs)} ids to {path}')
+
+
+def _derived(index: StringIndex, idx_name: str):
+    # the keys and documents of a sub-index not built yet, derived from the values without building it
+    table = {}
+    for value in index._keys('values'):
+        docs = index._find_key('values', value)
+        for key in _derive(idx_name, value):
+            table.setdefault(key, set()).update(docs)
+    return table
+
+
+def _offsets(blocks: list):
+    offsets = array('Q', [0])
+    for block in blocks:
+        offsets.append(offsets[-1] + len(block))
+    return offsets.tobytes()
+
+
+def load_snapshot(path, **options):
+    """Map a snapshot written by save_snapshot; options override those it was saved with."""
+    return MappedStringIndex(path, **options)
+
+
+class MappedStringIndex(StringIndex):
+    """
+    A StringIndex whose keys and postings are read from a memory-mapped snapshot.
+
+    Lookups binary search the sorted key blocks of the snapshot, so opening one costs
+    little more than reading its ids, and pages of the file are only read as queries touch
+    them. The snapshot itself is never modified: adds and drops go to the ordinary
+    in-memory sub-indexes inherited from StringIndex and to a set of dropped snapshot
+    documents. An id's text is always indexed entirely in one layer; adding text to an id
+    from the snapshot first moves that id's values into memory.
+    """
+
+    def __init__(self, path, **options):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f'{self.path} is not an index snapshot')
+        start = len(MAGIC)
+        header_length = array('Q')
+        header_length.frombytes(self._map[start:start+8])
+        header_length = header_length[0]
+        start += 8
+        header = json.loads(self._map[start:start+header_length].decode('utf-8'))
+        start += header_length + _pad(header_length)
+        kwargs = dict(header['options'])
+        kwargs.update(options)
+        StringIndex.__init__(self, **kwargs)
+        self._views = []
+        self._sections = {}
+        for name, (offset, length) in header['sections'].items():
+            view = memoryview(self._map)[start+offset:start+offset+length]
+            self._views.append(view)
+            if name.endswith('offsets'):
+                view = view.cast('Q')
+                self._views.append(view)
+            elif name.endswith('postings') or name == 'doc_values':
+                view = view.cast('I')
+                self._views.append(view)
+            self._sections[name] = view
+        self._counts = header['counts']
+        # whatever the writer passed to save_snapshot to identify the indexed text, or None
+        self.fingerprint = header.get('fingerprint')
+        self._base_docs = header['docs']
+        # snapshot document numbers are interned first, so they need no translation
+        offsets = self._sections['id_offsets']
+        ids = self._sections['ids']
+        self._intern([
+            str(ids[offsets[i]:offsets[i+1]], 'utf-8') for i in range(self._base_docs)])
+        self._dropped = set()
+        self._base_lengths = None
+
+    def close(self):
+        """Release the mapped snapshot."""
+        for view in reversed(getattr(self, '_views', [])):
+            view.release()
+        self._views = []
+        self._map.close()
+        self._file.close()
+
+    def stats(self, largest: int=5):
+        """Report the in-memory sub-indexes as StringIndex.stats() does, plus the mapped snapshot."""
+        result = StringIndex.stats(self, largest)
+        result['ids'] += self._base_docs - len(self._dropped)
+        result['snapshot'] = {
+            'documents': self._base_docs,
+            'dropped': len(self._dropped),
+            'keys': dict(self._counts),
+            'bytes': len(self._map)}
+        return result
+
+    def __contains__(self, id: str):
+        try:
+            doc = self._doc_numbers[id]
+        except KeyError:
+            return False
+        if doc < self._base_docs and doc not in self._dropped:
+            return True
+        return StringIndex.__contains__(self, id)
+
+    def snapshot_ids(self):
+        """List the ids whose text is still answered from the snapshot."""
+        return [
+            self._ids[doc] for doc in range(self._base_docs) if doc not in self._dropped]
+
+    def add(self, value: str, ids: list):
+        if isinstance(ids, str):
+            self._migrate([ids,])
+        elif isinstance(ids, list):
+            self._migrate(ids)
+        StringIndex.add(self, value, ids)
+
+    def add_many(self, items):
+        items = list(items)
+        for value, ids in items:
+            if isinstance(ids, str):
+                self._migrate([ids,])
+            elif isinstance(ids, list):
+                self._migrate(ids)
+        StringIndex.add_many(self, items)
+
+    def drop(self, ids: list):
+        if isinstance(ids, list):
+            real_ids = ids
+        elif isinstance(ids, str):
+            real_ids = [ids,]
+        else:
+            raise TypeError(type(ids))
+        self.generation += 1
+        for id in real_ids:
+            doc = self._doc_numbers[id]
+            if doc < self._base_docs and doc not in self._dropped:
+                self._dropped.add(doc)
+                self._fuzzy = {}
+            else:
+                StringIndex.drop(self, [id])
+
+    def _release(self, id, doc):
+        # the snapshot still lists the documents it holds, so their numbers are kept
+        if doc >= self._base_docs:
+            StringIndex._release(self, id, doc)
+
+    def _migrate(self, ids: list):
+        for id in ids:
+            try:
+                doc = self._doc_numbers[id]
+            except KeyError:
+                continue
+            if doc >= self._base_docs or doc in self._dropped:
+                continue
+            values = self._doc_values(doc)
+            self._dropped.add(doc)
+            self._fuzzy = {}
+            for value in values:
+                StringIndex.add(self, value, [id])
+
+    def _doc_values(self, doc: int):
+        offsets = self._sections['doc_value_offsets']
+        numbers = self._sections['doc_values'][offsets[doc]:offsets[doc+1]]
+        return [self._base_key('values', i) for i in numbers]
+
+    def _base_key(self, idx_name: str, i: int):
+        offsets = self._sections[f'{idx_name}_key_offsets']
+        return str(self._sections[f'{idx_name}_keys'][offsets[i]:offsets[i+1]], 'utf-8')
+
+    def _base_docs_at(self, idx_name: str, i: int):
+        offsets = self._sections[f'{idx_name}_posting_offsets']
+        docs = self._sections[f'{idx_name}_postings'][offsets[i]:offsets[i+1]]
+        if self._dropped:
+            return [doc for doc in docs if doc not in self._dropped]
+        return docs
+
+    def _bisect(self, idx_name: str, key: bytes):
+        # leftmost position whose key is not less than key
+        offsets = self._sections[f'{idx_name}_key_offsets']
+        keys = self._sections[f'{idx_name}_keys']
+        lo = 0
+        hi = self._counts[idx_name]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[offsets[mid]:offsets[mid+1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _base_position(self, idx_name: str, key: str):
+        # the position of key in the snapshot's sub-index, or None
+        if idx_name not in self._counts:
+            return None
+        encoded = key.encode('utf-8')
+        i = self._bisect(idx_name, encoded)
+        if i == self._counts[idx_name]:
+            return None
+        offsets = self._sections[f'{idx_name}_key_offsets']
+        if self._sections[f'{idx_name}_keys'][offsets[i]:offsets[i+1]].tobytes() != encoded:
+            return None
+        return i
+
+    def _base_find(self, idx_name: str, key: str):
+        i = self._base_position(idx_name, key)
+        if i is None:
+            return []
+        return self._base_docs_at(idx_name, i)
+
+    def _base_prefix(self, idx_name: str, prefix: str):
+        # positions of all keys starting with prefix; a UTF-8 prefix is a byte prefix
+        encoded = prefix.encode('utf-8')
+        offsets = self._sections[f'{idx_name}_key_offsets']
+        keys = self._sections[f'{idx_name}_keys']
+        i = self._bisect(idx_name, encoded)
+        while i < self._counts[idx_name]:
+            if not keys[offsets[i]:offsets[i+1]].tobytes().startswith(encoded):
+                break
+            yield i
+            i += 1
+
+    def _base_length(self, doc: int):
+        if self._base_lengths is None:
+            self._base_lengths = array('I', [
+                sum([len(value.split()) for value in self._doc_values(d)])
+                for d in range(self._base_docs)])
+        return self._base_lengths[doc]
+
+    def _corpus_lengths(self):
+        count, total = StringIndex._corpus_lengths(self)
+        if self._base_docs == 0:
+            return (count, total)
+        self._base_length(0)
+        count += self._base_docs - len(self._dropped)
+        total += sum(self._base_lengths) - sum([self._base_lengths[doc] for doc in self._dropped])
+        return (count, total)
+
+    def _document_length(self, doc: int):
+        if doc < self._base_docs and doc not in self._dropped:
+            return self._base_length(doc)
+        return StringIndex._document_length(self, doc)
+
+    def _document_values(self, doc: int):
+        if doc < self._base_docs and doc not in self._dropped:
+            return self._doc_values(doc)
+        return StringIndex._document_values(self, doc)
+
+    def _keys(self, idx_name):
+        keys = set(StringIndex._keys(self, idx_name))
+        if idx_name in self._counts:
+            for i in range(self._counts[idx_name]):
+                if self._base_docs_at(idx_name, i):
+                    keys.add(self._base_key(idx_name, i))
+        return keys
+
+    def _find_key(self, idx_name: str, key: str):
+        result = StringIndex._find_key(self, idx_name, key)
+        docs = self._base_find(idx_name, key)
+        if len(docs) == 0:
+            return result
+        return result | self._postings(docs)
+
+    def _key_size(self, idx_name: str, key: str):
+        # documents in memory plus those the snapshot lists, counting any since dropped
+        size = StringIndex._key_size(self, idx_name, key)
+        i = self._base_position(idx_name, key)
+        if i is None:
+            return size
+        offsets = self._sections[f'{idx_name}_posting_offsets']
+        return size + offsets[i+1] - offsets[i]
+
+    def _find_prefix(self, prefix: str):
+        result = StringIndex._find_prefix(self, prefix)
+        for idx_name in ['values', 'words']:
+            for i in self._base_prefix(idx_name, prefix):
+                result.update(self._base_docs_at(idx_name, i))
+        return result
+
+    def _completions(self, prefix: str, indexes: list):
+        prefix = prefix.lower()
+        for idx in indexes:
+            self._build(f'{idx}s')
+        keys = set(self.prefixes.match(prefix))
+        for idx in indexes:
+            for i in self._base_prefix(f'{idx}s', prefix):
+                keys.add(self._base_key(f'{idx}s', i))
+        frequencies = {}
+        for key in keys:
+            frequency = sum([len(self._find(idx, key)) for idx in indexes])
+            if frequency > 0:
+                frequencies[key] = frequency
+        return frequencies
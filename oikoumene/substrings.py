@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Substring indexes
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _TextTable:
+    """
+    Map whole (normalized) texts to the ids that carry them.
+
+    Subclasses derive a searchable structure from the texts. They answer the same
+    dictionary operations StringIndex.drop() uses on an ordinary sub-index (item lookup,
+    membership and pop) with the text itself as key.
+    """
+
+    def __init__(self, postings=set):
+        self.texts = {}
+        self._postings = postings
+
+    def add(self, text: str, ids: list):
+        try:
+            self.texts[text]
+        except KeyError:
+            self.texts[text] = self._postings()
+            self._learn(text)
+        self.texts[text].update(ids)
+
+    def find(self, query: str):
+        result = self._postings()
+        for text in self._match(query):
+            try:
+                result.update(self.texts[text])
+            except KeyError:
+                continue
+        return result
+
+    def keys(self):
+        raise NotImplementedError(f'keys() for {type(self).__name__}')
+
+    def pop(self, text: str):
+        ids = self.texts.pop(text)
+        self._forget(text)
+        return ids
+
+    def _learn(self, text: str):
+        pass
+
+    def _forget(self, text: str):
+        pass
+
+    def _match(self, query: str):
+        return []
+
+    def __contains__(self, text: str):
+        return text in self.texts
+
+    def __getitem__(self, text: str):
+        return self.texts[text]
+
+    def __len__(self):
+        return len(self.texts)
+
+
+class _SubstringTable(_TextTable):
+    """Match texts containing a query of at least min_length characters."""
+
+    def __init__(self, min_length: int=2, postings=set):
+        _TextTable.__init__(self, postings)
+        self.min_length = min_length
+
+    def keys(self):
+        # generated on demand for fuzzy matching; nothing is stored
+        seen = set()
+        for text in self.texts.keys():
+            for start in range(len(text)):
+                for end in range(start + self.min_length, len(text) + 1):
+                    substring = text[start:end]
+                    if substring not in seen:
+                        seen.add(substring)
+                        yield substring
+
+
+class SuffixAutomaton(_SubstringTable):
+    """
+    Answer substring queries from a generalized suffix automaton over all texts.
+
+    The automaton has at most 2n states for n characters of text, so memory grows linearly
+    with the indexed text rather than with the square of each value's length. Each state
+    reached at the end of a text prefix records the number of that text; the texts
+    containing a query are the ones recorded anywhere in the suffix-link subtree of the
+    state reached by walking the query from the root.
+
+    Dropped texts are only forgotten by the text table; the automaton is rebuilt once
+    dropped texts outnumber live ones.
+    """
+
+    def __init__(self, min_length: int=2, postings=set):
+        _SubstringTable.__init__(self, min_length, postings)
+        self._reset()
+
+    def _reset(self):
+        self._next = [{}]
+        self._link = [-1]
+        self._len = [0]
+        self._marks = [None]
+        self._children = None
+        self._docs = []
+        self._doc_numbers = {}
+        self._dead = 0
+
+    def _learn(self, text: str):
+        try:
+            self._doc_numbers[text]
+        except KeyError:
+            pass
+        else:
+            # revive a text that was dropped but is still in the automaton
+            self._dead -= 1
+            return
+        doc = len(self._docs)
+        self._docs.append(text)
+        self._doc_numbers[text] = doc
+        last = 0
+        for c in text:
+            last = self._extend(last, c)
+            if self._marks[last] is None:
+                self._marks[last] = []
+            self._marks[last].append(doc)
+        self._children = None
+
+    def _forget(self, text: str):
+        self._dead += 1
+        if self._dead > len(self.texts):
+            self._rebuild()
+
+    def _rebuild(self):
+        texts = list(self.texts.keys())
+        self._reset()
+        for text in texts:
+            self._learn(text)
+
+    def _new_state(self, length: int, link: int, transitions: dict):
+        self._next.append(transitions)
+        self._link.append(link)
+        self._len.append(length)
+        self._marks.append(None)
+        return len(self._len) - 1
+
+    def _clone(self, p: int, q: int, c: str):
+        clone = self._new_state(self._len[p] + 1, self._link[q], dict(self._next[q]))
+        while p != -1 and self._next[p].get(c) == q:
+            self._next[p][c] = clone
+            p = self._link[p]
+        self._link[q] = clone
+        return clone
+
+    def _extend(self, last: int, c: str):
+        try:
+            q = self._next[last][c]
+        except KeyError:
+            pass
+        else:
+            if self._len[last] + 1 == self._len[q]:
+                return q
+            return self._clone(last, q, c)
+        cur = self._new_state(self._len[last] + 1, 0, {})
+        p = last
+        while p != -1 and c not in self._next[p]:
+            self._next[p][c] = cur
+            p = self._link[p]
+        if p != -1:
+            q = self._next[p][c]
+            if self._len[p] + 1 == self._len[q]:
+                self._link[cur] = q
+            else:
+                self._link[cur] = self._clone(p, q, c)
+        return cur
+
+    def _match(self, query: str):
+        if len(query) < self.min_length:
+            return []
+        state = 0
+        for c in query:
+            try:
+                state = self._next[state][c]
+            except KeyError:
+                return []
+        if self._children is None:
+            self._children = [[] for i in range(len(self._link))]
+            for child, parent in enumerate(self._link):
+                if parent != -1:
+                    self._children[parent].append(child)
+        docs = set()
+        stack = [state]
+        while stack:
+            s = stack.pop()
+            if self._marks[s] is not None:
+                docs.update(self._marks[s])
+            stack.extend(self._children[s])
+        return [self._docs[doc] for doc in docs]
+
+
+class TrigramIndex(_SubstringTable):
+    """
+    Answer substring queries from character trigram postings.
+
+    Texts that contain every trigram of a query are candidates, which are then verified
+    with a real "in" test. Both gram tables grow with the total length of the indexed text.
+    Queries too short to contain a trigram are answered from a small table of two-character
+    grams, which needs no verification.
+    """
+
+    def __init__(self, min_length: int=2, postings=set):
+        _SubstringTable.__init__(self, min_length, postings)
+        self.trigrams = {}
+        self.bigrams = {}
+
+    def _grams(self, text: str, n: int):
+        return {text[i:i+n] for i in range(len(text) - n + 1)}
+
+    def _learn(self, text: str):
+        for table, n in [(self.trigrams, 3), (self.bigrams, 2)]:
+            for gram in self._grams(text, n):
+                try:
+                    table[gram]
+                except KeyError:
+                    table[gram] = set()
+                table[gram].add(text)
+
+    def _forget(self, text: str):
+        for table, n in [(self.trigrams, 3), (self.bigrams, 2)]:
+            for gram in self._grams(text, n):
+                table[gram].discard(text)
+                if len(table[gram]) == 0:
+                    table.pop(gram)
+
+    def _match(self, query: str):
+        if len(query) < self.min_length:
+            return []
+        if len(query) < 3:
+            try:
+                return list(self.bigrams[query])
+            except KeyError:
+                return []
+        postings = []
+        for gram in self._grams(query, 3):
+            try:
+                postings.append(self.trigrams[gram])
+            except KeyError:
+                return []
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            candidates.intersection_update(p)
+            if not candidates:
+                return []
+        return [text for text in candidates if query in text]
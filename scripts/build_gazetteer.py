@@ -45,7 +45,12 @@ def make_gaz(input_file='', input_format='', **kwargs):
         else:
             raise NotImplementedError(input_format)
     del f
-    return Gazetteer(data)
+    index_path = path.with_name(path.name + '.idx')
+    if input_format != 'json' or not index_path.exists() or index_path.stat().st_mtime < path.stat().st_mtime:
+        index_path = None
+    gaz = Gazetteer()
+    gaz.add_many(data, index_path=index_path)
+    return gaz
 
 def output_gaz(gaz, output_file='', output_format='', **kwargs):
     if output_format == 'json':
@@ -61,6 +66,8 @@ def output_gaz(gaz, output_file='', output_format='', **kwargs):
         with open(path, 'w', encoding='utf-8') as f:
             f.write(result)
         del f
+        if output_format == 'json':
+            gaz.save_index(path.with_name(path.name + '.idx'))
 
 def main(**kwargs):
     """
@@ -34,6 +34,8 @@ def main(**kwargs):
     """
     # logger = logging.getLogger(sys._getframe().f_code.co_name)
     cli = CLI()
+    readline.set_completer(lambda text, state: cli.complete(text, state, readline.get_line_buffer()))
+    readline.parse_and_bind('tab: complete')
     cli.interact()
 
 
@@ -33,5 +33,6 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     install_requires=['airtight', 'fuzzywuzzy[speedup]', 'geopy', 'python-slugify', 'textnorm'],
+    extras_require={'tfidf': ['numpy']},
     python_requires='>=3.9.6'
 )
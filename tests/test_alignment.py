@@ -7,6 +7,7 @@ import logging
 from nose.tools import assert_equal, assert_false, assert_true, raises
 from oikoumene.alignment import SelfAligner, ExternalAligner
 from oikoumene.gazetteer import Gazetteer
+from oikoumene.stringlike import GeographicName
 from pathlib import Path
 from unittest import TestCase
 
@@ -49,6 +50,82 @@ class Test_SelfAligner(TestCase):
         assert_equal(1, len(matches))
         assert_equal(ids[1], matches[0])
 
+    def test_align_objects(self):
+        path = Path('data/examples/moontown_names.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        gaz = Gazetteer(j)
+        objs = list(gaz.contents.values())
+        sa = SelfAligner(gaz=gaz, text={'fuzzy': True})
+        batched = sa.align_objects(objs)
+        for obj, matches in zip(objs, batched):
+            assert_equal(sorted(sa.align_object(obj)), sorted(matches))
+
+    def test_align_objects_tfidf(self):
+        path = Path('data/examples/moontown_names.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        gaz = Gazetteer(j, index_options={'fuzzy_mode': 'tfidf'})
+        objs = list(gaz.contents.values())
+        sa = SelfAligner(gaz=gaz, text={'fuzzy': True})
+        batched = sa.align_objects(objs)
+        for obj, matches in zip(objs, batched):
+            assert_equal(sorted(sa.align_object(obj)), sorted(matches))
+        assert_true(any(batched))
+
+    def test_align_field(self):
+        names = [
+            GeographicName(attested='Ṭūr ʿAbdīn'),
+            GeographicName(romanized='Tur Abdin'),
+            GeographicName(attested='Tur Abdin')]
+        gaz = Gazetteer(names, fields=['attested', 'romanized'])
+        objs = list(gaz.contents.values())
+        sa = SelfAligner(gaz=gaz, text={'field': 'romanized'})
+        assert_equal(['tur-abdin.1', 'tur-abdin.2'], sorted(sa.align_object(objs[0])))
+        batched = sa.align_objects(objs)
+        assert_equal(['tur-abdin', 'tur-abdin.1'], sorted(batched[2]))
+        sa = SelfAligner(gaz=gaz, text={'field': 'attested'})
+        assert_equal([[], [], []], sa.align_objects(objs))
+
+    @raises(ValueError)
+    def test_align_field_bad(self):
+        gaz = Gazetteer([GeographicName(attested='Moontown')])
+        sa = SelfAligner(gaz=gaz, text={'field': 'romanized'})
+        sa.align_object(list(gaz.contents.values())[0])
+
+    def test_phonetic(self):
+        names = [
+            GeographicName(romanized='Moontown'),
+            GeographicName(romanized='muntaun'),
+            GeographicName(romanized='Jericho')]
+        gaz = Gazetteer(names, index_options={'phonetic': True})
+        objs = list(gaz.contents.values())
+        sa = SelfAligner(gaz=gaz, text={'phonetic': True})
+        assert_equal([['muntaun'], ['moontown'], []], sa.align_objects(objs))
+        sa = SelfAligner(gaz=gaz, text={'phonetic': True, 'fuzzy': True})
+        assert_equal([[], [], []], sa.align_objects(objs))
+
+    @raises(ValueError)
+    def test_phonetic_bad(self):
+        gaz = Gazetteer([GeographicName(romanized='Moontown')])
+        sa = SelfAligner(gaz=gaz, text={'phonetic': True})
+        sa.align_object(list(gaz.contents.values())[0])
+
+    def test_minhash(self):
+        path = Path('data/examples/moontown_names.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        gaz = Gazetteer(j)
+        entries = gaz.get({'text': ['berry']})
+        ids = sorted(entries.keys())
+        sa = SelfAligner(gaz=gaz, minhash={'threshold': 0.8})
+        matches = sa.align_object(gaz.contents[ids[0]])
+        assert_equal([ids[1]], matches)
+        assert_equal([tuple(ids)], sa.candidate_pairs())
+
 class Test_ExternalAligner(TestCase):
 
     def test_nominatim_single(self):
@@ -61,6 +61,8 @@ class Test_CLI_Verbs(TestCase):
     def setUp(self):
         path = test_data_path / 'foo.json'
         path.unlink(missing_ok=True)
+        path = test_data_path / 'foo.json.idx'
+        path.unlink(missing_ok=True)
         path = test_data_path / 'foo.txt'
         path.unlink(missing_ok=True)
         self.cli = CLI()
@@ -68,8 +70,8 @@ class Test_CLI_Verbs(TestCase):
         self.cli._v_load(str(path), ['json'])
 
     def tearDown(self):
-        """Change me"""
-        pass
+        path = test_data_path / 'foo.json.idx'
+        path.unlink(missing_ok=True)
 
     def test_contents(self):
         cmd = 'contents'
@@ -131,6 +133,20 @@ class Test_CLI_Verbs(TestCase):
 3: Moontown Road [GeographicName]""",
             r)
 
+    def test_complete(self):
+        assert_equal('find', self.cli.complete('fi', 0, 'fi'))
+        assert_equal(None, self.cli.complete('fi', 1, 'fi'))
+        r = []
+        state = 0
+        while True:
+            c = self.cli.complete('moon', state, 'find moon')
+            if c is None:
+                break
+            r.append(c)
+            state += 1
+        assert_equal(['moontown'], r)
+        assert_equal('road', self.cli.complete('', 0, 'find '))
+
     def test_json(self):
         cmd = 'json'
         r = self.cli._parse([cmd])
@@ -141,12 +157,18 @@ class Test_CLI_Verbs(TestCase):
         r = self.cli._parse([cmd])
         assert_equal('There are 20 objects in the gazetteer.', r)
         
+    def test_stats(self):
+        r = self.cli._parse(['stats'])
+        assert_true('\tvalues: ' in r)
+        assert_true('\treverse: 20 documents' in r)
+
     def test_save(self):
         path = test_data_path / 'foo.json'
         assert_false(path.exists())
         cmd = f'save {path}'
         r = self.cli._parse(cmd.split())
         assert_true(path.exists())
+        assert_true((test_data_path / 'foo.json.idx').exists())
         path = test_data_path / 'foo.txt'
         assert_false(path.exists())
         cmd = f'save {path}'
@@ -196,6 +218,8 @@ class Test_CLI_Destructive(TestCase):
     def setUp(self):
         path = test_data_path / 'foo.json'
         path.unlink(missing_ok=True)
+        path = test_data_path / 'foo.json.idx'
+        path.unlink(missing_ok=True)
         path = test_data_path / 'foo.txt'
         path.unlink(missing_ok=True)
         self.cli = CLI()
@@ -308,6 +332,13 @@ class Test_CLI_Alignment(TestCase):
             '3 objects in the gazetteer have possible matches with other objects. Use "review self matches" to merge matches selectively.',
             r)
 
+    def test_minhash(self):
+        cmd = 'align self minhash 0.8'
+        r = self.cli._parse(cmd.split())
+        assert_equal(
+            '1 object in the gazetteer has possible matches with other objects. Use "review self matches" to merge matches selectively.',
+            r)
+
     def test_external_nominatim(self):
         cmd = 'align nominatim Madison County, Alabama'
         r = self.cli._parse(cmd.split())
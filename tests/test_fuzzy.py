@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test fuzzy module"""
+
+import logging
+from nose.tools import assert_equal, assert_false, assert_true, raises
+from oikoumene.fuzzy import BKTree, DeletionIndex, NgramVectors, levenshtein
+from pathlib import Path
+from unittest import TestCase
+
+logger = logging.getLogger(__name__)
+test_data_path = Path('tests/data').resolve()
+
+WORDS = [
+    'moontown', 'moontowne', 'mountain', 'cedar', 'cider', 'chestnut', 'knob', 'knot',
+    'hambrick', 'branch', 'brunch', 'airport', 'berry', 'barry', 'road', 'rod', 'sublett',
+    'bluff', 'cemetery', 'saddle']
+
+
+def setup_module():
+    """Change me"""
+    pass
+
+
+def teardown_module():
+    """Change me"""
+    pass
+
+
+class Test_Levenshtein(TestCase):
+
+    def test_distance(self):
+        assert_equal(0, levenshtein('cat', 'cat'))
+        assert_equal(1, levenshtein('cat', 'cats'))
+        assert_equal(1, levenshtein('cat', 'cut'))
+        assert_equal(3, levenshtein('kitten', 'sitting'))
+        assert_equal(4, levenshtein('', 'road'))
+
+
+class Test_BKTree(TestCase):
+
+    def setUp(self):
+        self.tree = BKTree(WORDS)
+
+    def test_search(self):
+        for query in ['moontown', 'cedr', 'knox', 'bery', 'brench', 'zzz']:
+            for max_distance in [0, 1, 2]:
+                expected = [w for w in WORDS if levenshtein(query, w) <= max_distance]
+                assert_equal(
+                    sorted(expected),
+                    sorted(self.tree.search(query, max_distance)),
+                    (query, max_distance))
+
+    def test_ranked(self):
+        assert_equal(['berry', 'barry'], self.tree.search('berry', 1))
+
+    def test_discard(self):
+        self.tree.discard('barry')
+        assert_equal(['berry'], self.tree.search('berry', 1))
+        self.tree.add('barry')
+        assert_equal(['berry', 'barry'], self.tree.search('berry', 1))
+        for word in WORDS[:15]:
+            self.tree.discard(word)
+        assert_equal(5, len(self.tree))
+        assert_equal(['saddle'], self.tree.search('sadle', 1))
+        assert_false('moontown' in self.tree)
+
+
+class Test_DeletionIndex(TestCase):
+
+    def test_search(self):
+        di = DeletionIndex(WORDS, max_distance=2, prefix_length=20)
+        for query in ['moontown', 'cedr', 'knox', 'bery', 'brench', 'zzz', 'mountian']:
+            for max_distance in [0, 1, 2]:
+                expected = [w for w in WORDS if levenshtein(query, w) <= max_distance]
+                assert_equal(
+                    sorted(expected),
+                    sorted(di.search(query, max_distance)),
+                    (query, max_distance))
+
+    def test_max_distance(self):
+        di = DeletionIndex(WORDS, max_distance=1)
+        assert_equal(['cedar'], di.search('cedar', 2))
+
+    def test_prefix_length(self):
+        di = DeletionIndex(WORDS, max_distance=1, prefix_length=4)
+        assert_equal(['moontown', 'moontowne'], di.search('moontowns', 1))
+        assert_true(len(di.deletes) < len(DeletionIndex(WORDS, max_distance=1).deletes))
+
+    def test_discard(self):
+        di = DeletionIndex(WORDS, max_distance=1)
+        di.discard('barry')
+        assert_equal(['berry'], di.search('berry', 1))
+        assert_false('barry' in di)
+        di.add('barry')
+        assert_equal(['berry', 'barry'], di.search('berry', 1))
+
+
+class Test_NgramVectors(TestCase):
+
+    def setUp(self):
+        self.vectors = NgramVectors([
+            'moontown', 'moontown airport', 'moontown road', 'cedar mountain', 'berry road'])
+
+    def test_search(self):
+        assert_equal(['moontown'], self.vectors.search('moontown', k=1))
+        r = self.vectors.search('moontwn', k=3, min_similarity=0.1)
+        assert_equal('moontown', r[0])
+        assert_equal(3, len(r))
+
+    def test_search_many(self):
+        r = self.vectors.search_many(['berry rd', 'cedar', 'zzz'], k=2, min_similarity=0.2)
+        assert_equal([['berry road'], ['cedar mountain'], []], r)
+        r = self.vectors.search_many(['berry rd', 'cedar'], k=2, min_similarity=0.2, chunk_cells=1)
+        assert_equal([['berry road'], ['cedar mountain']], r)
+
+    def test_discard(self):
+        self.vectors.discard('moontown')
+        assert_false('moontown' in self.vectors)
+        assert_false('moontown' in self.vectors.search('moontown', k=5, min_similarity=0.0))
+        self.vectors.add('moontown')
+        assert_equal(['moontown'], self.vectors.search('moontown', k=1))
@@ -6,14 +6,16 @@ from copy import deepcopy
 import json
 import logging
 from oikoumene.id import make_id_valid
-from oikoumene.stringlike import GeographicString
+from oikoumene.stringlike import GeographicName, GeographicString
 from nose.tools import assert_equal, assert_false, assert_true, raises
 from oikoumene.gazetteer import Gazetteer
+from oikoumene.sharding import ShardedStringIndex
 from oikoumene.parsing import StringParser
 from oikoumene.place import Place
 from pathlib import Path
 from pprint import pformat, pprint
 from slugify import slugify
+from types import FunctionType
 from unittest import TestCase
 
 logger = logging.getLogger(__name__)
@@ -80,6 +82,56 @@ class Test_Gazetteer(TestCase):
         g.add(gs)
         assert_equal(6, len(g.contents))
 
+    def test_add_many(self):
+        g = Gazetteer(self.geostrings)
+        g.add_many([
+            GeographicString(romanized='Moontown Road'),
+            {'romanized': 'Moontown Road'},
+            GeographicName(attested='Jericho')])
+        assert_equal(len(self.geostrings) + 3, len(g.contents))
+        assert_equal(2, len(g.get({'text': ['moontown road']})))
+        assert_equal(1, len(g.get({'text': ['jericho']})))
+
+    def test_add_many_ids(self):
+        # ids are made unique as make_unique_id would make them
+        names = ['Moontown', 'Moontown', 'Moontown.1', 'Moontown', 'Jericho', 'Moontown.1']
+        g = Gazetteer()
+        g.add_many([GeographicName(attested=n) for n in names])
+        expected = []
+        for n in names:
+            obj = GeographicName(attested=n)
+            expected.append(obj.make_unique_id(expected))
+        assert_equal(sorted(expected), sorted(g.contents.keys()))
+
+    def test_add_many_dict_ids(self):
+        # plain dicts with ids are parsed, not taken for objects written by json()
+        g = Gazetteer([{'attested': 'Foo', 'id': 'x'}])
+        assert_equal(['x'], list(g.contents.keys()))
+        assert_equal('Foo', g.contents['x'].attested)
+        g = Gazetteer(json.loads(Gazetteer(self.geostrings).json()))
+        assert_equal(len(self.geostrings), len(g.contents))
+
+    @raises(TypeError)
+    def test_add_many_bad(self):
+        g = Gazetteer(self.geostrings)
+        try:
+            g.add_many([GeographicName(attested='Jericho'), 7])
+        finally:
+            assert_equal(len(self.geostrings), len(g.contents))
+
+    def test_bulk(self):
+        g = Gazetteer(self.geostrings)
+        with g.bulk():
+            g.add(GeographicName(attested='Jericho'))
+            n = g.new_name({'attested': 'Moontown Estates'})
+            with g.bulk():
+                g.add_many([GeographicName(attested='Jericho')])
+            assert_equal(0, len(g.get({'text': ['jericho']})))
+            g.remove(n.id)
+        assert_equal(2, len(g.get({'text': ['jericho']})))
+        assert_equal(0, len(g.get({'text': ['moontown estates']})))
+        assert_false(n.id in g._indexes['_all_text'])
+
     @raises(TypeError)
     def test_add_bad(self):
         g = Gazetteer(self.geostrings)
@@ -165,6 +217,154 @@ class Test_Gazetteer(TestCase):
         entries = gaz.get({'text': ['moon']})
         assert_equal(3, len(entries))
 
+    def test_get_automaton(self):
+        path = Path('data/examples/moontown_names.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        gaz = Gazetteer(j, index_options={'substring_mode': 'automaton'})
+        entries = gaz.get({'text': ['moon']})
+        assert_equal(3, len(entries))
+        gaz.remove('moontown')
+        entries = gaz.get({'text': ['moon']})
+        assert_equal(2, len(entries))
+
+    def test_get_lazy(self):
+        path = Path('data/examples/moontown_names.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        gaz = Gazetteer(j, index_options={'eager': ['value']})
+        assert_equal({}, gaz._indexes['_all_text'].substrings)
+        entries = gaz.get({'text': ['moon']})
+        assert_equal(3, len(entries))
+
+    def test_get_folding(self):
+        names = [GeographicName(romanized=['Ṭūr ʿAbdīn']), GeographicName(romanized=['Moontown'])]
+        gaz = Gazetteer(names)
+        assert_equal(0, len(gaz.get({'text': ['Tur Abdin']})))
+        gaz = Gazetteer(names, index_options={'folding': True})
+        assert_equal(1, len(gaz.get({'text': ['Tur Abdin']})))
+        assert_equal(1, len(gaz.get({'text': ['abdin']})))
+
+    def test_get_transliteration(self):
+        names = [GeographicName(attested='Москва', romanized='Moscow')]
+        gaz = Gazetteer(names)
+        assert_equal(0, len(gaz.get({'text': ['Moskva']})))
+        gaz = Gazetteer(names, index_options={'transliteration': True})
+        assert_equal(1, len(gaz.get({'text': ['Moskva']})))
+
+    def test_get_operators(self):
+        path = Path('data/examples/moontown_names.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        gaz = Gazetteer(j)
+        entries = gaz.get({'id': ['chestnut-knob'], 'text': ['moon']})
+        assert_equal(0, len(entries))
+        entries = gaz.get({'id': ['chestnut-knob'], 'text': ['moon']}, operator='or')
+        assert_equal(4, len(entries))
+        entries = gaz.get({'id': ['moontown'], 'text': ['moon']})
+        assert_equal(['moontown'], list(entries.keys()))
+
+    def test_fields(self):
+        names = [
+            GeographicName(attested='Ṭūr ʿAbdīn'),
+            GeographicName(romanized='Tur Abdin'),
+            GeographicName(attested='Tur Abdin')]
+        gaz = Gazetteer(names, fields=['attested', 'romanized'])
+        entries = gaz.get({'attested': ['tur abdin']})
+        assert_equal(['tur-abdin.2'], list(entries.keys()))
+        entries = gaz.get({'romanized': ['tur abdin']})
+        assert_equal(3, len(entries))
+        entries = gaz.get({'attested': ['ṭūr ʿabdīn'], 'romanized': ['tur abdin']})
+        assert_equal(['tur-abdin'], list(entries.keys()))
+        entries = gaz.get({'text': ['ṭūr ʿabdīn']})
+        assert_equal(['tur-abdin'], list(entries.keys()))
+        gaz.remove('tur-abdin.1')
+        entries = gaz.get({'romanized': ['tur abdin']})
+        assert_equal(['tur-abdin', 'tur-abdin.2'], sorted(entries.keys()))
+
+    def test_fields_place(self):
+        p = Place()
+        p.add(GeographicName(attested='Ṭūr ʿAbdīn'))
+        gaz = Gazetteer([p], fields=['attested', 'label'])
+        assert_equal(1, len(gaz.get({'attested': ['ṭūr ʿabdīn']})))
+        assert_equal(1, len(gaz.get({'label': ['ṭūr ʿabdīn (tur abdin)']})))
+
+    @raises(ValueError)
+    def test_fields_bad(self):
+        Gazetteer(fields=['text'])
+
+    def test_search(self):
+        path = Path('data/examples/moontown_names.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        gaz = Gazetteer(j)
+        entries = gaz.search('moontown', k=2)
+        assert_equal(['moontown'], list(entries.keys())[:1])
+        assert_equal(2, len(entries))
+
+    def test_stats(self):
+        path = Path('data/examples/moontown_names.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        gaz = Gazetteer(j)
+        stats = gaz.stats()
+        assert_equal(20, stats['objects'])
+        s = stats['indexes']['_all_text']
+        assert_equal(20, s['ids'])
+        assert_equal(20, s['reverse']['documents'])
+        assert_true(s['indexes']['substrings']['bytes'] > s['indexes']['values']['bytes'])
+        gaz.remove(list(gaz.contents.keys())[0])
+        assert_equal(19, gaz.stats()['indexes']['_all_text']['ids'])
+
+    def test_sharded(self):
+        path = Path('data/examples/moontown_names.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        gaz = Gazetteer(j)
+        sharded = Gazetteer(j, index_options={'shards': 3})
+        assert_true(isinstance(sharded._indexes['_all_text'], ShardedStringIndex))
+        for criteria in [{'text': ['moon']}, {'text': ['moontown road']}]:
+            assert_equal(sorted(gaz.get(criteria).keys()), sorted(sharded.get(criteria).keys()))
+        assert_equal(list(gaz.search('moontown').keys()), list(sharded.search('moontown').keys()))
+        sharded.remove('moontown')
+        assert_equal(2, len(sharded.get({'text': ['moon']})))
+        assert_equal(19, sharded.stats()['indexes']['_all_text']['reverse']['documents'])
+
+    @raises(NotImplementedError)
+    def test_sharded_save_index(self):
+        gaz = Gazetteer([GeographicName(attested='Moontown')], index_options={'shards': 2})
+        gaz.save_index('foo.idx')
+
+    def test_indexable_fields(self):
+        path = Path('data/examples/moontown_places.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        gaz = Gazetteer(j)
+        n = GeographicName(attested='Moontown', note='a kwarg', empty='')
+        gaz.add(n)
+        objs = list(gaz.contents.values())
+        objs.extend([n for o in objs if isinstance(o, Place) for n in o.names.values()])
+        for obj in objs:
+            # the fields found by reflecting on the object itself
+            disallowed = {
+                name for name in dir(type(obj)) if isinstance(getattr(type(obj), name), FunctionType)}
+            disallowed.update(['id', 'prior_ids'])
+            names = [
+                name for name in dir(obj)
+                if name[0] != '_' and name not in disallowed and hasattr(obj, name)]
+            expected = {name: getattr(obj, name) for name in names if getattr(obj, name)}
+            fields = gaz._get_indexable_fields(obj)
+            assert_equal(expected, fields)
+            assert_equal(list(expected.keys()), list(fields.keys()))
+        assert_equal('a kwarg', gaz._get_indexable_fields(n)['note'])
+
     def test_remove(self):
         path = Path('data/examples/moontown_names.json').resolve()
         with open(path, 'r', encoding='utf-8') as f:
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 """TEst indexing"""
 
+from oikoumene import indexing
 from oikoumene.indexing import StringIndex
 import logging
 from nose.tools import assert_equal, assert_false, assert_true, raises
@@ -77,6 +78,204 @@ class Test_StringIndex(TestCase):
         assert_equal(1, len(r))
         assert_equal('Fielder', r[0])
 
+class Test_StringIndex_Array(TestCase):
+
+    def setUp(self):
+        si = StringIndex(postings='array')
+        si.add('big cats', 'a')
+        si.add('big cat', 'b')
+        si.add('big dog', 'c')
+        si.add('small cats', ['d', 'a'])
+        self.si = si
+
+    def test_postings(self):
+        assert_equal([0, 1, 2], list(self.si.words['big']))
+        assert_equal([0, 3], list(self.si.words['cats']))
+
+    def test_get(self):
+        r = self.si.get(['big', 'cats'], indexes=['word'])
+        assert_equal(['a'], r)
+        r = self.si.get(['dog', 'small'], indexes=['word'], operator='or')
+        r.sort()
+        assert_equal(['a', 'c', 'd'], r)
+        r = self.si.get(['cat'], indexes=['substring', 'word'], operator='or')
+        r.sort()
+        assert_equal(['a', 'b', 'd'], r)
+
+    def test_drop(self):
+        self.si.drop('a')
+        assert_equal(['d'], self.si._get_word('cats'))
+        assert_equal([], self.si._get_value('big cats'))
+        self.si.add('big cats', 'a')
+        r = self.si._get_word('cats')
+        r.sort()
+        assert_equal(['a', 'd'], r)
+
+    def test_fuzzy(self):
+        r = self.si.get(['big cat'], indexes=['value'], fuzzy=True)
+        r.sort()
+        assert_equal(['a', 'b'], r)
+
+class Test_StringIndex_Bitmap(TestCase):
+
+    def test_get(self):
+        si = StringIndex(postings='bitmap')
+        si.add('big cats', 'a')
+        si.add('big cat', 'b')
+        si.add('small cats', ['c', 'a'])
+        r = si.get(['big', 'cats'], indexes=['word'])
+        assert_equal(['a'], r)
+        r = si.get(['cats'], indexes=['word', 'substring'], operator='or')
+        r.sort()
+        assert_equal(['a', 'c'], r)
+        si.drop('a')
+        assert_equal(['c'], si.get(['cats'], indexes=['word']))
+
+class Test_StringIndex_Automaton(TestCase):
+
+    def setUp(self):
+        self.values = [
+            ('the big cat is staring at me', 'Fielder'),
+            ('big cats', 'a'),
+            ('strange orange cats of doom', 'b'),
+            ('banana', 'c'),
+            ('ananas', 'd'),
+            ('x', 'e')]
+        self.exhaustive = StringIndex()
+        self.automaton = StringIndex(substring_mode='automaton')
+        for value, id in self.values:
+            self.exhaustive.add(value, id)
+            self.automaton.add(value, id)
+
+    def test_substring(self):
+        si = StringIndex(substring_mode='automaton')
+        si._add_substrings('the big cat is staring at me', ['Fielder'])
+        r = si._get_substring('g ca')
+        assert_equal(['Fielder'], r)
+        r = si._get_substrings(['g ca', 'ring'])
+        assert_equal(['Fielder'], r)
+        assert_equal([], si._get_substring('dog'))
+
+    def test_same_results(self):
+        sought = set()
+        for value, id in self.values:
+            for start in range(len(value)):
+                for end in range(start, len(value) + 1):
+                    sought.add(value[start:end])
+        sought.update(['cats of', 'nan', 'zebra', 'a', 'x'])
+        for s in sought:
+            assert_equal(
+                sorted(self.exhaustive._get_substring(s)),
+                sorted(self.automaton._get_substring(s)), s)
+        assert_equal(
+            sorted(self.exhaustive.substrings.keys()),
+            sorted(self.automaton.substrings.keys()))
+
+    def test_drop(self):
+        self.automaton.drop(['c', 'a'])
+        assert_equal(['d'], self.automaton._get_substring('ana'))
+        assert_equal(['b'], self.automaton._get_substring('cats'))
+        self.automaton.add('banana', 'f')
+        r = self.automaton._get_substring('anan')
+        r.sort()
+        assert_equal(['d', 'f'], r)
+
+    def test_rebuild(self):
+        for value, id in self.values[:-1]:
+            self.automaton.drop(id)
+        r = self.automaton.get(['x'], indexes=['value'])
+        assert_equal(['e'], r)
+        self.automaton.add('xylophone', 'g')
+        assert_equal(['g'], self.automaton._get_substring('xy'))
+
+    @raises(ValueError)
+    def test_bad_mode(self):
+        StringIndex(substring_mode='bogus')
+
+class Test_StringIndex_Trigram(TestCase):
+
+    def setUp(self):
+        self.values = [
+            ('the big cat is staring at me', 'Fielder'),
+            ('big cats', 'a'),
+            ('strange orange cats of doom', 'b'),
+            ('banana', 'c'),
+            ('ananas', 'd'),
+            ('x', 'e')]
+        self.exhaustive = StringIndex()
+        self.trigram = StringIndex(substring_mode='trigram')
+        for value, id in self.values:
+            self.exhaustive.add(value, id)
+            self.trigram.add(value, id)
+
+    def test_same_results(self):
+        sought = set()
+        for value, id in self.values:
+            for start in range(len(value)):
+                for end in range(start, len(value) + 1):
+                    sought.add(value[start:end])
+        sought.update(['cats of', 'nan', 'anana', 'zebra', 'a', 'x', 'tac'])
+        for s in sought:
+            assert_equal(
+                sorted(self.exhaustive._get_substring(s)),
+                sorted(self.trigram._get_substring(s)), s)
+
+    def test_verification(self):
+        # the only trigram of "ssss" occurs in "sssx" but the string itself does not
+        self.trigram.add('sssx', 'f')
+        assert_equal(['f'], self.trigram._get_substring('sss'))
+        assert_equal([], self.trigram._get_substring('ssss'))
+        r = self.trigram.get(['bana'], indexes=['substring'])
+        assert_equal(['c'], r)
+
+    def test_drop(self):
+        self.trigram.drop(['c', 'a'])
+        assert_equal(['d'], self.trigram._get_substring('ana'))
+        assert_equal(['b', 'd'], sorted(self.trigram._get_substring('an')))
+        assert_false('ban' in self.trigram.substrings.trigrams)
+
+class Test_StringIndex_Positional(TestCase):
+
+    def setUp(self):
+        self.values = [
+            ('the big cat is staring at me', 'Fielder'),
+            ('big cats', 'a'),
+            ('strange orange cats of doom', 'b'),
+            ('cats of doom are strange cats', 'c'),
+            ('doom doom doom', 'd'),
+            ('doom', 'e')]
+        self.exhaustive = StringIndex()
+        self.positional = StringIndex(phrase_mode='positional')
+        for value, id in self.values:
+            self.exhaustive.add(value, id)
+            self.positional.add(value, id)
+
+    def test_phrase(self):
+        si = StringIndex(phrase_mode='positional')
+        si._add_phrases('the big cat is staring at me', ['Fielder'])
+        r = si._get_phrase('cat is staring')
+        assert_equal(['Fielder'], r)
+        r = si._get_phrases(['big cat', 'staring at'])
+        assert_equal(['Fielder'], r)
+        assert_equal([], si._get_phrase('cat staring'))
+
+    def test_same_results(self):
+        sought = set(self.exhaustive.phrases.keys())
+        sought.update(['doom', 'cats  of', 'of cats', 'strange cats of doom', 'doom doom doom doom'])
+        for s in sought:
+            assert_equal(
+                sorted(self.exhaustive._get_phrase(s)),
+                sorted(self.positional._get_phrase(s)), s)
+        assert_equal(
+            sorted(self.exhaustive.phrases.keys()),
+            sorted(self.positional.phrases.keys()))
+
+    def test_drop(self):
+        self.positional.drop(['b', 'd'])
+        assert_equal(['c'], self.positional._get_phrase('cats of doom'))
+        assert_equal([], self.positional._get_phrase('doom doom'))
+        assert_false('orange' in self.positional.phrases.positions)
+
 class Test_StringIndex_Fuzzy(TestCase):
 
     def setUp(self):
@@ -173,8 +372,590 @@ class Test_StringIndex_Fuzzy(TestCase):
         r.sort()
         assert_equal(['a', 'b', 'c', 'd', 'e', 'g', 'i', 'k', 'l', 'n', 'o', 'p'], r)
 
+class Test_StringIndex_BKTree(TestCase):
 
+    def setUp(self):
+        si = StringIndex(fuzzy_mode='bktree', max_distance=1)
+        si.add('big cats', 'a')
+        si.add('big cat', 'b')
+        si.add('big dog', 'c')
+        si.add('small cats', 'd')
+        si.add('big brats', 'e')
+        self.si = si
 
+    def test_get_word_fuzzy(self):
+        r = self.si._get_word_fuzzy('cas')
+        r.sort()
+        assert_equal(['a', 'b', 'd'], r)
 
+    def test_get_fuzzy_values(self):
+        r = self.si.get(['big cot', 'smal cats'], indexes=['value'], fuzzy=True)
+        r.sort()
+        assert_equal(['b', 'd'], r)
 
+    def test_incremental(self):
+        assert_equal(['c'], self.si._get_word_fuzzy('dog'))
+        self.si.add('hot dogs', 'f')
+        r = self.si._get_word_fuzzy('dog')
+        r.sort()
+        assert_equal(['c', 'f'], r)
+        self.si.drop(['c', 'f'])
+        assert_equal([], self.si._get_word_fuzzy('dog'))
+        assert_false('dog' in self.si._fuzzy['words'])
+
+    def test_positional(self):
+        si = StringIndex(phrase_mode='positional', fuzzy_mode='bktree')
+        si.add('strange orange cats', 'a')
+        assert_equal(['a'], si._get_phrase_fuzzy('orange cat'))
+        si.add('strange cats', 'b')
+        assert_equal(['b'], si._get_phrase_fuzzy('strange cat'))
+
+class Test_StringIndex_SymSpell(TestCase):
+
+    def setUp(self):
+        si = StringIndex(fuzzy_mode='symspell', max_distance=1)
+        si.add('Frudgah', 'a')
+        si.add('Moontown Airport', 'b')
+        si.add('Moontown Road', 'c')
+        self.si = si
+
+    def test_get_fuzzy(self):
+        assert_equal(['a'], self.si.get(['frudga'], indexes=['word'], fuzzy=True))
+        r = self.si.get(['montown'], indexes=['word'], fuzzy=True)
+        r.sort()
+        assert_equal(['b', 'c'], r)
+        assert_equal([], self.si.get(['mntown'], indexes=['word'], fuzzy=True))
+
+    def test_incremental(self):
+        assert_equal(['c'], self.si.get(['rod'], indexes=['word'], fuzzy=True))
+        self.si.add('Rodd Branch', 'd')
+        r = self.si.get(['rod'], indexes=['word'], fuzzy=True)
+        r.sort()
+        assert_equal(['c', 'd'], r)
+        self.si.drop('c')
+        assert_equal(['d'], self.si.get(['rod'], indexes=['word'], fuzzy=True))
+
+class Test_StringIndex_TFIDF(TestCase):
+
+    def setUp(self):
+        si = StringIndex(fuzzy_mode='tfidf', top_k=3, min_similarity=0.3)
+        si.add('Moontown', 'a')
+        si.add('Moontown Airport', 'b')
+        si.add('Moontown Road', 'c')
+        si.add('Berry Road', 'd')
+        si.add('Cedar Mountain', 'e')
+        self.si = si
+
+    def test_get_fuzzy(self):
+        r = self.si.get(['moontwn'], indexes=['value'], fuzzy=True)
+        r.sort()
+        assert_equal(['a', 'c'], r)
+        assert_equal(['d'], self.si.get(['berry rd'], indexes=['value'], fuzzy=True))
+
+    def test_get_batch(self):
+        r = self.si.get_batch(['Moontown', 'berry rd', 'zzz'], fuzzy=True)
+        assert_equal(3, len(r))
+        assert_true('a' in r[0])
+        assert_equal(['d'], r[1])
+        assert_equal([], r[2])
+        r = self.si.get_batch(['Moontown', 'berry rd'])
+        assert_equal([['a'], []], r)
+
+    def test_incremental(self):
+        self.si.drop('d')
+        assert_equal([], self.si.get(['berry rd'], indexes=['value'], fuzzy=True))
+        self.si.add('Berry Road', 'f')
+        assert_equal(['f'], self.si.get(['berry rd'], indexes=['value'], fuzzy=True))
+
+class Test_StringIndex_Prefix(TestCase):
 
+    def setUp(self):
+        si = StringIndex()
+        si.add('Moontown', 'a')
+        si.add('Moontown Airport', 'b')
+        si.add('Moontown Road', 'c')
+        si.add('Mountain Road', 'd')
+        si.add('Cedar Mountain', 'e')
+        self.si = si
+
+    def test_get(self):
+        r = self.si.get(['moon'], indexes=['prefix'])
+        r.sort()
+        assert_equal(['a', 'b', 'c'], r)
+        r = self.si.get(['moun', 'ro'], indexes=['prefix'])
+        assert_equal(['d'], r)
+        assert_equal([], self.si._get_prefix('zebra'))
+
+    def test_complete(self):
+        assert_equal(['moontown', 'mountain', 'moontown airport'], self.si.complete('mo', k=3))
+        assert_equal(['moontown', 'mountain'], self.si.complete('Mo', indexes=['word']))
+        assert_equal(['road'], self.si.complete('r', indexes=['word']))
+
+    def test_drop(self):
+        self.si.drop(['c', 'd'])
+        assert_equal(['moontown', 'moontown airport'], self.si.complete('moon', indexes=['value']))
+        assert_equal(['a', 'b', 'e'], sorted(self.si._get_prefix('m')))
+        assert_equal([], self.si.complete('r'))
+
+    @raises(ValueError)
+    def test_fuzzy(self):
+        self.si.get(['moon'], indexes=['prefix'], fuzzy=True)
+
+    @raises(ValueError)
+    def test_fuzzy_list(self):
+        # rejected even when another index would end the query first
+        self.si.get(['zebra'], indexes=['value', 'prefix'], fuzzy=['prefix'])
+
+    def test_fuzzy_other(self):
+        assert_equal(['a', 'b', 'c'], sorted(self.si.get(['moon'], indexes=['prefix', 'word'], operator='or', fuzzy=['word'])))
+
+class Test_StringIndex_Cache(TestCase):
+
+    def setUp(self):
+        si = StringIndex(cache_size=2)
+        si.add('big cats', 'a')
+        si.add('big cat', 'b')
+        self.si = si
+
+    def test_hits(self):
+        assert_equal(['a'], self.si.get(['cats'], indexes=['word']))
+        assert_equal(['a'], self.si.get(['cats'], indexes=['word']))
+        assert_equal(['a'], self.si.get(['CATS'], indexes=['word']))
+        info = self.si.cache_info()
+        assert_equal(2, info['hits'])
+        assert_equal(1, info['misses'])
+        r = self.si.get(['cats'], indexes=['word'])
+        r.append('z')
+        assert_equal(['a'], self.si.get(['cats'], indexes=['word']))
+
+    def test_invalidation(self):
+        assert_equal(['a'], self.si.get(['cats'], indexes=['word']))
+        self.si.add('small cats', 'c')
+        r = self.si.get(['cats'], indexes=['word'])
+        r.sort()
+        assert_equal(['a', 'c'], r)
+        self.si.drop('a')
+        assert_equal(['c'], self.si.get(['cats'], indexes=['word']))
+        assert_equal(0, self.si.cache_info()['hits'])
+
+    def test_bounded(self):
+        for word in ['big', 'cat', 'cats', 'big']:
+            self.si.get([word], indexes=['word'])
+        info = self.si.cache_info()
+        assert_equal(2, info['size'])
+        assert_equal(0, info['hits'])
+        self.si.get(['cats'], indexes=['word'])
+        assert_equal(1, self.si.cache_info()['hits'])
+
+    def test_disabled(self):
+        si = StringIndex(cache_size=0)
+        si.add('big cats', 'a')
+        si.get(['cats'])
+        si.get(['cats'])
+        assert_equal(0, si.cache_info()['size'])
+        assert_equal(0, si.cache_info()['hits'])
+
+class Test_StringIndex_Lazy(TestCase):
+
+    def setUp(self):
+        si = StringIndex(eager=['value'])
+        si.add('Moontown Road', 'a')
+        si.add('Moontown', 'b')
+        self.si = si
+
+    def test_add(self):
+        assert_equal({}, self.si.substrings)
+        assert_equal({}, self.si.phrases)
+        assert_equal({}, self.si.words)
+        assert_equal(['b'], self.si._get_value('moontown'))
+
+    def test_build(self):
+        assert_equal(['a', 'b'], sorted(self.si.get('moon', indexes=['substring'])))
+        assert_equal({}, self.si.words)
+        assert_equal(['a', 'b'], sorted(self.si.get('moontown', indexes=['word'])))
+        self.si.add('Moontown Estates', 'c')
+        assert_equal(['a', 'b', 'c'], sorted(self.si.get('moontown', indexes=['word'])))
+        assert_equal({}, self.si.phrases)
+
+    def test_drop(self):
+        self.si.drop('a')
+        assert_equal(['b'], self.si.get('moon', indexes=['prefix']))
+        assert_equal(['moontown'], self.si.complete('moon'))
+
+    @raises(ValueError)
+    def test_bad(self):
+        StringIndex(eager=['values'])
+
+class Test_StringIndex_Stats(TestCase):
+
+    def test_stats(self):
+        si = StringIndex()
+        si.add('Moontown Road', 'a')
+        si.add('Moontown', 'b')
+        stats = si.stats()
+        assert_equal(2, stats['ids'])
+        words = stats['indexes']['words']
+        assert_equal(2, words['keys'])
+        assert_equal(3, words['postings'])
+        assert_equal([('moontown', 2), ('road', 1)], words['largest'])
+        assert_true(words['bytes'] > 0)
+        assert_equal(2, stats['reverse']['documents'])
+        assert_equal(3, stats['prefixes']['keys'])
+        assert_equal(0, stats['cache']['hits'])
+
+    def test_stats_drop(self):
+        si = StringIndex()
+        si.add('Moontown Road', 'a')
+        si.add('Moontown', 'b')
+        si.drop('a')
+        assert_equal(1, si.stats()['ids'])
+        # dropped document numbers go to new ids, which do not inherit their keys
+        for i in range(10):
+            si.add('Jericho', f'j{i}')
+            si.drop(f'j{i}')
+        si.add('Jericho', 'c')
+        assert_equal(2, len(si._ids))
+        assert_equal(['b'], si.get('moontown', indexes=['word']))
+        assert_equal([], si.get('road', indexes=['word']))
+        assert_equal(['c'], si.get('jericho', indexes=['value']))
+        assert_false('a' in si)
+        assert_equal(2, si.stats()['ids'])
+
+    def test_stats_engines(self):
+        si = StringIndex(substring_mode='automaton', phrase_mode='positional', postings='bitmap')
+        si.add('Moontown Road', 'a')
+        stats = si.stats()
+        assert_equal(1, stats['indexes']['substrings']['keys'])
+        assert_equal(1, stats['indexes']['phrases']['postings'])
+        assert_true(stats['indexes']['substrings']['bytes'] > 0)
+
+    def test_stats_lazy(self):
+        si = StringIndex(eager=['value'])
+        si.add('Moontown Road', 'a')
+        stats = si.stats()
+        assert_false(stats['indexes']['words']['built'])
+        assert_equal(0, stats['indexes']['words']['keys'])
+
+class Test_StringIndex_AddMany(TestCase):
+
+    def setUp(self):
+        self.items = [
+            ('Moontown Road', 'a'), ('Moontown', ['b', 'c']), ('Big Cove Creek', 'c'),
+            ('MOONTOWN', 'd'), ('Moontown Road', 'e')]
+
+    def test_add_many(self):
+        for options in [
+                {},
+                {'postings': 'array', 'substring_mode': 'trigram'},
+                {'postings': 'bitmap', 'phrase_mode': 'positional', 'substring_mode': 'automaton'},
+                {'eager': ['value', 'word']}]:
+            one = StringIndex(**options)
+            for value, ids in self.items:
+                one.add(value, ids)
+            many = StringIndex(**options)
+            many.add_many(self.items)
+            assert_equal(one.reverse, many.reverse)
+            assert_equal(one.values, many.values)
+            assert_equal(one.words, many.words)
+            assert_equal(one.prefixes.keys, many.prefixes.keys)
+            for query, indexes in [
+                    ('moontown', ['word']), ('moontown road', ['phrase']),
+                    ('cove', ['substring']), ('moon', ['prefix'])]:
+                assert_equal(
+                    sorted(one.get(query, indexes=indexes)),
+                    sorted(many.get(query, indexes=indexes)))
+
+    def test_add_many_drop(self):
+        si = StringIndex()
+        si.add_many(self.items)
+        si.drop(['a', 'e'])
+        assert_equal([], si.get('moontown road', indexes=['value']))
+        assert_equal(['b', 'c', 'd'], sorted(si.get('moontown', indexes=['value'])))
+
+    @raises(TypeError)
+    def test_add_many_bad(self):
+        StringIndex().add_many([('Moontown', 1)])
+
+class Test_StringIndex_Search(TestCase):
+
+    def setUp(self):
+        si = StringIndex()
+        si.add('Big Cove Creek', 'a')
+        si.add('Creek Road', 'b')
+        si.add('Creek', 'c')
+        si.add('Cove Creek Church of Christ in the Valley', 'd')
+        si.add('Moontown', 'e')
+        self.si = si
+
+    def test_search(self):
+        r = self.si.search('creek')
+        assert_equal(['c', 'b', 'a', 'd'], [id for id, score in r])
+        assert_true(r[0][1] > r[1][1] > r[2][1] > r[3][1])
+        r = self.si.search('Cove Creek', k=2)
+        assert_equal(['a', 'd'], [id for id, score in r])
+        assert_equal([], self.si.search('zebra'))
+
+    def test_search_top(self):
+        # the rarest term alone decides which ids may enter a full list of k
+        full = self.si.search('moontown creek', k=10)
+        assert_equal(5, len(full))
+        assert_equal(full[:1], self.si.search('moontown creek', k=1))
+        assert_equal(full[:2], self.si.search('moontown creek', k=2))
+
+    def test_search_drop(self):
+        self.si.drop('c')
+        r = self.si.search('creek')
+        assert_equal(['b', 'a', 'd'], [id for id, score in r])
+        self.si.add_many([('Creek', 'f')])
+        assert_equal('f', self.si.search('creek')[0][0])
+
+class Test_StringIndex_Plan(TestCase):
+
+    def setUp(self):
+        si = StringIndex(fuzzy_mode='bktree', cache_size=0)
+        si.add('Moontown Road', 'a')
+        si.add('Moontown', 'b')
+        si.add('Moontown Airport', 'c')
+        si.add('Big Cove Road', 'd')
+        for i in range(40):
+            si.add(f'Hill {i}', f'h{i}')
+        self.si = si
+
+    def test_short_circuit(self):
+        calls = []
+        find_fuzzy = self.si._find_fuzzy
+        def recording(index, value, min_ratio=70):
+            calls.append((index, value))
+            return find_fuzzy(index, value, min_ratio)
+        self.si._find_fuzzy = recording
+        assert_equal([], self.si.get(['zebra', 'mootown'], indexes=['word', 'value'], fuzzy=['value']))
+        assert_equal([], calls)
+        r = self.si.get(['mootown'], indexes=['word', 'value'], fuzzy=True)
+        assert_equal(['b'], r)
+        # the value index is only compared against the keys of the word matches
+        assert_equal([('word', 'mootown')], calls)
+
+    def test_order(self):
+        order = []
+        find = self.si._find
+        def recording(index, value):
+            order.append(value)
+            return find(index, value)
+        self.si._find = recording
+        assert_equal(['a'], self.si.get(['road', 'moontown'], indexes=['word']))
+        assert_equal(['road', 'moontown'], order)
+
+    def test_mixed(self):
+        r = self.si.get(['road'], indexes=['word', 'value'], fuzzy=['value'])
+        assert_equal([], r)
+        r = self.si.get(['moontown road'], indexes=['phrase', 'value'], fuzzy=['value'])
+        assert_equal(['a'], r)
+        r = self.si.get(['moontown rd'], indexes=['value', 'substring'], fuzzy=['value'])
+        assert_equal([], r)
+        r = self.si.get(['moontow'], indexes=['substring', 'word'], fuzzy=['word'])
+        assert_equal(['a', 'b', 'c'], sorted(r))
+
+    def test_within(self):
+        # comparing candidate keys directly gives what the engine gives
+        docs = self.si._find('word', 'moontown')
+        for value in ['moontowm', 'road', 'airport', 'hill']:
+            assert_equal(
+                sorted(self.si._find_fuzzy('value', value) & docs),
+                sorted(self.si._find_fuzzy_within('value', value, docs) & docs))
+
+    def test_unplanned(self):
+        # planned answers are those of evaluating each index in full
+        queries = [['big', 'cat'], ['cat'], ['big', 'cot'], ['big', 'dog'], ['hill', 'big']]
+        for fuzzy_mode in ['bktree', 'symspell']:
+            si = StringIndex(fuzzy_mode=fuzzy_mode, max_distance=1, cache_size=0)
+            for i in range(100):
+                si.add(f'filler {i}', f'f{i}')
+            si.add('big cat', 'a')
+            si.add('cats', 'a')
+            si.add('big', 'd')
+            for values in queries:
+                expected = set(si._get_multiples('word', values)) & set(si._get_multiples('value', values, fuzzy=True))
+                r = si.get(values, indexes=['word', 'value'], fuzzy=['value'])
+                assert_equal(sorted(expected), sorted(r))
+            assert_equal(['a'], si.get(['big', 'cat'], indexes=['word', 'value'], fuzzy=['value']))
+
+
+class Test_StringIndex_Folding(TestCase):
+
+    def setUp(self):
+        self.si = StringIndex(folding=True)
+        self.si.add('Ṭūr ʿAbdīn', 'a')
+        self.si.add('frūdgāh mūntāūn', 'b')
+        self.si.add("St. John's Creek", 'c')
+
+    def test_fold(self):
+        from oikoumene.normalization import fold
+        assert_equal('tur abdin', fold('Ṭūr ʿAbdīn'))
+        assert_equal('tur abdin', fold('Tur  Abdin'))
+        assert_equal('st johns creek', fold("St. John's Creek"))
+        assert_equal(fold('Ṭūr ʿAbdīn'), fold(fold('Ṭūr ʿAbdīn')))
+
+    def test_folded(self):
+        assert_equal(['a'], self.si.get('Tur Abdin', indexes=['folded_value']))
+        assert_equal(['b'], self.si.get('frudgah', indexes=['folded_word']))
+        assert_equal(['c'], self.si.get('johns', indexes=['folded_word']))
+        assert_equal([], self.si.get('Tur Abdin', indexes=['value']))
+
+    def test_default_indexes(self):
+        assert_equal(['a'], self.si.get('abdin', operator='or'))
+        assert_equal([], StringIndex().get('abdin', operator='or'))
+        # an exact match is also a folded match, so "and" queries are unchanged
+        si = StringIndex()
+        for value, id in [('Ṭūr ʿAbdīn', 'a'), ('frūdgāh mūntāūn', 'b'), ('Ābdīn', 'd')]:
+            si.add(value, id)
+            self.si.add(value, id)
+        for query in ['ābdīn', 'abdin', 'ṭūr ʿabdīn', 'frūdgāh']:
+            assert_equal(si.get(query), self.si.get(query))
+
+    def test_fuzzy(self):
+        assert_equal(['a'], self.si.get('Tur Abdn', indexes=['folded_value'], fuzzy=True))
+
+    def test_lazy(self):
+        si = StringIndex(folding=True, eager=['value'])
+        si.add('Ṭūr ʿAbdīn', 'a')
+        assert_equal(['a'], si.get('abdin', indexes=['folded_word']))
+        si.drop('a')
+        assert_equal([], si.get('abdin', indexes=['folded_word']))
+
+    def test_add_many(self):
+        si = StringIndex(folding=True)
+        si.add_many([('Ṭūr ʿAbdīn', 'a'), ('frūdgāh mūntāūn', 'b'), ("St. John's Creek", 'c')])
+        assert_equal(self.si.folded_words.keys(), si.folded_words.keys())
+        assert_equal(['b'], si.get('frudgah', indexes=['folded_word']))
+
+    def test_drop(self):
+        self.si.drop('a')
+        assert_equal([], self.si.get('tur', indexes=['folded_word']))
+        assert_false('tur abdin' in self.si.folded_values)
+
+    @raises(ValueError)
+    def test_not_folding(self):
+        StringIndex(eager=['folded_word'])
+
+
+class Test_StringIndex_Phonetic(TestCase):
+
+    def setUp(self):
+        self.si = StringIndex(phonetic=True)
+        self.si.add('Moontown Airport', 'a')
+        self.si.add('frwdgh mwntwn', 'b')
+        self.si.add('Mountain', 'c')
+        self.si.add('Jericho', 'd')
+
+    def test_phonetic(self):
+        assert_equal(['a', 'b', 'c'], sorted(self.si.get('muntaun', indexes=['phonetic'])))
+        assert_equal(['b'], self.si.get('frudgah muntaun', indexes=['phonetic']))
+        assert_equal(['d'], self.si.get('Jeriko', indexes=['phonetic']))
+        assert_equal([], self.si.get('zebra', indexes=['phonetic']))
+
+    def test_estimate(self):
+        # estimates add up posting lengths (M535 and MNTN) instead of matching
+        self.si._find_phonetic = None
+        assert_equal(5, self.si._estimate('phonetic', 'muntaun'))
+        assert_equal(0, self.si._estimate('phonetic', 'muntaun zebra'))
+        assert_equal(0, self.si._estimate('phonetic', ''))
+
+    def test_not_default(self):
+        assert_false('phonetic' in self.si.default_indexes)
+        assert_equal([], self.si.get('muntaun', operator='or'))
+        assert_equal(['c'], self.si.get('mountain', operator='or'))
+
+    def test_fuzzy(self):
+        # the candidates are checked by edit distance
+        r = self.si.get('moontowne', indexes=['phonetic'], fuzzy=True)
+        assert_equal(['a'], r)
+        r = self.si.get(['moontowne', 'airport'], indexes=['word', 'phonetic'], fuzzy=['phonetic'])
+        assert_equal([], r)
+        r = self.si.get(['airport'], indexes=['word', 'phonetic'], fuzzy=['phonetic'])
+        assert_equal(['a'], r)
+
+    def test_add_many(self):
+        si = StringIndex(phonetic=True, eager=['value'])
+        si.add_many([('Moontown Airport', 'a'), ('frwdgh mwntwn', 'b')])
+        assert_equal(['a', 'b'], sorted(si.get('muntaun', indexes=['phonetic'])))
+        si.drop('b')
+        assert_equal(['a'], si.get('muntaun', indexes=['phonetic']))
+        one = StringIndex(phonetic=True)
+        one.add('Moontown Airport', 'a')
+        assert_equal(sorted(one.phonetics.keys()), sorted(si.phonetics.keys()))
+
+
+class Test_StringIndex_Transliteration(TestCase):
+
+    def setUp(self):
+        self.si = StringIndex(transliteration=True)
+        self.si.add('فرودگاه مونتاون', 'a')
+        self.si.add('Москва', 'b')
+        self.si.add('Moscow', 'c')
+
+    def test_transliteration(self):
+        assert_equal(['a'], self.si.get('frwdgh mwntwn', indexes=['transliteration']))
+        assert_equal(['b'], self.si.get('Moskva', indexes=['transliteration']))
+        assert_equal([], self.si.get('moscow', indexes=['transliteration']))
+        assert_equal(['b', 'c'], sorted(self.si.get(['moskva', 'moscow'], operator='or')))
+
+    def test_latin(self):
+        from oikoumene.normalization import is_latin
+        assert_true(is_latin('Ṭūr ʿAbdīn'))
+        assert_false(is_latin('Москва'))
+        assert_equal({'moskva', 'frwdgh mwntwn'}, set(self.si.transliterations.keys()))
+
+    def test_fuzzy(self):
+        assert_equal(['b'], self.si.get('moskwa', indexes=['transliteration'], fuzzy=True))
+
+    def test_drop(self):
+        self.si.drop('b')
+        assert_equal([], self.si.get('moskva', indexes=['transliteration']))
+
+
+class Test_StringIndex_Workers(TestCase):
+
+    def setUp(self):
+        # let the short batches of these tests use the pool
+        self.parallel_batch = indexing.PARALLEL_BATCH
+        indexing.PARALLEL_BATCH = 2
+        self.items = [
+            ('Moontown', 'a'), ('Moontown Road', ['b', 'c']), ('Ṭūr ʿAbdīn', 'c'),
+            ('Moontown Airport', 'd'), ('Москва', 'e'), ('Moon Lake', ['a', 'e']),
+            ('Jericho', 'f'), ('Moontown', 'g')]
+
+    def test_identical(self):
+        options = {'folding': True, 'phonetic': True, 'transliteration': True}
+        one = StringIndex(**options)
+        one.add_many(self.items)
+        many = StringIndex(workers=2, **options)
+        many.add_many(self.items)
+        for name in one.indexes:
+            assert_equal(getattr(one, f'{name}s'), getattr(many, f'{name}s'))
+            assert_equal(list(getattr(one, f'{name}s')), list(getattr(many, f'{name}s')))
+        assert_equal(one.reverse, many.reverse)
+        assert_equal(one.prefixes.keys, many.prefixes.keys)
+        assert_equal(one._lengths, many._lengths)
+        assert_equal(one.search('moontown road'), many.search('moontown road'))
+
+    def test_engines(self):
+        one = StringIndex(substring_mode='trigram', phrase_mode='positional')
+        one.add_many(self.items)
+        many = StringIndex(substring_mode='trigram', phrase_mode='positional', workers=3)
+        many.add_many(self.items)
+        for value in ['moontown road', 'town', 'abd']:
+            assert_equal(sorted(one.get(value, operator='or')), sorted(many.get(value, operator='or')))
+
+    def tearDown(self):
+        indexing.PARALLEL_BATCH = self.parallel_batch
+
+    def test_small_batch(self):
+        indexing.PARALLEL_BATCH = len(self.items) + 1
+        si = StringIndex(workers=2)
+        si._collect_parallel = None
+        si.add_many(self.items)
+        assert_equal(['a', 'g'], sorted(si.get('moontown', indexes=['value'])))
+
+    @raises(ValueError)
+    def test_bad(self):
+        StringIndex(workers=0)
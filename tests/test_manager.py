@@ -7,7 +7,9 @@ import logging
 from nose.tools import assert_equal, assert_false, assert_true, raises
 from oikoumene.gazetteer import Gazetteer
 from oikoumene.manager import Manager
+from oikoumene.snapshot import MappedStringIndex
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
 TestCase.maxDiff = None
@@ -51,12 +53,44 @@ class Test_Manager(TestCase):
         r = m.load(path, 'json')
         assert_true(r.startswith('Read 20 objects from '))
 
+    def test_save_load(self):
+        m = Manager()
+        m.load(test_data_path / 'moontown_names.json', 'json')
+        with TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'gaz.json'
+            m.save(path)
+            m2 = Manager()
+            r = m2.load(path, 'json')
+            assert_true(r.startswith('Read 20 objects from '))
+            assert_true(isinstance(m2.gaz._indexes['_all_text'], MappedStringIndex))
+            assert_equal(m.gaz.json(), m2.gaz.json())
+            assert_equal(m.find('Moontown'), m2.find('Moontown'))
+            m2.gaz._indexes['_all_text'].close()
+
     def test_len(self):
         m = Manager()
         path = test_data_path / 'moontown_names.json'
         r = m.load(path, 'json')
         assert_equal('There are 20 objects in the gazetteer.', m.len())
 
+    def test_stats(self):
+        m = Manager(index_options={'eager': ['value', 'word']})
+        assert_equal('No gazetteer is loaded.', m.stats())
+        path = test_data_path / 'moontown_names.json'
+        m.load(path, 'json')
+        r = m.stats()
+        assert_true(r.startswith('There are 20 objects in the gazetteer.\nIndex "_all_text" (20 ids):'))
+        assert_true('\tsubstrings: not built' in r)
+        assert_true('\twords: ' in r)
+
+    def test_stats_sharded(self):
+        m = Manager(index_options={'shards': 2})
+        path = test_data_path / 'moontown_names.json'
+        m.load(path, 'json')
+        r = m.stats()
+        assert_true(r.startswith('There are 20 objects in the gazetteer.\nIndex "_all_text" (20 ids):'))
+        assert_true('\tshards: 2, holding ' in r)
+
     def test_str(self):
         m = Manager()
         path = test_data_path / 'strings.txt'
@@ -87,6 +121,17 @@ GeographicString: Moontown Airport""",
 2: Moontown Airport [GeographicString]""",
             r)
 
+    def test_find_top(self):
+        m = Manager()
+        path = test_data_path / 'strings.txt'
+        m.load(path, 'txt')
+        r = m.find(['top:2', 'Moontown'])
+        assert_equal("""1: Moontown [GeographicString]
+2: Moontown Airport [GeographicString]""",
+            r)
+        r = m.find(['Airport', 'top:1', 'Moontown'])
+        assert_equal('1: Moontown Airport [GeographicString]', r)
+
     def test_contents(self):
         m = Manager()
         path = test_data_path / 'strings.txt'
@@ -102,6 +147,21 @@ GeographicString: Moontown Airport""",
 
 class Test_Manager_Alignment(TestCase):
 
+    def test_alignment_self_bktree(self):
+        m = Manager(index_options={'fuzzy_mode': 'bktree', 'max_distance': 1})
+        m.load('data/examples/moontown_names.json')
+        assert_equal('bktree', m.gaz._indexes['_all_text'].fuzzy_mode)
+        r = m.align_self(['fuzzy'])
+        assert_true(r.endswith('possible matches with other objects. Use "review self matches" to merge matches selectively.'))
+
+    def test_alignment_self_phonetic(self):
+        m = Manager(index_options={'phonetic': True})
+        m.load('data/examples/moontown_names.json')
+        r = m.align_self(['phonetic'])
+        assert_true(r.endswith('possible matches with other objects. Use "review self matches" to merge matches selectively.'))
+        r = m.align_self(['phonetic', 'fuzzy'])
+        assert_true(r.endswith('possible matches with other objects. Use "review self matches" to merge matches selectively.'))
+
     def test_alignment_nominatim(self):
         m = Manager()
         m.load('data/examples/moontown_names.json')
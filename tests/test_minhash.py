@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test minhash module"""
+
+import logging
+from nose.tools import assert_equal, assert_false, assert_true, raises
+from oikoumene.minhash import MinHashLSH, choose_bands, shingles
+from pathlib import Path
+from unittest import TestCase
+
+logger = logging.getLogger(__name__)
+test_data_path = Path('tests/data').resolve()
+
+
+def setup_module():
+    """Change me"""
+    pass
+
+
+def teardown_module():
+    """Change me"""
+    pass
+
+
+class Test_MinHashLSH(TestCase):
+
+    def setUp(self):
+        self.lsh = MinHashLSH(threshold=0.5, num_perm=64)
+        self.strings = {
+            'a': ['Moontown Airport'],
+            'b': ['Moontown Airport', 'Moontown airfield'],
+            'c': ['Berry Road'],
+            'd': ['Berry Road', 'Berry Rd'],
+            'e': ['Chestnut Knob']}
+        for key, strings in self.strings.items():
+            self.lsh.add(key, shingles(strings))
+
+    def test_shingles(self):
+        assert_equal({' ab', 'ab '}, shingles(['AB']))
+        assert_equal({' a '}, shingles(['a']))
+
+    def test_choose_bands(self):
+        bands = choose_bands(64, 0.5)
+        assert_equal(0, 64 % bands)
+        assert_true(abs((1 / bands) ** (bands / 64) - 0.5) < 0.1)
+
+    def test_query(self):
+        assert_equal(['b'], self.lsh.query('a'))
+        assert_equal(['d'], self.lsh.query('c'))
+        assert_equal([], self.lsh.query('e'))
+
+    def test_similarity(self):
+        assert_equal(1.0, self.lsh.similarity('a', 'a'))
+        assert_true(self.lsh.similarity('a', 'e') < 0.2)
+
+    def test_candidate_pairs(self):
+        assert_equal([('a', 'b'), ('c', 'd')], sorted(self.lsh.candidate_pairs()))
+
+    def test_discard(self):
+        self.lsh.discard('b')
+        assert_equal([], self.lsh.query('a'))
+        assert_equal([('c', 'd')], list(self.lsh.candidate_pairs()))
+
+    @raises(ValueError)
+    def test_bad_bands(self):
+        MinHashLSH(num_perm=64, bands=7)
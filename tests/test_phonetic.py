@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test phonetic module"""
+
+import logging
+from nose.tools import assert_equal, assert_false, assert_true, raises
+from oikoumene.phonetic import metaphone, phonetic_codes, soundex
+from pathlib import Path
+from unittest import TestCase
+
+logger = logging.getLogger(__name__)
+test_data_path = Path('tests/data').resolve()
+
+
+def setup_module():
+    """Change me"""
+    pass
+
+
+def teardown_module():
+    """Change me"""
+    pass
+
+
+class Test_Soundex(TestCase):
+
+    def test_soundex(self):
+        assert_equal('R163', soundex('Robert'))
+        assert_equal('R163', soundex('Rupert'))
+        assert_equal('A261', soundex('Ashcraft'))
+        assert_equal('T522', soundex('Tymczak'))
+        assert_equal('M535', soundex('Moontown'))
+        assert_equal('T600', soundex('Ṭūr'))
+
+    def test_not_latin(self):
+        assert_equal('', soundex('فرودگاه'))
+
+
+class Test_Metaphone(TestCase):
+
+    def test_metaphone(self):
+        assert_equal('MNTN', metaphone('Moontown'))
+        assert_equal('MNTN', metaphone('muntaun'))
+        assert_equal('MNTN', metaphone('mwntwn'))
+        assert_equal('FRTK', metaphone('frūdgāh'))
+        assert_equal('NT', metaphone('Knight'))
+        assert_equal('FLP', metaphone('Philip'))
+        assert_equal('0MPSN', metaphone('Thompson'))
+
+    def test_codes(self):
+        assert_equal(['M535', 'MNTN'], phonetic_codes('Moontown'))
+        assert_equal(['M350', 'MNTN'], phonetic_codes('mwntwn'))
+        assert_equal([], phonetic_codes('فرودگاه'))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test postings module"""
+
+import logging
+from nose.tools import assert_equal, assert_false, assert_true, raises
+from oikoumene import postings
+from oikoumene.postings import ArrayPostings, BitmapPostings
+from pathlib import Path
+from random import Random
+from unittest import TestCase
+
+logger = logging.getLogger(__name__)
+test_data_path = Path('tests/data').resolve()
+
+
+def setup_module():
+    """Change me"""
+    pass
+
+
+def teardown_module():
+    """Change me"""
+    pass
+
+
+class Test_ArrayPostings(TestCase):
+
+    def test_init(self):
+        p = ArrayPostings([5, 1, 3, 1])
+        assert_equal([1, 3, 5], list(p))
+        assert_equal(3, len(p))
+        assert_false(ArrayPostings())
+
+    def test_add_remove(self):
+        p = ArrayPostings()
+        for doc in [7, 2, 9, 2]:
+            p.add(doc)
+        assert_equal([2, 7, 9], list(p))
+        assert_true(7 in p)
+        p.remove(7)
+        assert_false(7 in p)
+        p.discard(7)
+        assert_equal([2, 9], list(p))
+
+    @raises(KeyError)
+    def test_remove_missing(self):
+        p = ArrayPostings([1])
+        p.remove(2)
+
+    def test_update(self):
+        p = ArrayPostings([1, 4])
+        p.update([5, 6])
+        p.update([0, 4])
+        p.update(ArrayPostings([2]))
+        assert_equal([0, 1, 2, 4, 5, 6], list(p))
+
+    def test_and_or(self):
+        a = ArrayPostings([1, 3, 5, 7, 9])
+        b = ArrayPostings([2, 3, 4, 9, 11])
+        assert_equal([3, 9], list(a & b))
+        assert_equal([1, 2, 3, 4, 5, 7, 9, 11], list(a | b))
+        assert_equal([1, 3, 5, 7, 9], list(a))
+        assert_equal([], list(a & ArrayPostings()))
+
+    def test_large(self):
+        rand = Random(42)
+        a = set(rand.sample(range(200000), 3000))
+        b = set(rand.sample(range(200000), 5000))
+        pa = ArrayPostings(a)
+        pb = ArrayPostings(b)
+        assert_equal(sorted(a.intersection(b)), list(pa & pb))
+        assert_equal(sorted(a.union(b)), list(pa | pb))
+        pa.update(b)
+        assert_equal(sorted(a.union(b)), list(pa))
+
+    def test_without_numpy(self):
+        np = postings.np
+        postings.np = None
+        try:
+            self.test_and_or()
+            self.test_large()
+        finally:
+            postings.np = np
+
+
+class Test_BitmapPostings(TestCase):
+
+    def setUp(self):
+        rand = Random(42)
+        self.sparse = set(rand.sample(range(200000), 3000))
+        self.dense = set(rand.sample(range(70000), 30000))
+
+    def test_init(self):
+        p = BitmapPostings([70000, 5, 1, 5])
+        assert_equal([1, 5, 70000], list(p))
+        assert_equal(3, len(p))
+        assert_false(BitmapPostings())
+
+    def test_dense(self):
+        p = BitmapPostings(self.dense)
+        assert_true(isinstance(p.containers[0], int))
+        assert_equal(sorted(self.dense), list(p))
+        assert_equal(len(self.dense), len(p))
+
+    def test_add_remove(self):
+        p = BitmapPostings()
+        for doc in sorted(self.dense):
+            p.add(doc)
+        assert_equal(sorted(self.dense), list(p))
+        for doc in sorted(self.dense)[:29000]:
+            p.remove(doc)
+        assert_equal(sorted(self.dense)[29000:], list(p))
+        assert_false(any(isinstance(c, int) for c in p.containers.values()))
+        p.discard(999999)
+
+    def test_update_few(self):
+        p = BitmapPostings(self.dense)
+        p.update([200001, 3])
+        p.update(BitmapPostings([5]))
+        assert_equal(sorted(self.dense.union([3, 5, 200001])), list(p))
+        assert_true(isinstance(p.containers[0], int))
+        assert_equal([200001 & 0xFFFF], list(p.containers[3]))
+
+    @raises(KeyError)
+    def test_remove_missing(self):
+        p = BitmapPostings([1])
+        p.remove(2)
+
+    def test_and_or(self):
+        pairs = [
+            (self.sparse, self.dense),
+            (self.dense, self.dense.union(range(1000))),
+            (self.sparse, set(range(0, 200000, 7)))]
+        for a, b in pairs:
+            pa = BitmapPostings(a)
+            pb = BitmapPostings(b)
+            assert_equal(sorted(a.intersection(b)), list(pa & pb))
+            assert_equal(sorted(a.union(b)), list(pa | pb))
+            assert_equal(sorted(a), list(pa))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test prefixes module"""
+
+import logging
+from nose.tools import assert_equal, assert_false, assert_true, raises
+from oikoumene.prefixes import PrefixIndex
+from pathlib import Path
+from unittest import TestCase
+
+logger = logging.getLogger(__name__)
+test_data_path = Path('tests/data').resolve()
+
+
+def setup_module():
+    """Change me"""
+    pass
+
+
+def teardown_module():
+    """Change me"""
+    pass
+
+
+class Test_PrefixIndex(TestCase):
+
+    def setUp(self):
+        self.pi = PrefixIndex()
+        for key in ['moontown road', 'moon', 'moontown', 'mountain', 'moontown']:
+            self.pi.add(key)
+
+    def test_match(self):
+        assert_equal(['moon', 'moontown', 'moontown road'], self.pi.match('moon'))
+        assert_equal(['mountain'], self.pi.match('mou'))
+        assert_equal([], self.pi.match('zebra'))
+        assert_equal(4, len(self.pi.match('')))
+
+    def test_discard(self):
+        self.pi.discard('moontown')
+        assert_true('moontown' in self.pi)
+        self.pi.discard('moontown')
+        assert_false('moontown' in self.pi)
+        assert_equal(['moon', 'moontown road'], self.pi.match('moon'))
+        self.pi.discard('zebra')
+        assert_equal(3, len(self.pi))
+
+    def test_update(self):
+        self.pi.update(['moor', 'moon', 'able'])
+        assert_equal(['able', 'moon', 'moontown', 'moontown road', 'moor', 'mountain'], self.pi.keys)
+        self.pi.discard('moon')
+        assert_true('moon' in self.pi)
+        self.pi.discard('moon')
+        assert_false('moon' in self.pi)
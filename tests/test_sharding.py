@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test sharding module"""
+
+import json
+import logging
+from nose.tools import assert_equal, assert_false, assert_true, raises
+from oikoumene.indexing import StringIndex
+from oikoumene.sharding import ShardedStringIndex
+from pathlib import Path
+from unittest import TestCase
+
+logger = logging.getLogger(__name__)
+test_data_path = Path('tests/data').resolve()
+
+
+def setup_module():
+    """Change me"""
+    pass
+
+
+def teardown_module():
+    """Change me"""
+    pass
+
+
+class Test_ShardedStringIndex(TestCase):
+
+    def setUp(self):
+        path = Path('data/examples/moontown_names.json').resolve()
+        with open(path, 'r', encoding='utf-8') as f:
+            j = json.load(f)
+        del f
+        self.items = []
+        for i, o in enumerate(j):
+            for k in ['attested', 'romanized']:
+                try:
+                    v = o[k]
+                except KeyError:
+                    continue
+                if isinstance(v, str):
+                    v = [v]
+                self.items.extend([(s, f'n{i}') for s in v])
+        self.si = StringIndex()
+        self.si.add_many(self.items)
+        self.ssi = ShardedStringIndex(shards=3)
+        self.ssi.add_many(self.items)
+
+    def tearDown(self):
+        self.ssi.close()
+
+    def test_shards(self):
+        assert_equal(3, self.ssi.shards)
+        assert_true(all([s['ids'] > 0 for s in self.ssi.stats()['shards']]))
+        for id in ['n0', 'n1', 'n2']:
+            assert_true(id in self.ssi)
+            held = self.ssi._call_all('__contains__', id)
+            assert_equal([self.ssi._shard(id)], [i for i, found in enumerate(held) if found])
+        assert_false('x' in self.ssi)
+
+    def test_get(self):
+        queries = [
+            ('moontown', {}), (['moontown', 'road'], {'indexes': ['word']}),
+            (['moon', 'creek'], {'indexes': ['substring'], 'operator': 'or'}),
+            ('moontwn', {'indexes': ['value'], 'fuzzy': True})]
+        for values, kwargs in queries:
+            assert_equal(sorted(self.si.get(values, **kwargs)), sorted(self.ssi.get(values, **kwargs)))
+        batched = self.ssi.get_batch(['moontown', 'moontown road'])
+        assert_equal(
+            [sorted(r) for r in self.si.get_batch(['moontown', 'moontown road'])],
+            [sorted(r) for r in batched])
+
+    def test_get_fuzzy(self):
+        for fuzzy_mode in ['scan', 'bktree', 'symspell', 'tfidf']:
+            si = StringIndex(fuzzy_mode=fuzzy_mode)
+            si.add_many(self.items)
+            ssi = ShardedStringIndex(shards=3, fuzzy_mode=fuzzy_mode)
+            ssi.add_many(self.items)
+            for value in ['mountain', 'airprt', 'moontwn', ['moontwn', 'rd']]:
+                for kwargs in [{}, {'operator': 'or'}, {'indexes': ['word'], 'operator': 'or'}, {'fuzzy': ['word']}]:
+                    kwargs = {'fuzzy': True, **kwargs}
+                    assert_equal(
+                        sorted(si.get(value, **kwargs)), sorted(ssi.get(value, **kwargs)),
+                        (fuzzy_mode, value, kwargs))
+            values = ['mountain', 'airprt', 'moontwn']
+            assert_equal(
+                [sorted(r) for r in si.get_batch(values, indexes=['value', 'word'], fuzzy=True)],
+                [sorted(r) for r in ssi.get_batch(values, indexes=['value', 'word'], fuzzy=True)])
+            ssi.close()
+
+    def test_get_fuzzy_ties(self):
+        # scan ties go to the key added first, as in one index
+        values = [
+            'big cats', 'big cat', 'big dog', 'small cats', 'strange cats', 'strange brew',
+            'strange orange cats of doom', 'strange pink dogs of doom', 'blades of glory',
+            'big brats', 'small slats', 'big bats', 'big bandanas', 'biggish yellow road grater']
+        queries = [('braids', 'substring'), ('zro', 'substring'), ('of cats', 'phrase'), ('bat', 'word')]
+        for options in [{}, {'substring_mode': 'automaton', 'phrase_mode': 'positional'}]:
+            si = StringIndex(**options)
+            ssi = ShardedStringIndex(shards=3, **options)
+            for index in [si, ssi]:
+                index.add_many([(v, f'a{i}') for i, v in enumerate(values[:8])])
+                for i, v in enumerate(values[8:]):
+                    index.add(v, [f'b{i}', f'a{i}'])
+            for value, idx in queries:
+                assert_equal(sorted(si.get(value, indexes=[idx], fuzzy=True)), sorted(ssi.get(value, indexes=[idx], fuzzy=True)))
+            for index in [si, ssi]:
+                index.drop(['a0', 'a3', 'b1'])
+                index.add('big cats', 'c')
+            for value, idx in queries:
+                assert_equal(sorted(si.get(value, indexes=[idx], fuzzy=True)), sorted(ssi.get(value, indexes=[idx], fuzzy=True)))
+            ssi.close()
+
+    def test_get_fuzzy_phonetic(self):
+        si = StringIndex(phonetic=True)
+        si.add_many(self.items)
+        ssi = ShardedStringIndex(shards=3, phonetic=True)
+        ssi.add_many(self.items)
+        for value in ['muntown', 'muntown rode', 'zebra']:
+            assert_equal(
+                sorted(si.get(value, indexes=['phonetic'], fuzzy=True)),
+                sorted(ssi.get(value, indexes=['phonetic'], fuzzy=True)))
+            assert_equal(
+                sorted(si.get([value, 'moontown'], indexes=['phonetic'], fuzzy=True)),
+                sorted(ssi.get([value, 'moontown'], indexes=['phonetic'], fuzzy=True)))
+        ssi.close()
+
+    def test_add_drop(self):
+        self.ssi.add('Moontown Hollow', ['n0', 'x'])
+        assert_equal(['n0', 'x'], sorted(self.ssi.get('moontown hollow', indexes=['value'])))
+        self.ssi.drop(['n0', 'x'])
+        assert_false('x' in self.ssi)
+        assert_equal([], self.ssi.get('moontown hollow', indexes=['value']))
+
+    def test_search(self):
+        for query in ['moontown', 'moontown road', 'sublett', 'zebra']:
+            expected = self.si.search(query, k=5)
+            found = self.ssi.search(query, k=5)
+            assert_equal([id for id, score in expected], [id for id, score in found])
+            for (id, score), (shard_id, shard_score) in zip(expected, found):
+                self.assertAlmostEqual(score, shard_score)
+
+    def test_complete(self):
+        for prefix in ['moo', 's', '']:
+            assert_equal(self.si.complete(prefix, k=4), self.ssi.complete(prefix, k=4))
+
+    def test_stats(self):
+        stats = self.ssi.stats()
+        assert_equal(len(self.si._ids), stats['ids'])
+        assert_equal(3, len(stats['shards']))
+        assert_equal(self.si.stats()['indexes']['values']['postings'], stats['indexes']['values']['postings'])
+        assert_equal(3, self.ssi.options()['shards'])
+
+    @raises(ValueError)
+    def test_fuzzy_prefix(self):
+        self.ssi.get('moon', indexes=['prefix'], fuzzy=True)
+
+    @raises(KeyError)
+    def test_drop_bad(self):
+        self.ssi.drop('zebra')
+
+    @raises(ValueError)
+    def test_bad(self):
+        ShardedStringIndex(shards=0)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test snapshot module"""
+
+import json
+import logging
+from nose.tools import assert_equal, assert_false, assert_true, raises
+from oikoumene.gazetteer import Gazetteer
+from oikoumene.indexing import StringIndex
+from oikoumene.snapshot import load_snapshot, MappedStringIndex, save_snapshot
+from oikoumene.stringlike import GeographicName
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+logger = logging.getLogger(__name__)
+test_data_path = Path('tests/data').resolve()
+
+
+def setup_module():
+    """Change me"""
+    pass
+
+
+def teardown_module():
+    """Change me"""
+    pass
+
+
+class Test_Snapshot(TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'index.idx'
+        si = StringIndex()
+        si.add('Moontown', 'a')
+        si.add('Moontown Road', 'b')
+        si.add('Ṭūr ʿAbdīn', 'c')
+        si.add('Brownsboro', 'd')
+        si.drop('d')
+        save_snapshot(si, self.path)
+        self.si = load_snapshot(self.path)
+
+    def tearDown(self):
+        self.si.close()
+        self.tmp.cleanup()
+
+    def test_load(self):
+        assert_true(isinstance(self.si, MappedStringIndex))
+        assert_equal(['a', 'b', 'c'], sorted(self.si.snapshot_ids()))
+        assert_equal(['a'], self.si.get('moontown', indexes=['value']))
+        assert_equal(['a', 'b'], sorted(self.si.get('moontown', indexes=['word'])))
+        assert_equal(['b'], self.si.get('moontown road', indexes=['phrase']))
+        assert_equal(['c'], self.si.get('ṭūr', indexes=['word']))
+        assert_equal(['a', 'b'], sorted(self.si.get('toW', indexes=['substring'])))
+        assert_equal([], self.si.get('brownsboro', indexes=['value']))
+        assert_equal([], self.si.get('zebra', indexes=['value']))
+
+    def test_estimate(self):
+        self.si._base_docs_at = None
+        assert_equal(2, self.si._estimate('word', 'moontown'))
+        assert_equal(0, self.si._estimate('word', 'brownsboro'))
+        del self.si._base_docs_at
+        self.si.add('Moontown', 'e')
+        assert_equal(3, self.si._estimate('word', 'moontown'))
+
+    def test_get(self):
+        assert_equal(['b'], self.si.get(['moontown', 'road'], indexes=['word']))
+        r = self.si.get(['road', 'ʿabdīn'], indexes=['word'], operator='or')
+        assert_equal(['b', 'c'], sorted(r))
+
+    def test_prefix(self):
+        assert_equal(['a', 'b'], sorted(self.si.get('moon', indexes=['prefix'])))
+        assert_equal(['moontown', 'moontown road', 'road'], sorted(self.si.complete('', k=3)))
+        assert_equal('moontown', self.si.complete('moo')[0])
+
+    def test_fuzzy(self):
+        r = self.si.get('mootown', indexes=['value'], fuzzy=True)
+        assert_equal(['a', 'b'], sorted(r))
+
+    def test_search(self):
+        si = StringIndex()
+        si.add('Moontown', 'a')
+        si.add('Moontown Road', 'b')
+        si.add('Ṭūr ʿAbdīn', 'c')
+        assert_equal(si.search('moontown road'), self.si.search('moontown road'))
+        self.si.drop('c')
+        self.si.add('Jericho', 'c')
+        si.drop('c')
+        si.add('Jericho', 'c')
+        assert_equal(si.search('moontown road'), self.si.search('moontown road'))
+
+    def test_search_duplicates(self):
+        # values added more than once to a document count once, in memory as in a snapshot
+        si = StringIndex()
+        for i in range(3):
+            si.add('Creek Road', 'a')
+        si.add_many([('Mill Creek Road', 'b'), ('Mill Creek Road', 'b'), ('Mill', 'b')])
+        si.add('Lake', 'c')
+        before = si.search('creek road')
+        save_snapshot(si, self.path)
+        mapped = load_snapshot(self.path)
+        try:
+            assert_equal(before, mapped.search('creek road'))
+            si.add('Creek Road', 'b')
+            mapped.add('Creek Road', 'b')
+            assert_equal(si.search('creek road'), mapped.search('creek road'))
+        finally:
+            mapped.close()
+
+    def test_overlay(self):
+        self.si.add('Moontown Estates', 'e')
+        assert_equal(['a', 'b', 'e'], sorted(self.si.get('moontown', indexes=['word'])))
+        self.si.drop('a')
+        assert_equal(['b', 'e'], sorted(self.si.get('moontown', indexes=['word'])))
+        assert_equal([], self.si.get('moontown', indexes=['value']))
+        self.si.drop('e')
+        assert_equal(['b'], self.si.get('moontown', indexes=['word']))
+
+    def test_stats_ids(self):
+        assert_equal(3, self.si.stats()['ids'])
+        self.si.add('Jericho', 'b')
+        self.si.add('Jericho', 'e')
+        self.si.drop(['a', 'b', 'e'])
+        assert_equal(1, self.si.stats()['ids'])
+        # snapshot documents keep their numbers, which the snapshot still lists
+        self.si.add('Moontown', 'f')
+        assert_equal(['f'], self.si.get('moontown', indexes=['value']))
+        assert_equal([], self.si.get('road', indexes=['word']))
+        assert_equal(2, self.si.stats()['ids'])
+
+    def test_migrate(self):
+        self.si.add('Jericho', 'b')
+        assert_false('b' in self.si.snapshot_ids())
+        assert_equal(['b'], self.si.get(['road', 'jericho'], indexes=['word']))
+        assert_equal(['b'], self.si.get('moontown road', indexes=['value']))
+        self.si.drop('b')
+        assert_equal(['a'], self.si.get('moontown', indexes=['word']))
+
+    def test_resave(self):
+        self.si.add('Jericho', 'b')
+        self.si.drop('c')
+        save_snapshot(self.si, self.path)
+        si = load_snapshot(self.path, postings='bitmap')
+        assert_equal(['a', 'b'], sorted(si.snapshot_ids()))
+        assert_equal(['b'], si.get(['road', 'jericho'], indexes=['word']))
+        assert_equal([], si.get('ṭūr', indexes=['word']))
+        si.close()
+        assert_equal(['a', 'b'], sorted(self.si.get('moontown', indexes=['word'])))
+
+    def test_folding(self):
+        si = StringIndex(folding=True)
+        si.add('Ṭūr ʿAbdīn', 'c')
+        save_snapshot(si, self.path)
+        mapped = load_snapshot(self.path, folding=True)
+        assert_equal(['c'], mapped.get('tur abdin', indexes=['folded_value']))
+        assert_equal(['c'], mapped.get('abdin', operator='or'))
+        mapped.close()
+
+    def test_lazy(self):
+        si = StringIndex(eager=['value'])
+        si.add('Moontown Road', 'a')
+        si.add('Jericho Road', 'b')
+        save_snapshot(si, self.path)
+        assert_equal({'values'}, si._built)
+        assert_equal({}, si.words)
+        mapped = load_snapshot(self.path)
+        assert_equal(['a', 'b'], sorted(mapped.get('road', indexes=['word'])))
+        assert_equal(['a'], mapped.get('moon', indexes=['substring']))
+        mapped.close()
+
+    @raises(NotImplementedError)
+    def test_automaton(self):
+        save_snapshot(StringIndex(substring_mode='automaton'), self.path)
+
+    @raises(ValueError)
+    def test_not_snapshot(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not an index')
+        load_snapshot(self.path)
+
+
+class Test_Snapshot_Gazetteer(TestCase):
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'gaz.idx'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_index_path(self):
+        names = [GeographicName(attested='Moontown'), GeographicName(attested='Jericho')]
+        g = Gazetteer(names)
+        g.save_index(self.path)
+        g2 = Gazetteer(list(g.contents.values()), index_path=self.path)
+        assert_true(isinstance(g2._indexes['_all_text'], MappedStringIndex))
+        assert_equal(['Moontown'], [o.attested for o in g2.get({'text': ['moontown']}).values()])
+        g2._indexes['_all_text'].close()
+
+    def test_index_path_stale(self):
+        g = Gazetteer([GeographicName(attested='Moontown')])
+        g.save_index(self.path)
+        g2 = Gazetteer([GeographicName(attested='Jericho')], index_path=self.path)
+        assert_false(isinstance(g2._indexes['_all_text'], MappedStringIndex))
+        assert_equal(1, len(g2.get({'text': ['jericho']})))
+        assert_equal(0, len(g2.get({'text': ['moontown']})))
+
+
+    def test_index_path_changed_text(self):
+        g = Gazetteer([GeographicName(attested='Moontown')])
+        g.save_index(self.path)
+        obj = GeographicName(attested='Jericho')
+        obj.id = 'moontown'
+        g2 = Gazetteer([obj], index_path=self.path)
+        assert_false(isinstance(g2._indexes['_all_text'], MappedStringIndex))
+        assert_equal(1, len(g2.get({'text': ['jericho']})))
+
+    def test_index_path_json(self):
+        g = Gazetteer([GeographicName(attested='Moontown'), GeographicName(attested='Jericho')])
+        g.save_index(self.path)
+        g2 = Gazetteer(json.loads(g.json()), index_path=self.path)
+        assert_true(isinstance(g2._indexes['_all_text'], MappedStringIndex))
+        assert_equal(g.json(), g2.json())
+        g2._indexes['_all_text'].close()